@@ -1,10 +1,20 @@
 """
 This script is the dictionary of ArUco markers.
 
+Restricted dictionaries:
+    get_dictionary(name, ids) builds a dictionary that only contains the given marker IDs of a predefined dictionary, from
+    its bytesList. Identification then only compares the candidates against the deployed codes, which is faster and rejects
+    the other markers of a cluttered scene. The markers keep their original IDs - detect_markers() in 'aruco_detector.py'
+    maps the detected IDs back. The dictionaries are cached, and processes forked after building them (e.g. the detection
+    pool) inherit the cache.
+
 Created by: Jalen
 """
 
+import functools
+
 import cv2
+import numpy as np
 
 
 # Define names of each possible ArUco tag supported by OpenCV
@@ -25,4 +35,49 @@ ARUCO_DICT = {
     "DICT_7X7_100": cv2.aruco.DICT_7X7_100,
     "DICT_7X7_250": cv2.aruco.DICT_7X7_250,
     "DICT_7X7_1000": cv2.aruco.DICT_7X7_1000,
-}
\ No newline at end of file
+}
+
+
+class RestrictedDictionary:
+    """
+    Predefined dictionary limited to some of its marker IDs.
+
+    Arguments:
+        name    : Name of the predefined dictionary in ARUCO_DICT
+        ids     : Allowed marker IDs, numbered as in the predefined dictionary
+    """
+
+    def __init__(self, name, ids):
+        base = cv2.aruco.Dictionary_get(ARUCO_DICT[name])
+        self.name = name
+        self.ids = np.array(sorted(set(int(i) for i in ids)), dtype=np.int32)  # Restricted index -> original ID
+        if len(self.ids) == 0 or self.ids[0] < 0 or self.ids[-1] >= len(base.bytesList):
+            raise ValueError(f"Marker IDs must be between 0 and {len(base.bytesList) - 1} for {name}, got {list(ids)}")
+
+        # Same marker size and error correction as the predefined dictionary, but only the allowed codes
+        self.dictionary = cv2.aruco.Dictionary_get(ARUCO_DICT[name])
+        self.dictionary.bytesList = base.bytesList[self.ids].copy()
+
+    def to_original(self, ids):
+        """Map the IDs returned by cv2.aruco.detectMarkers with this dictionary back to the original IDs."""
+        if ids is None:
+            return None
+        return self.ids[ids.reshape(-1)].reshape(ids.shape)
+
+    def __repr__(self):
+        return f"RestrictedDictionary({self.name}, ids={self.ids.tolist()})"
+
+
+@functools.lru_cache(maxsize=None)
+def _get_dictionary(name, ids):
+    if ids is None:
+        return cv2.aruco.Dictionary_get(ARUCO_DICT[name])
+    return RestrictedDictionary(name, ids)
+
+
+def get_dictionary(name, ids=None):
+    """
+    Predefined dictionary by name, or a RestrictedDictionary of it if ids (the deployed marker IDs) is given. Repeated calls
+    return the cached dictionary.
+    """
+    return _get_dictionary(name, None if ids is None else tuple(sorted(set(int(i) for i in ids))))
@@ -0,0 +1,460 @@
+"""
+This script contains the ArUco detection helpers shared by 'pose_estimation.py' and 'aruco_detector_video.py'.
+
+ROI tracking mode:
+    Once a marker has been found, the following frames only run cv2.aruco.detectMarkers on an expanded window around the
+    marker's previous corners, and the results are shifted back to full-frame coordinates. A full-frame search is carried out
+    when a tracked marker is lost, when nothing is being tracked, and every 'full_search_period' frames so that markers
+    entering the scene are picked up.
+
+Pyramid detection:
+    Candidate search and ID decoding run on a downscaled copy of the grayscale frame. The corners are then mapped back to
+    full resolution and refined with cv2.cornerSubPix on the full-resolution frame, so the corner accuracy is preserved at a
+    fraction of the detection cost. The scale is either given directly, or chosen from the expected marker size in pixels so
+    that the marker stays above 'min_marker_pixels' in the downscaled image.
+
+Both modes can be combined, in which case the ROI tracker runs the pyramid detection on its search windows.
+
+Optical-flow tracking:
+    Between full detections, the four corners of every detected marker are carried forward with pyramidal Lucas-Kanade
+    optical flow on the grayscale frames, which is far cheaper than the candidate search. Each track is validated with a
+    forward-backward check (the corners are tracked back to the previous frame and must land within 'max_fb_error' pixels)
+    and a re-read of the marker code from the tracked corners. As soon as any track fails, the frame falls back to the full
+    detection (plain, ROI tracking and/or pyramid), which is also forced every 'redetect_period' frames.
+
+Detector profiles:
+    --profile loads a named set of DetectorParameters from 'detector_profiles/<name>.json', as saved by 'param_tuner.py'
+    (e.g. one profile per lighting condition). Without a profile the OpenCV defaults are used.
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import json
+import time
+from pathlib import Path
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from arucoDict import RestrictedDictionary
+
+
+# Directory of the named detector profiles written by 'param_tuner.py'
+PROFILE_DIR = Path(__file__).parent.absolute().joinpath("detector_profiles")
+
+
+# DETECTOR PARAMETERS --------------------------------------------------------------------------------------------------
+def detector_params_to_dict(arucoParams):
+    """All settings of a cv2.aruco.DetectorParameters object, as a plain (picklable, JSON-serializable) dictionary."""
+    params = {}
+    for name in dir(arucoParams):
+        if name.startswith("_"):
+            continue
+        value = getattr(arucoParams, name)
+        if isinstance(value, (bool, int, float)):
+            params[name] = value
+    return params
+
+
+def detector_params_from_dict(params):
+    """Create cv2.aruco.DetectorParameters with the settings of detector_params_to_dict (missing keys keep their default)."""
+    arucoParams = cv2.aruco.DetectorParameters_create()
+    for name, value in params.items():
+        setattr(arucoParams, name, value)
+    return arucoParams
+
+
+def profile_path(profile):
+    """Path of a detector profile, given either by name (in PROFILE_DIR) or as a path to a .json file."""
+    path = Path(profile)
+    if path.suffix == ".json" or path.exists():
+        return path
+    return PROFILE_DIR.joinpath(f"{profile}.json")
+
+
+def load_detector_params(profile=None):
+    """cv2.aruco.DetectorParameters of a saved detector profile, or the OpenCV defaults if profile is None."""
+    if profile is None:
+        return cv2.aruco.DetectorParameters_create()
+    path = profile_path(profile)
+    if not path.exists():
+        available = sorted(p.stem for p in PROFILE_DIR.glob("*.json"))
+        raise FileNotFoundError(f"Detector profile {profile} not found (available profiles: {available})")
+    with open(path) as f:
+        return detector_params_from_dict(json.load(f)["params"])
+
+
+# DETECTION ------------------------------------------------------------------------------------------------------------
+def detect_markers(gray_frame, arucoDict, arucoParams):
+    """
+    Full-frame detection, returning (corners, ids, rejected) exactly as cv2.aruco.detectMarkers does. arucoDict may also be a
+    RestrictedDictionary (see 'arucoDict.py'), in which case the original marker IDs are returned.
+    """
+    if isinstance(arucoDict, RestrictedDictionary):
+        corners, ids, rejected = cv2.aruco.detectMarkers(image=gray_frame, dictionary=arucoDict.dictionary,
+                                                         parameters=arucoParams)
+        return corners, arucoDict.to_original(ids), rejected
+    return cv2.aruco.detectMarkers(image=gray_frame, dictionary=arucoDict, parameters=arucoParams)
+
+
+def _shift(points, x0, y0):
+    """Shift a tuple of corner arrays from ROI to full-frame coordinates."""
+    offset = np.array([x0, y0], dtype=np.float32)
+    return tuple(p + offset for p in points)
+
+
+def choose_scale(expected_marker_pixels, min_marker_pixels=40, min_scale=0.125):
+    """Smallest scale at which a marker of the expected side length [px] still spans min_marker_pixels."""
+    if not expected_marker_pixels or expected_marker_pixels <= min_marker_pixels:
+        return 1.0
+    return max(min_marker_pixels / float(expected_marker_pixels), min_scale)
+
+
+# PYRAMID DETECTION ----------------------------------------------------------------------------------------------------
+class PyramidDetector:
+    """
+    Detect markers on a downscaled frame and refine their corners on the full-resolution grayscale frame.
+
+    Arguments:
+        arucoDict, arucoParams  : Dictionary and detector parameters passed on to cv2.aruco.detectMarkers
+        scale                   : Downscale factor (0 < scale <= 1). None chooses it from expected_marker_pixels.
+        expected_marker_pixels  : Expected marker side length in the full-resolution frame [px]
+        min_marker_pixels       : Minimum marker side length to keep in the downscaled frame [px]
+        adaptive                : Update the expected marker size from the smallest marker detected in each frame, and go
+                                  back to the initial scale whenever no marker is found
+    """
+
+    def __init__(self, arucoDict, arucoParams, scale=None, expected_marker_pixels=None, min_marker_pixels=40,
+                 adaptive=False):
+        if scale is not None and not 0 < scale <= 1:
+            raise ValueError("Pyramid scale must be within (0, 1]")
+        self.arucoDict = arucoDict
+        self.arucoParams = arucoParams
+        self.min_marker_pixels = min_marker_pixels
+        self.adaptive = adaptive
+        self.scale = scale if scale is not None else choose_scale(expected_marker_pixels, min_marker_pixels)
+        self.initial_scale = self.scale
+        self.criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
+    def _refine(self, gray_frame, corners):
+        """Map corners from the downscaled to the full-resolution frame and refine them there."""
+        points = np.concatenate(corners).reshape((-1, 1, 2)).astype(np.float32)
+        points = (points + 0.5) / self.scale - 0.5
+
+        # The search window has to cover the quantisation error of the downscaled frame
+        half_window = int(np.ceil(1.0 / self.scale)) + 2
+        cv2.cornerSubPix(gray_frame, points, (half_window, half_window), (-1, -1), self.criteria)
+        return tuple(points.reshape((-1, 1, 4, 2)))
+
+    def detect(self, gray_frame):
+        """Detect markers in a grayscale frame, returning (corners, ids, rejected) in full-resolution coordinates."""
+        if self.scale >= 1.0 and not self.adaptive:
+            return detect_markers(gray_frame, self.arucoDict, self.arucoParams)
+
+        if self.scale < 1.0:
+            small = cv2.resize(gray_frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = gray_frame
+        corners, ids, rejected = detect_markers(small, self.arucoDict, self.arucoParams)
+        rejected = tuple((r + 0.5) / self.scale - 0.5 for r in rejected)
+        if ids is None:
+            if self.adaptive:
+                self.scale = self.initial_scale
+            return corners, ids, rejected
+
+        corners = self._refine(gray_frame, corners)
+        if self.adaptive:
+            sides = [np.linalg.norm(c[0] - np.roll(c[0], 1, axis=0), axis=1).min() for c in corners]
+            self.scale = choose_scale(min(sides), self.min_marker_pixels)
+        return corners, ids, rejected
+
+
+# ROI TRACKING ---------------------------------------------------------------------------------------------------------
+class ROITracker:
+    """
+    Detect markers near their last known corners instead of searching the whole frame.
+
+    Arguments:
+        arucoDict, arucoParams  : Dictionary and detector parameters passed on to cv2.aruco.detectMarkers
+        target_ids              : IDs to track (e.g. [25] for the docking marker). None tracks every detected marker.
+        margin                  : Expansion of the search window, as a fraction of the marker's bounding box size
+        min_margin              : Minimum expansion of the search window [px]
+        full_search_period      : Force a full-frame search every N frames (0 disables the periodic search)
+        detector                : Optional detection function gray_frame -> (corners, ids, rejected), e.g. the detect
+                                  method of a PyramidDetector. Defaults to a plain full-resolution detection.
+    """
+
+    def __init__(self, arucoDict, arucoParams, target_ids=None, margin=0.5, min_margin=20, full_search_period=30,
+                 detector=None):
+        self.arucoDict = arucoDict
+        self.arucoParams = arucoParams
+        self.detector = detector if detector is not None else self._detect_full_resolution
+        self.target_ids = None if target_ids is None else set(int(i) for i in target_ids)
+        self.margin = margin
+        self.min_margin = min_margin
+        self.full_search_period = full_search_period
+
+        self.full_searches = 0      # Number of full-frame searches carried out
+        self.roi_searches = 0       # Number of frames served by ROI searches only
+        self._tracks = {}           # Marker ID -> last known corners (4, 2)
+        self._frames_since_full = 0
+
+    def _detect_full_resolution(self, gray_frame):
+        return detect_markers(gray_frame, self.arucoDict, self.arucoParams)
+
+    def reset(self):
+        """Forget all tracked markers, so that the next frame is searched in full."""
+        self._tracks.clear()
+
+    def _update_tracks(self, corners, ids):
+        self._tracks = {}
+        if ids is None:
+            return
+        for markerCorners, markerID in zip(corners, ids.flatten()):
+            if self.target_ids is None or int(markerID) in self.target_ids:
+                self._tracks[int(markerID)] = markerCorners.reshape((4, 2))
+
+    def _search_windows(self, shape):
+        """Expanded bounding boxes (x0, y0, x1, y1) around the tracked markers, merged where they overlap."""
+        height, width = shape[:2]
+        windows = []
+        for markerCorners in self._tracks.values():
+            (xMin, yMin), (xMax, yMax) = markerCorners.min(axis=0), markerCorners.max(axis=0)
+            pad = max(self.min_margin, self.margin * max(xMax - xMin, yMax - yMin))
+            windows.append([max(int(xMin - pad), 0), max(int(yMin - pad), 0),
+                            min(int(np.ceil(xMax + pad)), width), min(int(np.ceil(yMax + pad)), height)])
+
+        # Merge overlapping windows so that no region is searched twice
+        merged = []
+        for window in sorted(windows):
+            if merged and window[0] < merged[-1][2] and window[1] < merged[-1][3] and window[3] > merged[-1][1]:
+                last = merged[-1]
+                merged[-1] = [min(last[0], window[0]), min(last[1], window[1]),
+                              max(last[2], window[2]), max(last[3], window[3])]
+            else:
+                merged.append(window)
+        return merged
+
+    def _full_search(self, gray_frame):
+        corners, ids, rejected = self.detector(gray_frame)
+        self.full_searches += 1
+        self._frames_since_full = 0
+        self._update_tracks(corners, ids)
+        return corners, ids, rejected
+
+    def detect(self, gray_frame):
+        """Detect markers in the frame, returning (corners, ids, rejected) in full-frame coordinates."""
+        self._frames_since_full += 1
+        periodic = self.full_search_period and self._frames_since_full >= self.full_search_period
+        if not self._tracks or periodic:
+            return self._full_search(gray_frame)
+
+        found_corners, found_ids, found_rejected = [], [], []
+        for x0, y0, x1, y1 in self._search_windows(gray_frame.shape):
+            corners, ids, rejected = self.detector(gray_frame[y0:y1, x0:x1])
+            found_rejected.extend(_shift(rejected, x0, y0))
+            if ids is None:
+                continue
+            for markerCorners, markerID in zip(_shift(corners, x0, y0), ids.flatten()):
+                if markerID not in found_ids:
+                    found_corners.append(markerCorners)
+                    found_ids.append(markerID)
+
+        # Fall back to a full-frame search as soon as any tracked marker is lost
+        if not set(self._tracks).issubset(int(i) for i in found_ids):
+            return self._full_search(gray_frame)
+
+        self.roi_searches += 1
+        ids = np.array(found_ids, dtype=np.int32).reshape((-1, 1))
+        self._update_tracks(found_corners, ids)
+        return tuple(found_corners), ids, tuple(found_rejected)
+
+    def summary(self):
+        return f"ROI tracking: {self.roi_searches} frames served by ROI searches, {self.full_searches} full-frame searches"
+
+
+# OPTICAL-FLOW TRACKING ------------------------------------------------------------------------------------------------
+class FlowTracker:
+    """
+    Carry the corners of the detected markers forward with pyramidal Lucas-Kanade optical flow between full detections.
+
+    Arguments:
+        arucoDict, arucoParams  : Dictionary (or RestrictedDictionary) and detector parameters of the full detections. The
+                                  dictionary is also used to re-read the codes of the tracked markers.
+        detector                : Detection function gray_frame -> (corners, ids, rejected) of the full detections, e.g.
+                                  the detect method of a ROITracker or PyramidDetector. Defaults to a plain detection.
+        redetect_period         : Force a full detection every N frames, so that markers entering the scene are picked up
+        max_fb_error            : Maximum forward-backward error of a tracked corner [px]
+        max_bit_errors          : Maximum number of wrong bits (border included) when re-reading a tracked marker
+        win_size, max_level     : Search window [px] and number of pyramid levels of cv2.calcOpticalFlowPyrLK
+        cell_pixels             : Side length of a cell of the warped marker when re-reading its bits [px]
+    """
+
+    def __init__(self, arucoDict, arucoParams, detector=None, redetect_period=15, max_fb_error=1.0, max_bit_errors=2,
+                 win_size=21, max_level=3, cell_pixels=6):
+        self.arucoDict = arucoDict
+        self.arucoParams = arucoParams
+        self.detector = detector if detector is not None else self._detect_full
+        self.redetect_period = redetect_period
+        self.max_fb_error = max_fb_error
+        self.max_bit_errors = max_bit_errors
+        self.lk_params = dict(winSize=(win_size, win_size), maxLevel=max_level,
+                              criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 30, 0.01))
+
+        # Canonical square the tracked markers are warped onto to re-read their bits - (marker size + border) cells
+        base = arucoDict.dictionary if isinstance(arucoDict, RestrictedDictionary) else arucoDict
+        self.cells = base.markerSize + 2
+        self.cell_pixels = cell_pixels
+        side = self.cells * cell_pixels
+        self._square = np.array([[0, 0], [side, 0], [side, side], [0, side]], dtype=np.float32)
+        self._codes = {}            # Marker ID -> expected bits (cells x cells, border included)
+
+        self.tracked_frames = 0     # Frames served by optical flow only
+        self.detected_frames = 0    # Frames that ran the full detection
+        self.fallbacks = 0          # Full detections caused by a track failing its validation
+        self.tracked_ns = 0         # Time spent on the frames of each path
+        self.detected_ns = 0
+        self._tracks = {}           # Marker ID -> corners (4, 2) in the previous frame
+        self._prev_gray = None
+        self._frames_since_detection = 0
+
+    def _detect_full(self, gray_frame):
+        return detect_markers(gray_frame, self.arucoDict, self.arucoParams)
+
+    def _expected_bits(self, marker_id):
+        """Bits of a marker as drawn by cv2.aruco.drawMarker at one pixel per cell, border included."""
+        if marker_id not in self._codes:
+            if isinstance(self.arucoDict, RestrictedDictionary):
+                index = int(np.searchsorted(self.arucoDict.ids, marker_id))
+                image = cv2.aruco.drawMarker(self.arucoDict.dictionary, index, self.cells, borderBits=1)
+            else:
+                image = cv2.aruco.drawMarker(self.arucoDict, marker_id, self.cells, borderBits=1)
+            self._codes[marker_id] = image > 127
+        return self._codes[marker_id]
+
+    def _read_bits(self, gray_frame, markerCorners):
+        """Warp the marker onto the canonical square and threshold the centre of every cell."""
+        transform = cv2.getPerspectiveTransform(markerCorners.astype(np.float32), self._square)
+        side = self.cells * self.cell_pixels
+        warped = cv2.warpPerspective(gray_frame, transform, (side, side), flags=cv2.INTER_LINEAR)
+        _, binary = cv2.threshold(warped, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        margin = self.cell_pixels // 4
+        cells = binary.reshape((self.cells, self.cell_pixels, self.cells, self.cell_pixels))
+        cells = cells[:, margin:self.cell_pixels - margin, :, margin:self.cell_pixels - margin]
+        return cells.mean(axis=(1, 3)) > 127
+
+    def _track(self, gray_frame):
+        """Track all markers into the frame. Returns {marker ID: corners (4, 2)}, or None if any track fails validation."""
+        ids = list(self._tracks)
+        prev_points = np.concatenate([self._tracks[i] for i in ids]).reshape((-1, 1, 2)).astype(np.float32)
+        points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray_frame, prev_points, None, **self.lk_params)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray_frame, self._prev_gray, points, None, **self.lk_params)
+
+        # Forward-backward check - each corner must be tracked both ways and return to where it started
+        fb_error = np.linalg.norm(back - prev_points, axis=2).reshape(-1)
+        valid = (status.reshape(-1) == 1) & (back_status.reshape(-1) == 1) & (fb_error < self.max_fb_error)
+        if not valid.all():
+            return None
+
+        height, width = gray_frame.shape[:2]
+        tracks = {}
+        for markerID, markerCorners in zip(ids, points.reshape((-1, 4, 2))):
+            inside = np.all((markerCorners >= 0) & (markerCorners < (width, height)))
+            if not inside or not cv2.isContourConvex(markerCorners.astype(np.float32)):
+                return None
+            # The marker code must still read as the tracked ID, in the same orientation
+            errors = np.count_nonzero(self._read_bits(gray_frame, markerCorners) != self._expected_bits(markerID))
+            if errors > self.max_bit_errors:
+                return None
+            tracks[markerID] = markerCorners
+        return tracks
+
+    def detect(self, gray_frame):
+        """Detect markers in the frame, returning (corners, ids, rejected) like cv2.aruco.detectMarkers."""
+        start = time.perf_counter_ns()
+        self._frames_since_detection += 1
+        tracks = None
+        if self._tracks and self._prev_gray is not None and self._frames_since_detection < self.redetect_period:
+            tracks = self._track(gray_frame)
+            if tracks is None:
+                self.fallbacks += 1
+        self._prev_gray = gray_frame
+
+        if tracks is not None:
+            self._tracks = tracks
+            self.tracked_frames += 1
+            self.tracked_ns += time.perf_counter_ns() - start
+            ids = np.array(list(tracks), dtype=np.int32).reshape((-1, 1))
+            return tuple(c.reshape((1, 4, 2)) for c in tracks.values()), ids, ()
+
+        # Full detection - no tracks, periodic re-detection or a failed track
+        corners, ids, rejected = self.detector(gray_frame)
+        self._tracks = {} if ids is None else {int(i): c.reshape((4, 2)) for c, i in zip(corners, ids.flatten())}
+        self._frames_since_detection = 0
+        self.detected_frames += 1
+        self.detected_ns += time.perf_counter_ns() - start
+        return corners, ids, rejected
+
+    def stats(self):
+        """Tracked vs. detected frames and the mean cost of each path [ms/frame]."""
+        frames = self.tracked_frames + self.detected_frames
+        return {
+            "tracked_frames": self.tracked_frames,
+            "detected_frames": self.detected_frames,
+            "tracked_ratio": self.tracked_frames / frames if frames else 0.0,
+            "fallbacks": self.fallbacks,
+            "tracked_ms": self.tracked_ns / self.tracked_frames / 1e6 if self.tracked_frames else None,
+            "detected_ms": self.detected_ns / self.detected_frames / 1e6 if self.detected_frames else None,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        tracked_ms = f"{stats['tracked_ms']:.2f}" if stats["tracked_ms"] is not None else "-"
+        detected_ms = f"{stats['detected_ms']:.2f}" if stats["detected_ms"] is not None else "-"
+        return (f"Optical-flow tracking: {stats['tracked_frames']} frames tracked ({tracked_ms} ms/frame), "
+                f"{stats['detected_frames']} detected ({detected_ms} ms/frame), {stats['tracked_ratio']:.0%} tracked, "
+                f"{stats['fallbacks']} fallbacks to detection")
+
+
+# DETECTOR CONFIGURATION -----------------------------------------------------------------------------------------------
+def add_detector_arguments(arg):
+    """Add the command line arguments selecting the detection mode to an argparse.ArgumentParser."""
+    arg.add_argument("-t", "--track", action="store_true", help="search for markers only near their last known corners")
+    arg.add_argument("--full-search-period", type=int, default=30, help="frames between forced full-frame searches in tracking mode")
+    arg.add_argument("--scale", type=float, default=None, help="downscale factor of the pyramid detection (0 < scale <= 1)")
+    arg.add_argument("--marker-pixels", type=int, default=None, help="expected marker side length [px], used to choose the pyramid scale")
+    arg.add_argument("--auto-scale", action="store_true", help="adapt the pyramid scale to the size of the detected markers")
+    arg.add_argument("--profile", type=str, default=None, help="detector profile saved by 'param_tuner.py' (name or .json path)")
+    arg.add_argument("--flow", action="store_true", help="track the marker corners with optical flow between full detections")
+    arg.add_argument("--redetect-period", type=int, default=15, help="frames between forced full detections in optical-flow mode")
+    arg.add_argument("--ids", type=int, nargs="+", default=None,
+                     help="deployed marker IDs - only these are decoded, with a restricted dictionary (see 'arucoDict.py')")
+
+
+def create_detector(arucoDict, arucoParams, args):
+    """
+    Build the detection function gray_frame -> (corners, ids, rejected) selected by the arguments of add_detector_arguments.
+    Returns the function together with the outermost tracker - the FlowTracker, the ROITracker or None - so that the caller
+    can report its statistics with tracker.summary().
+    """
+    detector = None
+    if args["scale"] is not None or args["marker_pixels"] is not None or args["auto_scale"]:
+        detector = PyramidDetector(arucoDict, arucoParams, scale=args["scale"], expected_marker_pixels=args["marker_pixels"],
+                                   adaptive=args["auto_scale"]).detect
+
+    tracker = None
+    if args["track"]:
+        tracker = ROITracker(arucoDict, arucoParams, full_search_period=args["full_search_period"], detector=detector)
+        detector = tracker.detect
+
+    if detector is None:
+        def detector(gray_frame):
+            return detect_markers(gray_frame, arucoDict, arucoParams)
+
+    if args["flow"]:
+        tracker = FlowTracker(arucoDict, arucoParams, detector=detector, redetect_period=args["redetect_period"])
+        detector = tracker.detect
+    return detector, tracker
@@ -1,76 +1,88 @@
 """
 This script perform a quick real-time detection of the ArUco marker using the camera. Note that this script only annotates the marker upon detected, but does not carry out pose estimation.
 
+With --track, detection only runs on a window around the markers found in the previous frame, and with --scale/--marker-pixels
+the candidate search runs on a downscaled frame and the corners are refined at full resolution (see 'aruco_detector.py').
+The time spent in each stage is summarized periodically as p50/p95/p99 (see 'instrumentation.py').
+The annotated frames are shown in the loop, on a separate rate-limited thread or not at all with --display (see 'renderer.py').
+With --record, the captured frames are recorded for a later replay with --source replay (see 'frame_recorder.py').
+Capture, detection and the outputs run on the asyncio runtime, so printing and the display never delay the detection, and
+--control-port serves 'status' health reports and 'quit' commands (see 'runtime.py').
+
 Created by: Jalen
 """
 # Standard Imports
-import time
-
-# Third-Party Imports
-import cv2
-import imutils
-from imutils.video import VideoStream
+import argparse
+import asyncio
 
 # Project-Specific Imports
-from arucoDict import ARUCO_DICT
-from aruco_detector import annotate_tags
+from arucoDict import get_dictionary
+from aruco_detector import add_detector_arguments, create_detector, load_detector_params
+from frame_source import FRAME_SOURCES, create_source
+from frame_recorder import add_recorder_arguments, create_recorder
+from instrumentation import add_metrics_arguments, create_metrics
+from renderer import Renderer, add_display_arguments, create_display
+from runtime import DisplayOutput, PrintOutput, Runtime, add_runtime_arguments, create_services
+from stages import DetectionStage
+
+
+# ARGUMENTS -----------------------------------------------------------------------------------------------------------
+arg = argparse.ArgumentParser()
+arg.add_argument("-s", "--source", type=str, default="picamera", choices=FRAME_SOURCES, help="frame source to capture from")
+arg.add_argument("-v", "--video", type=str, default=None, help="path to the video file used by the 'file' frame source")
+arg.add_argument("--bus-name", type=str, default="aruco_frames", help="frame bus used by the 'bus' frame source")
+arg.add_argument("--yuv", action="store_true",
+                 help="grayscale-first capture: detect on the Y plane of YUV420 frames, colour only for display/recording")
+add_recorder_arguments(arg)  # Raw recording and replay: --record, --record-gray, --record-mb, --record-ring, --recording, --replay-realtime
+add_detector_arguments(arg)  # Detection mode: --track, --flow, --scale, --marker-pixels, --auto-scale, --profile, --ids
+add_metrics_arguments(arg)   # Instrumentation: --metrics-interval, --metrics-file, --metrics-port
+add_display_arguments(arg)   # Display: --display inline/thread/headless, --display-fps
+add_runtime_arguments(arg)   # Runtime: --control-port, --drain-timeout
+args = vars(arg.parse_args())  # Convert argument to dictionary
+if args["record"] is not None and args["source"] == "bus":
+    arg.error("--record needs a local frame source and cannot be used with the 'bus' frame source")
 
 
 # DEFINE ARUCO DICTIONARY AND DETECTION PARAMETER ----------------------------------------------------------------------
-arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT["DICT_6X6_50"])  # Define what type of aruco markers to look for
-arucoParams = cv2.aruco.DetectorParameters_create()              # Use default parameters
-
-
-# DETECT IMAGE IN VIDEO ------------------------------------------------------------------------------------------------
-# Initialize the PiCamera
-with picamera.PiCamera() as camera:
-    camera.resolution = (640, 480)  # Set camera resolution
-    camera.framerate = 32  # Set camera framerate
-    time.sleep(2)  # Allow camera to warm up
-
-    # Loop over frames from video stream
-    for _ in camera.capture_continuous(picamera.array.PiRGBArray(camera)):
-        frame = camera.array
-
-        # Resize the frame
-        frame = cv2.resize(frame, (1000, 1000))
+arucoDict = get_dictionary("DICT_6X6_50", args["ids"])            # Define what type of aruco markers to look for
+arucoParams = load_detector_params(args["profile"])              # Default parameters, or a tuned --profile
 
-        # Detect markers in the current frame
-        start_time = time.time()
-        corners, ids, rejected = cv2.aruco.detectMarkers(image=frame,
-                                                          dictionary=arucoDict,
-                                                          parameters=arucoParams)
+# Detection mode - plain, ROI tracking, pyramid detection and/or optical-flow tracking (see 'aruco_detector.py')
+detect, tracker = create_detector(arucoDict, arucoParams, args)
 
-        detection_time = time.time() - start_time
-        print(f"Detection takes {detection_time * 1000} ms")
 
-        # If at least one marker is detected
-        if len(corners) > 0:
-            # Print analytics
-            ids = ids.flatten()
-            print(f"Within the image of size {frame.shape}:")
-            print(f"    {len(ids)} tags are detected, with IDs {ids}.")
-            print(f"    {len(rejected)} tags are rejected.")
-
-            for markerCorners, markerID in zip(corners, ids):
-                # Corner are always in the order: top-left, top-right, bottom-right, bottom-left
-                topLeft, topRight, btmRight, btmLeft = markerCorners.reshape((4, 2))
-
-                # Convert the coordinates to integers to be used by OpenCV
-                topLeft = (int(topLeft[0]), int(topLeft[1]))
-                topRight = (int(topRight[0]), int(topRight[1]))
-                btmRight = (int(btmRight[0]), int(btmRight[1]))
-                btmLeft = (int(btmLeft[0]), int(btmLeft[1]))
-
-                # Draw information onto the frame
-                annotate_tags(frame, markerID, topLeft, topRight, btmRight, btmLeft)
-
-            cv2.imshow("frame", frame)
-            key = cv2.waitKey(1) & 0xFF  # Waits for a key event for 1ms, extract the least significant 8 bits of results
-
-            # Break the loop if the key 'q' is pressed
-            if key == ord('q'):
-                break
-
-    # Cleanup
-    cv2.destroyAllWindows()
+# DETECT IMAGE IN VIDEO ------------------------------------------------------------------------------------------------
+# Initialize the frame source, and the raw recording of every captured frame with --record (see 'frame_recorder.py')
+recorder = create_recorder(args)
+source = create_source(args["source"], video=args["video"], resolution=(640, 480), framerate=32,
+                       bus_name=args["bus_name"], recording=args["recording"], realtime=args["replay_realtime"], yuv=args["yuv"])
+source.recorder = recorder
+source.start()
+
+# Per-stage timings, reported every --metrics-interval seconds (see 'instrumentation.py')
+metrics = create_metrics(("capture_wait", "color", "detect", "display"), args)
+
+
+def describe_tags(result):
+    """Print analytics, if at least one marker is detected."""
+    if len(result.corners) == 0:
+        return None
+    return (f"Within the image of size {result.image.shape}:\n"
+            f"    {len(result.ids)} tags are detected, with IDs {result.ids.flatten()}.\n"
+            f"    {len(result.rejected)} tags are rejected.")
+
+
+# Detect markers in every frame (at its native resolution - downscaling is left to the pyramid detection), print the
+# analytics and draw the outline, centre and ID of the tags onto the frame - the runtime stops when the key 'q' is pressed
+display = create_display(Renderer("frame", tags=True), args, metrics)
+runtime = Runtime(source, DetectionStage(detect, source, metrics), [PrintOutput(describe_tags), DisplayOutput(display)],
+                  services=create_services(args), metrics=metrics, drain_timeout=args["drain_timeout"])
+try:
+    asyncio.run(runtime.run())
+finally:
+    if recorder is not None:
+        recorder.close()
+        print(f"Recorded {recorder.recorded} frames into {args['record']}, {recorder.dropped} dropped")
+print(runtime.summary())
+if tracker is not None:
+    print(tracker.summary())
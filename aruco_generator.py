@@ -2,50 +2,229 @@
 
 This script generates the ArUco tags and store them as PNG files within directories of the same ArUco dictionary.
 
+The markers are rendered in a process pool, for any dictionary in ARUCO_DICT and any list of pixel sizes. The default 300 px
+tags are saved in aruco_tags/<dictionary>, other sizes in aruco_tags/<dictionary>/<size>px. Generation is incremental: a
+manifest in every folder records the code of each saved marker, so unchanged markers are neither rendered nor rewritten,
+and a re-rendered PNG is only written if its content differs from the file on disk.
+
+With --atlas, each size is packed into a single atlas instead of one PNG per marker - atlas_<size>.npy holds all markers as
+a (markers, size, size) array in marker ID order, and atlas_<size>.json is its index. The atlas is loaded by memory-mapping
+that one file (load_atlas), e.g. by the synthetic frames of 'benchmark.py' and 'frame_source.py'.
+
+Usage:
+    python aruco_generator.py --type DICT_6X6_50
+    python aruco_generator.py --type DICT_7X7_1000 --sizes 100 300 600 --atlas
+
 Created by: Jalen
 """
 
-import sys
+# Standard Imports
 import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import numpy as np
+
+# Third-Party Imports
 import cv2
+import numpy as np
+
+# Project-Specific Imports
 from arucoDict import ARUCO_DICT
 
 
-# ARGUMENTS -----------------------------------------------------------------------------------------------------------
-arg = argparse.ArgumentParser()
-arg.add_argument("-t", "--type", type=str, default="DICT_6X6_50", help="type of ArUco marker to generate")
-args = vars(arg.parse_args())  # Convert argument to dictionary
+TAG_ROOT = Path(Path(__file__).parent, "aruco_tags").resolve()
+DEFAULT_SIZE = 300
+MANIFEST = ".manifest.json"
+
+
+def tag_folder(dictionary, size=DEFAULT_SIZE, root=TAG_ROOT):
+    """Folder of the tags of a dictionary - the default size directly in it, other sizes in a <size>px subfolder."""
+    folder = Path(root, dictionary)
+    return folder if size == DEFAULT_SIZE else folder.joinpath(f"{size}px")
+
+
+def render_marker(arucoDict, marker_id, size, border_bits=1):
+    """Marker image of size x size pixels. (P.S. ArUco is a binary image)"""
+    tag = np.zeros((size, size), dtype="uint8")
+    cv2.aruco.drawMarker(dictionary=arucoDict, id=marker_id, sidePixels=size, img=tag, borderBits=border_bits)
+    return tag
+
+
+def marker_key(arucoDict, marker_id, size, border_bits=1):
+    """Hash of everything a rendered marker depends on - its code, size and border."""
+    code = arucoDict.bytesList[marker_id].tobytes()
+    return hashlib.sha1(code + f"{arucoDict.markerSize}/{size}/{border_bits}".encode()).hexdigest()
+
+
+def dictionary_key(arucoDict, size, border_bits=1):
+    """Hash of everything an atlas depends on - all codes of the dictionary, size and border."""
+    codes = arucoDict.bytesList.tobytes()
+    return hashlib.sha1(codes + f"{arucoDict.markerSize}/{size}/{border_bits}".encode()).hexdigest()
+
+
+# PNG GENERATION -------------------------------------------------------------------------------------------------------
+def _write_pngs(dictionary, size, border_bits, folder, ids):
+    """Worker: render and save a chunk of markers. Returns {file name: (key, length)} and the number of files written."""
+    arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary])
+    entries, written = {}, 0
+    for marker_id in ids:
+        file_path = Path(folder, f"ID_{marker_id}.png")
+        _, png = cv2.imencode(".png", render_marker(arucoDict, marker_id, size, border_bits))
+        png = png.tobytes()
+        if not file_path.exists() or file_path.read_bytes() != png:
+            file_path.write_bytes(png)
+            written += 1
+        entries[file_path.name] = (marker_key(arucoDict, marker_id, size, border_bits), len(png))
+    return entries, written
+
+
+def _load_manifest(folder):
+    try:
+        with open(Path(folder, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _pool(workers):
+    """Process pool of the generation - forked where possible, so the workers start quickly."""
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=context)
+
+
+def _chunks(ids, workers):
+    count = max(1, (workers or os.cpu_count() or 1) * 4)
+    return [chunk for chunk in np.array_split(np.asarray(ids), count) if len(chunk)]
+
+
+def generate_pngs(dictionary, sizes=(DEFAULT_SIZE,), border_bits=1, workers=None, force=False, root=TAG_ROOT):
+    """
+    Save every marker of the dictionary as a PNG file per size, skipping the markers whose file would not change.
+    Returns the number of files written.
+    """
+    arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary])
+    jobs = []
+    for size in sizes:
+        folder = tag_folder(dictionary, size, root)
+        folder.mkdir(parents=True, exist_ok=True)
+        manifest = {} if force else _load_manifest(folder)
+
+        # Markers whose code, size and border match the manifest, and whose file is still there, are skipped
+        stale = []
+        for marker_id in range(len(arucoDict.bytesList)):
+            file_path = Path(folder, f"ID_{marker_id}.png")
+            entry = manifest.get(file_path.name)
+            if (entry is None or entry[0] != marker_key(arucoDict, marker_id, size, border_bits)
+                    or not file_path.exists() or file_path.stat().st_size != entry[1]):
+                stale.append(marker_id)
+        jobs.append((size, folder, manifest, stale))
+
+    written = 0
+    with _pool(workers) as executor:
+        for size, folder, manifest, stale in jobs:
+            futures = [executor.submit(_write_pngs, dictionary, size, border_bits, str(folder), chunk.tolist())
+                       for chunk in _chunks(stale, workers)]
+            for future in futures:
+                entries, count = future.result()
+                manifest.update(entries)
+                written += count
+            with open(Path(folder, MANIFEST), "w") as f:
+                json.dump(manifest, f)
+    return written
+
+
+# ATLAS ----------------------------------------------------------------------------------------------------------------
+def atlas_paths(dictionary, size=DEFAULT_SIZE, root=TAG_ROOT):
+    """Paths of the atlas image (.npy) and its index (.json)."""
+    folder = Path(root, dictionary)
+    return folder.joinpath(f"atlas_{size}.npy"), folder.joinpath(f"atlas_{size}.json")
+
+
+def _fill_atlas(dictionary, size, border_bits, atlas_path, ids):
+    """Worker: render a chunk of markers straight into the memory-mapped atlas."""
+    arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary])
+    atlas = np.load(atlas_path, mmap_mode="r+")
+    for marker_id in ids:
+        atlas[marker_id] = render_marker(arucoDict, marker_id, size, border_bits)
+    atlas.flush()
+    return len(ids)
+
 
+def generate_atlas(dictionary, size=DEFAULT_SIZE, border_bits=1, workers=None, force=False, root=TAG_ROOT):
+    """Pack every marker of the dictionary into one atlas. Returns False if the existing atlas was already up to date."""
+    arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary])
+    atlas_path, index_path = atlas_paths(dictionary, size, root)
+    key = dictionary_key(arucoDict, size, border_bits)
+    if not force and atlas_path.exists() and index_path.exists():
+        with open(index_path) as f:
+            if json.load(f).get("key") == key:
+                return False
 
-# CHECK IF DICTIONARY EXISTS -------------------------------------------------------------------------------------------
-if ARUCO_DICT.get(args["type"], None) is None:
-    print(f"ArUco tag type {args['type']} is not supported.")
-    sys.exit(0)
-arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[args["type"]])
+    # The atlas file is created here, and the workers render their markers directly into it
+    count = len(arucoDict.bytesList)
+    atlas_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = atlas_path.with_name(atlas_path.stem + f".{os.getpid()}.tmp.npy")
+    atlas = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(count, size, size))
+    del atlas
+    with _pool(workers) as executor:
+        for future in [executor.submit(_fill_atlas, dictionary, size, border_bits, str(tmp_path), chunk.tolist())
+                       for chunk in _chunks(range(count), workers)]:
+            future.result()
+    os.replace(tmp_path, atlas_path)
 
+    index = {
+        "dictionary": dictionary,
+        "size": size,
+        "border_bits": border_bits,
+        "markers": count,
+        "image": atlas_path.name,
+        "layout": "atlas[marker_id] is the size x size image of the marker",
+        "key": key,
+    }
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=2)
+    return True
 
-# SAVE IMAGE -----------------------------------------------------------------------------------------------------------
-# Save all possible IDs for the specified dictionary within the same directory
 
-# Create a folder to store markers if not already
-folder_path = Path(Path(__file__).parent, "aruco_tags", args["type"]).resolve()
-folder_path.mkdir(parents=True, exist_ok=True)
+def load_atlas(dictionary, size=DEFAULT_SIZE, root=TAG_ROOT):
+    """Memory-mapped atlas of a dictionary (read-only, atlas[marker_id] is a marker image), or None if not generated."""
+    atlas_path, index_path = atlas_paths(dictionary, size, root)
+    if not atlas_path.exists() or not index_path.exists():
+        return None
+    with open(index_path) as f:
+        index = json.load(f)
+    atlas = np.load(atlas_path, mmap_mode="r")
+    if atlas.shape != (index["markers"], size, size):
+        return None
+    return atlas
 
-# Save each marker by looping over its ID
-for marker_id in range(len(arucoDict.bytesList)):
 
-    # Save ArUco tag as an array called "tag". (P.S. ArUco is a binary image)
-    tag = np.zeros((300, 300, 1), dtype="uint8")
-    cv2.aruco.drawMarker(dictionary=arucoDict,
-                         id=marker_id,
-                         sidePixels=300,
-                         img=tag,
-                         borderBits=1)
+# MAIN -----------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    # ARGUMENTS -------------------------------------------------------------------------------------------------------
+    arg = argparse.ArgumentParser()
+    arg.add_argument("-t", "--type", type=str, default="DICT_6X6_50", help="type of ArUco marker to generate")
+    arg.add_argument("-s", "--sizes", type=int, nargs="+", default=[DEFAULT_SIZE], help="marker side lengths [px]")
+    arg.add_argument("--atlas", action="store_true", help="pack all markers of each size into one memory-mappable atlas")
+    arg.add_argument("--workers", type=int, default=None, help="number of parallel processes (default: one per CPU core)")
+    arg.add_argument("--force", action="store_true", help="render and rewrite every marker, even if unchanged")
+    args = vars(arg.parse_args())  # Convert argument to dictionary
 
-    # Save the marker as a file within a folder corresponding to its dictionary
-    file_path = Path(folder_path, f"ID_{marker_id}").resolve()
-    cv2.imwrite(str(file_path) + ".png", img=tag)
+    # CHECK IF DICTIONARY EXISTS --------------------------------------------------------------------------------------
+    if ARUCO_DICT.get(args["type"], None) is None:
+        print(f"ArUco tag type {args['type']} is not supported.")
+        sys.exit(0)
 
-print("All images saved.")
+    # SAVE IMAGE ------------------------------------------------------------------------------------------------------
+    if args["atlas"]:
+        for size in args["sizes"]:
+            updated = generate_atlas(args["type"], size, workers=args["workers"], force=args["force"])
+            print(f"Atlas {atlas_paths(args['type'], size)[0]} {'saved' if updated else 'already up to date'}.")
+    else:
+        written = generate_pngs(args["type"], args["sizes"], workers=args["workers"], force=args["force"])
+        print(f"All images saved ({written} written, the others unchanged).")
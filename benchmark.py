@@ -0,0 +1,383 @@
+"""
+This script benchmarks the detection and pose pipeline offline, by replaying a fixed set of frames through the same stages as
+'pose_estimation.py':
+    1) gray      - grayscale conversion
+    2) detect    - marker detection (plain, ROI tracking and/or pyramid detection, see 'aruco_detector.py')
+    3) pose      - cv2.aruco.estimatePoseSingleMarkers and the vectorized post-processing of 'pose_batch.py'
+    4) annotate  - polylines and frame axes drawn onto the frame (see 'renderer.py')
+
+The frames can come from a folder of images (e.g. camera_calibration_final/aruco_calibration_data), a recorded video, or be
+synthesized by compositing the tags of aruco_tags/<dictionary> (memory-mapped from its atlas, if generated with
+'aruco_generator.py --atlas') onto generated backgrounds. Only synthetic frames have a ground truth, so detection recall, false
+positives and corner error are only reported for them.
+
+The results (per-stage latency percentiles, frames per second, Python allocations and detection quality) are printed and
+written to a JSON file, which can be compared against an earlier run:
+    python benchmark.py --synthetic 200 --output before.json
+    python benchmark.py --synthetic 200 --scale 0.5 --output after.json --compare before.json
+
+With --ids, the detection uses a dictionary restricted to the deployed marker IDs (see 'arucoDict.py'), the other markers of the
+synthetic frames being clutter that should not be reported. The full dictionary is benchmarked on the same frames as well, and
+the two are compared:
+    python benchmark.py --synthetic 200 --ids 25 3 7
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from pathlib import Path
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from arucoDict import ARUCO_DICT, get_dictionary
+from aruco_detector import add_detector_arguments, create_detector, load_detector_params
+from aruco_generator import load_atlas
+from pose_batch import POSE_DTYPE, compute_poses
+from renderer import Renderer
+from calibration import load_calibration
+
+
+ROOT = Path(__file__).parent.absolute()
+STAGES = ("gray", "detect", "pose", "annotate")
+MARKER_SIZE = 60  # Square size [mm], as in 'pose_estimation.py'
+
+
+# FRAME SETS -----------------------------------------------------------------------------------------------------------
+# Every frame set is a list of (image, truth), where truth maps marker ID -> (4, 2) corners, or is None if unknown.
+def load_image_frames(folder, limit=None):
+    """Load the .jpg/.png images of a folder, in name order."""
+    paths = sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    frames = []
+    for path in paths[:limit]:
+        image = cv2.imread(str(path))
+        if image is not None:
+            frames.append((image, None))
+    return frames
+
+
+def load_video_frames(path, limit=None):
+    """Load the frames of a recorded video."""
+    capture = cv2.VideoCapture(str(path))
+    frames = []
+    while limit is None or len(frames) < limit:
+        ret, image = capture.read()
+        if not ret:
+            break
+        frames.append((image, None))
+    capture.release()
+    return frames
+
+
+def load_tag(dictionary, marker_id, tag_dir=None):
+    """Tag image of the atlas or PNG files saved by 'aruco_generator.py', or drawn on the fly if it has not been generated."""
+    if tag_dir is None:
+        atlas = load_atlas(dictionary)
+        if atlas is not None:
+            return np.array(atlas[marker_id])
+    tag_dir = Path(tag_dir) if tag_dir is not None else ROOT.joinpath("aruco_tags", dictionary)
+    tag = cv2.imread(str(tag_dir.joinpath(f"ID_{marker_id}.png")), cv2.IMREAD_GRAYSCALE)
+    if tag is None:
+        tag = np.zeros((300, 300), dtype="uint8")
+        cv2.aruco.drawMarker(cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary]), marker_id, 300, tag, 1)
+    return tag
+
+
+def _background(rng, resolution):
+    """Smooth random texture with a brightness gradient."""
+    width, height = resolution
+    noise = rng.integers(40, 200, size=(height // 16 + 1, width // 16 + 1), dtype=np.uint8)
+    background = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+    gradient = np.linspace(-30, 30, width, dtype=np.float32)[None, :]
+    return np.clip(background + gradient, 0, 255).astype(np.uint8)
+
+
+def synthetic_frames(count, dictionary="DICT_6X6_50", ids=None, resolution=(640, 480), markers_per_frame=(1, 3),
+                     marker_pixels=(50, 200), lighting="normal", seed=0, tag_dir=None):
+    """
+    Composite tags onto generated backgrounds with random size, rotation and perspective, returning the true corners.
+
+    Arguments:
+        ids                 : Marker IDs to draw from (defaults to the whole dictionary)
+        markers_per_frame   : (min, max) number of markers per frame
+        marker_pixels       : (min, max) marker side length [px]
+        lighting            : "normal", "dark" or "bright" - scales contrast and brightness, and adds matching noise
+    """
+    rng = np.random.default_rng(seed)
+    if ids is None:
+        ids = range(len(cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary]).bytesList))
+    ids = list(ids)
+    tags = {}
+    width, height = resolution
+    gain, offset, noise_sigma = {"normal": (1.0, 0, 3), "dark": (0.35, 10, 6), "bright": (0.7, 90, 3)}[lighting]
+
+    frames = []
+    for _ in range(count):
+        frame = _background(rng, resolution)
+        truth = {}
+
+        # One marker per horizontal cell so that the markers never overlap
+        cells = min(int(rng.integers(markers_per_frame[0], markers_per_frame[1] + 1)), len(ids))
+        cell_width = width / cells
+        for cell, marker_id in enumerate(rng.choice(ids, size=cells, replace=False)):
+            marker_id = int(marker_id)
+            if marker_id not in tags:
+                tag = load_tag(dictionary, marker_id, tag_dir)
+                pad = tag.shape[0] // 6  # White quiet zone around the marker
+                tags[marker_id] = (cv2.copyMakeBorder(tag, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=255), pad)
+            padded, pad = tags[marker_id]
+
+            side = float(rng.uniform(*marker_pixels))
+            side = min(side, cell_width / 2.0, height / 2.0)
+            cx = cell_width * (cell + 0.5) + rng.uniform(-0.1, 0.1) * cell_width
+            cy = height / 2 + rng.uniform(-0.25, 0.25) * (height - 2.0 * side)
+            angle = rng.uniform(0, 2 * np.pi)
+
+            # Marker corners (top-left, top-right, bottom-right, bottom-left) in the frame, with perspective jitter
+            unit = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=np.float64) * 0.5
+            rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+            corners = unit @ rotation.T * side + [cx, cy] + rng.normal(0, side * 0.04, size=(4, 2))
+
+            size = padded.shape[0] - 2 * pad
+            src = np.array([[pad, pad], [pad + size, pad], [pad + size, pad + size], [pad, pad + size]], dtype=np.float32) - 0.5
+            M = cv2.getPerspectiveTransform(src, corners.astype(np.float32))
+            warped = cv2.warpPerspective(padded, M, resolution, flags=cv2.INTER_LINEAR, borderValue=0)
+            mask = cv2.warpPerspective(np.full_like(padded, 255), M, resolution, flags=cv2.INTER_NEAREST, borderValue=0)
+            np.copyto(frame, warped, where=mask > 0)
+            truth[marker_id] = corners.astype(np.float32)
+
+        frame = frame.astype(np.float32) * gain + offset + rng.normal(0, noise_sigma, size=frame.shape)
+        frame = cv2.GaussianBlur(np.clip(frame, 0, 255).astype(np.uint8), (3, 3), 0)
+        frames.append((cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR), truth))
+    return frames
+
+
+# SCORING --------------------------------------------------------------------------------------------------------------
+def score_detection(corners, ids, truth):
+    """Return (true positives, false positives, missed, corner errors [px]) of a frame against its ground truth."""
+    found = {} if ids is None else {int(i): c.reshape((4, 2)) for c, i in zip(corners, ids.flatten())}
+    matched = set(found) & set(truth)
+    errors = [float(np.linalg.norm(found[i] - truth[i], axis=1).mean()) for i in matched]
+    return len(matched), len(set(found) - set(truth)), len(set(truth) - set(found)), errors
+
+
+def detection_quality(results):
+    """Aggregate recall, false positives and corner error over the scored frames (None if nothing was scored)."""
+    scored = [r for r in results if r is not None]
+    if not scored:
+        return None
+    tp = sum(r[0] for r in scored)
+    fp = sum(r[1] for r in scored)
+    fn = sum(r[2] for r in scored)
+    errors = [e for r in scored for e in r[3]]
+    return {
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+        "false_positives": fp,
+        "corner_error_px_mean": float(np.mean(errors)) if errors else None,
+        "corner_error_px_p95": float(np.percentile(errors, 95)) if errors else None,
+    }
+
+
+def latency_summary(samples_ns):
+    """Percentiles of a list of nanosecond samples, in milliseconds."""
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "max_ms": float(samples.max()),
+    }
+
+
+def restrict_truth(frames, ids):
+    """Frames whose ground truth only contains the deployed marker IDs - the other markers become clutter."""
+    allowed = set(int(i) for i in ids)
+    return [(image, None if truth is None else {i: c for i, c in truth.items() if i in allowed}) for image, truth in frames]
+
+
+# PIPELINE -------------------------------------------------------------------------------------------------------------
+def run_pipeline(frames, detect, camMatrix, distCof, marker_size=MARKER_SIZE, annotate=True):
+    """
+    Run every frame through the stages of 'pose_estimation.py'. Returns the per-stage timings [ns] and the detection score
+    of every frame (None for frames without ground truth).
+    """
+    timings = {stage: [] for stage in STAGES}
+    scores = []
+    pose_buffer = np.empty(64, dtype=POSE_DTYPE)
+    renderer = Renderer("benchmark", camMatrix, distCof, axis_length=50, thickness=3)
+
+    for image, truth in frames:
+        image = image.copy()  # Annotation draws onto the frame
+
+        t0 = time.perf_counter_ns()
+        gray_frame = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        t1 = time.perf_counter_ns()
+        corners, ids, rejected = detect(gray_frame)
+        t2 = time.perf_counter_ns()
+        poses = None
+        if ids is not None:
+            rVec, tVec, _ = cv2.aruco.estimatePoseSingleMarkers(
+                corners=corners, markerLength=marker_size, cameraMatrix=camMatrix, distCoeffs=distCof
+            )
+            poses = compute_poses(ids, corners, rVec, tVec, camMatrix, out=pose_buffer)
+        t3 = time.perf_counter_ns()
+        if annotate and poses is not None:
+            renderer.render(image, corners, ids, poses)
+        t4 = time.perf_counter_ns()
+
+        for stage, start, end in zip(STAGES, (t0, t1, t2, t3), (t1, t2, t3, t4)):
+            timings[stage].append(end - start)
+        scores.append(None if truth is None else score_detection(corners, ids, truth))
+    return timings, scores
+
+
+def measure_allocations(frames, detect, camMatrix, distCof, marker_size=MARKER_SIZE):
+    """
+    Peak Python-level allocation per frame, measured in a separate pass because tracemalloc slows the pipeline down.
+    NumPy allocations are included; allocations made inside OpenCV are not visible to tracemalloc.
+    """
+    peaks = []
+    tracemalloc.start()
+    for frame in frames:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        run_pipeline([frame], detect, camMatrix, distCof, marker_size)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return {"peak_bytes_per_frame_mean": float(np.mean(peaks)), "peak_bytes_per_frame_max": int(np.max(peaks))}
+
+
+def benchmark(frames, detect, camMatrix, distCof, repeat=1, warmup=5, marker_size=MARKER_SIZE, allocations=True):
+    """Run the full benchmark and return the machine-readable results."""
+    run_pipeline(frames[:warmup], detect, camMatrix, distCof, marker_size)
+
+    timings = {stage: [] for stage in STAGES}
+    scores = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run_timings, run_scores = run_pipeline(frames, detect, camMatrix, distCof, marker_size)
+        for stage in STAGES:
+            timings[stage].extend(run_timings[stage])
+        scores.extend(run_scores)
+    elapsed = time.perf_counter() - start
+
+    totals = np.sum([timings[stage] for stage in STAGES], axis=0)
+    return {
+        "frames": len(frames) * repeat,
+        "fps": len(frames) * repeat / elapsed,
+        "stages": {stage: latency_summary(timings[stage]) for stage in STAGES},
+        "total": latency_summary(totals),
+        "allocations": measure_allocations(frames, detect, camMatrix, distCof, marker_size) if allocations else None,
+        "detection": detection_quality(scores),
+    }
+
+
+# REPORTING ------------------------------------------------------------------------------------------------------------
+def print_results(results):
+    print(f"{results['frames']} frames, {results['fps']:.1f} frames/s")
+    print(f"{'stage':<10}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  [ms]")
+    for stage, summary in list(results["stages"].items()) + [("total", results["total"])]:
+        print(f"{stage:<10}{summary['mean_ms']:>10.3f}{summary['p50_ms']:>10.3f}{summary['p95_ms']:>10.3f}{summary['p99_ms']:>10.3f}")
+    if results["allocations"] is not None:
+        print(f"Peak Python allocation per frame: {results['allocations']['peak_bytes_per_frame_mean'] / 1024:.1f} KiB")
+    if results["detection"] is not None:
+        detection = results["detection"]
+        print(f"Recall: {detection['recall']:.3f}, false positives: {detection['false_positives']}, "
+              f"corner error: {detection['corner_error_px_mean']} px")
+
+
+def print_comparison(results, baseline):
+    """Print the change of the main figures against a baseline results file."""
+    print(f"Compared with baseline ({baseline['frames']} frames):")
+    print(f"    fps: {baseline['fps']:.1f} -> {results['fps']:.1f} ({(results['fps'] / baseline['fps'] - 1) * 100:+.1f} %)")
+    for stage in list(STAGES) + ["total"]:
+        old = baseline["total"] if stage == "total" else baseline["stages"][stage]
+        new = results["total"] if stage == "total" else results["stages"][stage]
+        change = (new["p50_ms"] / old["p50_ms"] - 1) * 100 if old["p50_ms"] else float("nan")
+        print(f"    {stage:<10} p50 {old['p50_ms']:.3f} -> {new['p50_ms']:.3f} ms ({change:+.1f} %)")
+    if results["detection"] is not None and baseline.get("detection") is not None:
+        print(f"    recall: {baseline['detection']['recall']:.3f} -> {results['detection']['recall']:.3f}")
+        print(f"    false positives: {baseline['detection']['false_positives']} -> {results['detection']['false_positives']}")
+
+
+# MAIN -----------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    arg = argparse.ArgumentParser()
+    arg.add_argument("-i", "--images", type=str, default=None, help="folder of images to replay (e.g. camera_calibration_final/aruco_calibration_data)")
+    arg.add_argument("-v", "--video", type=str, default=None, help="recorded video to replay")
+    arg.add_argument("--synthetic", type=int, default=None, help="number of synthetic frames to generate (default if no other frame set is given)")
+    arg.add_argument("--lighting", type=str, default="normal", choices=("normal", "dark", "bright"), help="lighting of the synthetic frames")
+    arg.add_argument("--seed", type=int, default=0, help="random seed of the synthetic frames")
+    arg.add_argument("--limit", type=int, default=None, help="maximum number of frames to load")
+    arg.add_argument("--type", type=str, default="DICT_6X6_50", help="type of ArUco marker to detect")
+    arg.add_argument("--repeat", type=int, default=3, help="number of passes over the frame set")
+    arg.add_argument("--no-allocations", action="store_true", help="skip the allocation measurement pass")
+    arg.add_argument("--calibration", type=str, default=str(ROOT.joinpath("camera_calibration_final", "calibration.yaml")), help="calibration YAML file")
+    arg.add_argument("-o", "--output", type=str, default="benchmark_results.json", help="JSON file to write the results to")
+    arg.add_argument("-c", "--compare", type=str, default=None, help="earlier results file to compare against")
+    add_detector_arguments(arg)  # Detection mode: --track, --flow, --scale, --marker-pixels, --auto-scale, --profile, --ids
+    args = vars(arg.parse_args())  # Convert argument to dictionary
+
+    if args["images"] is not None:
+        frames = load_image_frames(args["images"], args["limit"])
+        frame_set = {"images": args["images"]}
+    elif args["video"] is not None:
+        frames = load_video_frames(args["video"], args["limit"])
+        frame_set = {"video": args["video"]}
+    else:
+        count = args["synthetic"] or args["limit"] or 100
+        frames = synthetic_frames(count, dictionary=args["type"], lighting=args["lighting"], seed=args["seed"])
+        frame_set = {"synthetic": count, "lighting": args["lighting"], "seed": args["seed"]}
+    if not frames:
+        raise SystemExit("No frames to benchmark.")
+    if args["ids"] is not None:
+        frames = restrict_truth(frames, args["ids"])
+
+    arucoDict = get_dictionary(args["type"], args["ids"])
+    arucoParams = load_detector_params(args["profile"])
+    camMatrix, distCof, _ = load_calibration(args["calibration"])
+    detect, tracker = create_detector(arucoDict, arucoParams, args)
+
+    results = benchmark(frames, detect, camMatrix, distCof, repeat=args["repeat"], allocations=not args["no_allocations"])
+    if args["flow"]:
+        # Tracked vs. detected frames and the cost of each path - only meaningful on consecutive frames (--video)
+        results["flow"] = tracker.stats()
+    if args["ids"] is not None:
+        # Same frames and truth with the full dictionary, to show the gain of the restricted one
+        full_detect, _ = create_detector(get_dictionary(args["type"]), arucoParams, args)
+        results["full_dictionary"] = benchmark(frames, full_detect, camMatrix, distCof, repeat=args["repeat"], allocations=False)
+    results["config"] = {
+        "frame_set": frame_set,
+        "dictionary": args["type"],
+        "ids": args["ids"],
+        "detector": {key: args[key] for key in ("track", "full_search_period", "flow", "redetect_period", "scale", "marker_pixels", "auto_scale", "profile")},
+    }
+    results["environment"] = {
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+    print_results(results)
+    if tracker is not None:
+        print(tracker.summary())
+    if "full_dictionary" in results:
+        print(f"Restricted to IDs {args['ids']} instead of the full {args['type']}:")
+        print_comparison(results, results["full_dictionary"])
+    with open(args["output"], "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args['output']}")
+
+    if args["compare"] is not None:
+        with open(args["compare"]) as f:
+            print_comparison(results, json.load(f))
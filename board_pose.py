@@ -0,0 +1,223 @@
+"""
+This script estimates one fused pose per frame for a board of several markers with a known layout, e.g. the 4x5
+cv2.aruco.GridBoard_create calibration board or a custom landing pad.
+
+cv2.aruco.estimatePoseSingleMarkers solves an independent PnP per marker from only 4 corners, and cv2.aruco.estimatePoseBoard
+starts every frame from scratch. The BoardPoseEngine instead:
+    - Gathers the corners of all visible markers of the layout into a single cv2.solvePnP
+    - Warm-starts the solve from the pose of the previous frame (useExtrinsicGuess), which converges in a few iterations
+    - Only on re-acquisition (first frame, board lost, or a warm solve with a reprojection error above 'max_error') runs
+      cv2.solvePnPRansac over all corners, so that a misdetected marker cannot corrupt the pose, followed by a refinement on
+      the inliers. A single visible marker is solved with cv2.SOLVEPNP_IPPE instead, as RANSAC cannot reject any of its
+      4 coplanar corners.
+
+Layouts map marker IDs to their 4 object corners (top-left, top-right, bottom-right, bottom-left, as detected) in the board
+frame. They come from a cv2.aruco board (board_layout), the calibration grid (grid_layout) or a JSON file (load_layout):
+    {"markers": [{"id": 25, "center": [0, 0], "size": 60}, {"id": 3, "center": [-120, 80, 0], "size": 40}]}
+with the centres and sizes in the unit of the pose (mm in 'pose_estimation.py'), the markers lying flat in the x-y plane.
+
+Usage:
+    board = BoardPoseEngine(grid_layout(), camMatrix, distCof)
+    board_pose = board.estimate(corners, ids)   # BoardPose(rvec, tvec, markers, error, warm) or None
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import json
+import time
+from collections import namedtuple
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from arucoDict import ARUCO_DICT
+from pose_batch import BOARD_ID, compute_poses
+
+
+# Fused pose of a frame - markers are the IDs used by the solve, error the RMS reprojection error [px]
+BoardPose = namedtuple("BoardPose", ["rvec", "tvec", "markers", "error", "warm"])
+
+
+# LAYOUTS --------------------------------------------------------------------------------------------------------------
+def marker_corners(center, size):
+    """Object corners (4, 3) of a marker lying flat in the board plane, in the corner order of cv2.aruco.detectMarkers."""
+    x, y = center[0], center[1]
+    z = center[2] if len(center) > 2 else 0.0
+    half = size / 2.0
+    return np.array([[x - half, y + half, z], [x + half, y + half, z],
+                     [x + half, y - half, z], [x - half, y - half, z]], dtype=np.float32)
+
+
+def board_layout(board):
+    """Layout of a cv2.aruco board: marker ID -> object corners (4, 3)."""
+    return {int(markerID): np.asarray(points, dtype=np.float32).reshape((4, 3))
+            for markerID, points in zip(np.asarray(board.ids).flatten(), board.objPoints)}
+
+
+def grid_layout(columns=4, rows=5, markerLength=35.0, markerSeparation=5.0, dictionary="DICT_6X6_50", first_id=0):
+    """Layout of the calibration grid board (see 'camera_calibration_final/aruco_board_generation.py'), in mm."""
+    arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary])
+    return board_layout(cv2.aruco.GridBoard_create(columns, rows, markerLength, markerSeparation, arucoDict, first_id))
+
+
+def load_layout(path):
+    """Layout from a JSON file listing the id, centre and size of every marker."""
+    with open(path) as f:
+        markers = json.load(f)["markers"]
+    if not markers:
+        raise ValueError(f"Board layout {path} contains no markers")
+    return {int(marker["id"]): marker_corners(marker["center"], float(marker["size"])) for marker in markers}
+
+
+# POSE ENGINE ----------------------------------------------------------------------------------------------------------
+class BoardPoseEngine:
+    """
+    One solvePnP over the corners of all visible markers of a layout, warm-started from the previous frame.
+
+    Arguments:
+        layout              : Marker ID -> object corners (4, 3), see board_layout, grid_layout and load_layout
+        camMatrix, distCof  : Camera matrix and distortion coefficients of the detected corners
+        min_markers         : Minimum number of visible markers of the layout for a pose
+        max_error           : RMS reprojection error [px] above which a warm-started pose is rejected and re-acquired
+        ransac_error        : Inlier threshold of the RANSAC re-acquisition [px]
+        ransac_iterations   : Iterations of the RANSAC re-acquisition
+    """
+
+    def __init__(self, layout, camMatrix, distCof, min_markers=1, max_error=2.0, ransac_error=3.0, ransac_iterations=100):
+        self.layout = layout
+        self.camMatrix = camMatrix
+        self.distCof = distCof
+        self.min_markers = min_markers
+        self.max_error = max_error
+        self.ransac_error = ransac_error
+        self.ransac_iterations = ransac_iterations
+
+        self.warm_solves = 0        # Frames solved from the previous pose
+        self.reacquisitions = 0     # Frames solved from scratch (RANSAC or IPPE)
+        self.failures = 0           # Frames with markers of the layout but no acceptable pose
+        self.warm_ns = 0            # Time spent on the frames of each path
+        self.reacquire_ns = 0
+        self._rvec = None
+        self._tvec = None
+
+    def reset(self):
+        """Forget the previous pose, so that the next frame is re-acquired."""
+        self._rvec = None
+        self._tvec = None
+
+    def _points(self, corners, ids):
+        """Object and image points of the detected markers that belong to the layout."""
+        objPoints, imgPoints, markers = [], [], []
+        for markerCorners, markerID in zip(corners, ids.flatten()):
+            points = self.layout.get(int(markerID))
+            if points is not None:
+                objPoints.append(points)
+                imgPoints.append(np.asarray(markerCorners, dtype=np.float32).reshape((4, 2)))
+                markers.append(int(markerID))
+        if not markers:
+            return None, None, markers
+        return np.concatenate(objPoints), np.concatenate(imgPoints), markers
+
+    def _error(self, objPoints, imgPoints, rvec, tvec):
+        """RMS reprojection error [px]."""
+        projected, _ = cv2.projectPoints(objPoints, rvec, tvec, self.camMatrix, self.distCof)
+        return float(np.sqrt(np.mean(np.sum((projected.reshape((-1, 2)) - imgPoints) ** 2, axis=1))))
+
+    def _reacquire(self, objPoints, imgPoints, markers):
+        """Pose from scratch - RANSAC over all corners, refined on the inliers. Returns (rvec, tvec, markers) or None."""
+        if len(markers) == 1:
+            ok, rvec, tvec = cv2.solvePnP(objPoints, imgPoints, self.camMatrix, self.distCof, flags=cv2.SOLVEPNP_IPPE)
+            return (rvec, tvec, markers) if ok else None
+
+        ok, rvec, tvec, inliers = cv2.solvePnPRansac(objPoints, imgPoints, self.camMatrix, self.distCof,
+                                                     iterationsCount=self.ransac_iterations,
+                                                     reprojectionError=self.ransac_error, confidence=0.99)
+        if not ok or inliers is None or len(inliers) < 4:
+            return None
+        inliers = inliers.flatten()
+        rvec, tvec = cv2.solvePnPRefineLM(objPoints[inliers], imgPoints[inliers], self.camMatrix, self.distCof, rvec, tvec)
+
+        # Markers with all 4 corners among the inliers
+        counts = np.bincount(inliers // 4, minlength=len(markers))
+        return rvec, tvec, [markerID for markerID, count in zip(markers, counts) if count == 4]
+
+    def estimate(self, corners, ids):
+        """Fused pose of the detected markers of the layout, or None if too few of them are visible."""
+        start = time.perf_counter_ns()
+        if ids is None or len(corners) == 0:
+            self.reset()
+            return None
+        objPoints, imgPoints, markers = self._points(corners, ids)
+        if len(markers) < self.min_markers:
+            self.reset()
+            return None
+
+        # Warm start from the pose of the previous frame
+        if self._rvec is not None:
+            ok, rvec, tvec = cv2.solvePnP(objPoints, imgPoints, self.camMatrix, self.distCof, rvec=self._rvec.copy(),
+                                          tvec=self._tvec.copy(), useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE)
+            if ok:
+                error = self._error(objPoints, imgPoints, rvec, tvec)
+                if error <= self.max_error:
+                    self._rvec, self._tvec = rvec, tvec
+                    self.warm_solves += 1
+                    self.warm_ns += time.perf_counter_ns() - start
+                    return BoardPose(rvec, tvec, markers, error, True)
+
+        # Re-acquisition - first frame, board lost or warm-started pose rejected
+        result = self._reacquire(objPoints, imgPoints, markers)
+        self.reacquire_ns += time.perf_counter_ns() - start
+        if result is None or not result[2]:
+            self.failures += 1
+            self.reset()
+            return None
+        rvec, tvec, inlier_markers = result
+        self._rvec, self._tvec = rvec, tvec
+        self.reacquisitions += 1
+        inliers = np.repeat(np.isin(markers, inlier_markers), 4)
+        return BoardPose(rvec, tvec, inlier_markers, self._error(objPoints[inliers], imgPoints[inliers], rvec, tvec), False)
+
+    def poses(self, corners, ids, out=None):
+        """The fused pose as a POSE_DTYPE array of one row with id BOARD_ID, or of no rows (see 'pose_batch.py')."""
+        board_pose = self.estimate(corners, ids)
+        if board_pose is None:
+            return compute_poses(None, None, None, None, self.camMatrix, out=out)
+        return compute_poses(np.array([BOARD_ID]), None, board_pose.rvec.reshape((1, 3)), board_pose.tvec.reshape((1, 3)),
+                             self.camMatrix, out=out)
+
+    def stats(self):
+        """Warm-started vs. re-acquired frames and the mean cost of each path [ms/frame]."""
+        return {
+            "warm_solves": self.warm_solves,
+            "reacquisitions": self.reacquisitions,
+            "failures": self.failures,
+            "warm_ms": self.warm_ns / self.warm_solves / 1e6 if self.warm_solves else None,
+            "reacquire_ms": self.reacquire_ns / (self.reacquisitions + self.failures) / 1e6
+            if self.reacquisitions + self.failures else None,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        warm_ms = f"{stats['warm_ms']:.3f}" if stats["warm_ms"] is not None else "-"
+        reacquire_ms = f"{stats['reacquire_ms']:.3f}" if stats["reacquire_ms"] is not None else "-"
+        return (f"Board pose: {stats['warm_solves']} warm-started solves ({warm_ms} ms/frame), {stats['reacquisitions']} "
+                f"re-acquisitions ({reacquire_ms} ms/frame), {stats['failures']} frames without pose")
+
+
+def add_board_arguments(arg):
+    """Add the command line arguments of the board pose to an argparse.ArgumentParser."""
+    arg.add_argument("--layout", type=str, default=None,
+                     help="fuse the markers into one board pose: 'grid' for the 4x5 calibration board, or a layout .json file")
+    arg.add_argument("--board-max-error", type=float, default=2.0,
+                     help="reprojection error [px] above which the warm-started board pose is re-acquired")
+
+
+def create_board_engine(camMatrix, distCof, args):
+    """Build the BoardPoseEngine selected by the arguments of add_board_arguments, or None without --layout."""
+    if args["layout"] is None:
+        return None
+    layout = grid_layout() if args["layout"] == "grid" else load_layout(args["layout"])
+    return BoardPoseEngine(layout, camMatrix, distCof, max_error=args["board_max_error"])
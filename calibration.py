@@ -0,0 +1,82 @@
+"""
+This script loads the camera calibration (camera matrix and distortion coefficients) stored in calibration.yaml.
+
+Parsing the YAML file with yaml.FullLoader and converting its nested lists is by far the slowest part of the startup of the
+detection scripts, which are restarted on every docking attempt. The YAML file is therefore compiled once into a validated
+binary .npz cache next to it (calibration_cache/<name>.npz), together with the SHA-256 of the YAML content. Later runs only
+hash the YAML file and load the arrays from the cache; a new calibration changes the hash, so the cache is rebuilt
+automatically. PyYAML is only imported when the cache has to be (re)built.
+
+Usage:
+    camMatrix, distCof, calibration_hash = load_calibration("camera_calibration_final/calibration.yaml")
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import hashlib
+import os
+from pathlib import Path
+
+# Third-Party Imports
+import numpy as np
+
+
+def validate_calibration(camMatrix, distCof):
+    """Raise a ValueError if the camera matrix or distortion coefficients are not a usable calibration."""
+    if camMatrix.shape != (3, 3) or not np.all(np.isfinite(camMatrix)):
+        raise ValueError(f"Camera matrix must be a finite 3x3 matrix, got shape {camMatrix.shape}")
+    if camMatrix[0, 0] <= 0 or camMatrix[1, 1] <= 0 or camMatrix[2, 2] != 1:
+        raise ValueError("Camera matrix must have positive focal lengths and a last row of (0, 0, 1)")
+    if distCof.size not in (4, 5, 8, 12, 14) or not np.all(np.isfinite(distCof)):
+        raise ValueError(f"Distortion coefficients must be 4, 5, 8, 12 or 14 finite values, got {distCof.size}")
+
+
+def _compile(content):
+    """Parse the YAML content into validated (camMatrix, distCof) arrays."""
+    import yaml  # Only needed when the cache is (re)built
+
+    loadeddict = yaml.load(content, Loader=yaml.FullLoader)
+    if not isinstance(loadeddict, dict):
+        raise ValueError("Calibration file does not contain camera_matrix and dist_coeff")
+    camMatrix = np.array(loadeddict.get('camera_matrix'), dtype=np.float64)
+    distCof = np.array(loadeddict.get('dist_coeff'), dtype=np.float64).reshape((1, -1))
+    validate_calibration(camMatrix, distCof)
+    return camMatrix, distCof
+
+
+def load_calibration(calibration_path, cache_dir=None):
+    """
+    Load the camera matrix and distortion coefficients from the calibration YAML file, together with its SHA-256 hash.
+
+    Arguments:
+        calibration_path    : Path to the calibration YAML file (camera_matrix, dist_coeff)
+        cache_dir           : Directory of the compiled cache. Defaults to 'calibration_cache' next to the calibration file.
+    """
+    calibration_path = Path(calibration_path)
+    with open(calibration_path, "rb") as f:
+        content = f.read()
+    calibration_hash = hashlib.sha256(content).hexdigest()
+
+    cache_dir = Path(cache_dir) if cache_dir is not None else calibration_path.parent / "calibration_cache"
+    cache_path = cache_dir / f"{calibration_path.stem}.npz"
+    if cache_path.exists():
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                if str(data["sha256"]) == calibration_hash:
+                    camMatrix, distCof = data["camera_matrix"], data["dist_coeff"]
+                    validate_calibration(camMatrix, distCof)
+                    return camMatrix, distCof, calibration_hash
+        except (OSError, KeyError, ValueError):
+            pass  # Corrupt or outdated cache - rebuilt below
+
+    camMatrix, distCof = _compile(content)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, camera_matrix=camMatrix, dist_coeff=distCof, sha256=np.array(calibration_hash))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:  # A read-only file system only costs the YAML parsing on every start
+        print(f"Unable to write the calibration cache {cache_path}: {e}")
+    return camMatrix, distCof, calibration_hash
@@ -11,11 +11,14 @@ This script generates an ArUco board that will need to be printed out physically
 Created by: Jalen
 """
 
+# Select the formats to generate - matplotlib is only imported for the PDF
+generate_pdf = True
+generate_png = True
+
+
 # GENERATE ARUCO BOARD IN PDF FORMAT ---------------------------------------------------------------------------------------------------------------------------------
 import cv2
 from cv2 import aruco
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
 
 aruco_dict = aruco.getPredefinedDictionary( aruco.DICT_6X6_50 )
 
@@ -32,14 +35,18 @@ board = aruco.GridBoard_create(4, 5, markerLength, markerSeparation, aruco_dict)
 img = board.draw((864, 1080))
 
 # Save the image as a PDF
-pdf_path = "aruco_board.pdf"
-with PdfPages(pdf_path) as pdf:
-    plt.imshow(img, cmap='gray')
-    plt.axis('off')
-    plt.savefig(pdf, format='pdf', bbox_inches='tight')
-    plt.close()
+if generate_pdf:
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    pdf_path = "aruco_board.pdf"
+    with PdfPages(pdf_path) as pdf:
+        plt.imshow(img, cmap='gray')
+        plt.axis('off')
+        plt.savefig(pdf, format='pdf', bbox_inches='tight')
+        plt.close()
 
-print(f"ArUco board image saved as {pdf_path}")
+    print(f"ArUco board image saved as {pdf_path}")
 
 
 # GENERATE ARUCO BOARD IN PNG FORMAT ---------------------------------------------------------------------------------------------------------------------------------
@@ -58,9 +65,10 @@ board = aruco.GridBoard_create(4, 5, 3.75, 0.5, aruco_dict)
 img = board.draw((864, 1080))  # You can adjust the size here
 
 # Save the image in a format of your choice (e.g., PNG)
-image_path = "aruco_board.png"
-cv2.imwrite(image_path, img)
+if generate_png:
+    image_path = "aruco_board.png"
+    cv2.imwrite(image_path, img)
 
-print(f"ArUco board image saved as {image_path}")
+    print(f"ArUco board image saved as {image_path}")
 
 
@@ -14,42 +14,80 @@ This script performs camera calibration using ArUco markers on a board. Here are
 
 There are in total two functions of this code:
     a) Camera Calibration (if calibrate_camera is True):
+        - The markers of the calibration images are detected in parallel by a streaming pipeline (see 'marker_extraction.py').
+        - The detections are cached per image, so that adding a few images to the calibration data only detects those images.
+        - An informative subset of the images is selected - near-duplicate board angles are dropped and the images are chosen
+          greedily until they cover the image area and board poses of all images (see 'frame_selection.py'). The
+          reprojection error over all images is reported for the calibration with the subset and, if
+          compare_full_calibration is True, for the calibration with all images.
         - The camera matrix and distortion coefficients will be calculated and stored in the YAML file.
 
     b) Real-time Validation (if calibrate_camera is False)
         - The real-time validation assumes a calibration has been performed and the calibration data is stored in calibration.yaml. 
+        - The frames are captured grayscale-first as YUV420, and the markers are detected on the Y plane without any colour
+          conversion; only the displayed frame is converted to colour (see 'frame_source.py').
+        - The frames are undistorted with remap tables that are built once and cached on disk (see 'undistortion.py'),
+          or only the detected corners are undistorted if undistort_corners_only is True.
         - The pose of the ArUco marker board is estimated, and the result is visualized with markers and coordinate axes.
+          The board pose is one solvePnP over the corners of all visible markers, warm-started from the previous frame
+          (see 'board_pose.py').
         - This validation piece of code still has issues, hence a separate 'pose_estimation.py' code has been constructed to carry out similar purposes.
 
 Created by: Jalen
 """
 
 # Imports
+import sys
 import time
 import cv2
 from cv2 import aruco
-import yaml
 import numpy as np
 from pathlib import Path
-from tqdm import tqdm
-import picamera
-import picamera.array
+# tqdm and PyYAML (calibration) are imported in the branch that uses them, picamera by the frame source when it starts
 
 
 # Root directory of repo for relative path specification.
 root = Path(__file__).parent.absolute()
 
+# Make the shared modules in the project root importable
+sys.path.append(str(root.parent))
+from undistortion import Undistorter
+from marker_extraction import DetectionCache, extract_markers
+from frame_selection import reprojection_error, select_views
+from board_pose import BoardPoseEngine, board_layout
+from frame_source import PiCameraSource, to_bgr
+
 # Set this flsg True for calibrating camera and False for validating results real time
 calibrate_camera = True
 
+# Real-time validation: False for single markers (trial 1), True for the whole ArUco board (trial 2)
+validate_board = False
+
+# Only undistort the detected marker corners instead of the whole frame during real-time validation
+undistort_corners_only = False
+
 # Set path to the images
 calib_imgs_path = root.joinpath("aruco_calibration_data")
 
+# Number of processes detecting the calibration images (None = one per CPU core)
+calibration_workers = None
+
+# Cache the detections of every calibration image, so that a rerun only detects new or changed images
+use_detection_cache = True
+
+# Calibrate on an informative subset of the images, covering this fraction of the image area and board poses of all images
+select_frames = True
+coverage_target = 0.95
+
+# Also calibrate on all images, to compare the reprojection error with and without the subset (slower)
+compare_full_calibration = True
+
 
 
 # DEFINING ARUCO BOARD PARAMETERS ----------------------------------------------------------------------------------------------------------
 # For validating results, show aruco board to camera.
-aruco_dict = aruco.getPredefinedDictionary( aruco.DICT_6X6_50 )
+aruco_dict_id = aruco.DICT_6X6_50
+aruco_dict = aruco.getPredefinedDictionary( aruco_dict_id )
 
 #Provide length of the marker's side
 markerLength = 3.50  # Here, measurement unit is centimetre.
@@ -72,35 +110,47 @@ arucoParams = aruco.DetectorParameters_create()
 # CAMERA CALIBRATION ----------------------------------------------------------------------------------------------------------
 # To generate the camera matrix and distortion coefficients
 if calibrate_camera == True:
-    img_list = []
-    calib_fnms = calib_imgs_path.glob('*.jpg')
-    print('Using ...', end='')
-    for idx, fn in enumerate(calib_fnms):
-        print(idx, '', end='')
-        img = cv2.imread( str(root.joinpath(fn) ))
-        img_list.append( img )
-        h, w, c = img.shape
-    print('Calibration images')
-
-    counter, corners_list, id_list = [], [], []
-    first = True
-    for im in tqdm(img_list):
-        img_gray = cv2.cvtColor(im,cv2.COLOR_RGB2GRAY)
-        corners, ids, rejectedImgPoints = aruco.detectMarkers(img_gray, aruco_dict, parameters=arucoParams)
-        if first == True:
-            corners_list = corners
-            id_list = ids
-            first = False
-        else:
-            corners_list = np.vstack((corners_list, corners))
-            id_list = np.vstack((id_list,ids))
-        counter.append(len(ids))
-    print('Found {} unique markers'.format(np.unique(ids)))
-
-    counter = np.array(counter)
+    import yaml
+    from tqdm import tqdm
+
+    calib_fnms = sorted(calib_imgs_path.glob('*.jpg'))
+    print('Using {} calibration images'.format(len(calib_fnms)))
+
+    # Detection cache, invalidated whenever the dictionary, board geometry or detector parameters change
+    cache = None
+    if use_detection_cache:
+        board_geometry = {"size": [4, 5], "markerLength": markerLength, "markerSeparation": markerSeparation}
+        cache = DetectionCache(root.joinpath("detection_cache"), aruco_dict_id, arucoParams, board_geometry)
+
+    # Decode and detect the images in a process pool, with a bounded number of images in memory (see 'marker_extraction.py')
+    corners_list, id_list, counter, image_size, _ = extract_markers(
+        calib_fnms, aruco_dict_id, arucoParams, board.ids, workers=calibration_workers, progress=tqdm, cache=cache
+    )
+    if cache is not None:
+        print('{} images served from the detection cache, {} images detected'.format(cache.hits, cache.misses))
+    print('Found {} unique markers'.format(np.unique(id_list)))
+
+    # Informative subset of the images (see 'frame_selection.py')
+    layout = board_layout(board)
+    if select_frames:
+        selection = select_views(corners_list, id_list, counter, layout, image_size, coverage_target=coverage_target)
+        print(selection.summary())
+        calib_corners, calib_ids, calib_counter = selection.subset(corners_list, id_list, counter)
+    else:
+        calib_corners, calib_ids, calib_counter = corners_list, id_list, counter
+
     print ("Calibrating camera .... Please wait...")
     #mat = np.zeros((3,3), float)
-    ret, mtx, dist, rvecs, tvecs = aruco.calibrateCameraAruco(corners_list, id_list, counter, board, img_gray.shape, None, None )
+    start = time.perf_counter()
+    ret, mtx, dist, rvecs, tvecs = aruco.calibrateCameraAruco(calib_corners, calib_ids, calib_counter, board, image_size, None, None )
+    print('Calibrated on {} images in {:.1f} s, reprojection error over all images: {:.3f} px'.format(
+        len(calib_counter), time.perf_counter() - start, reprojection_error(corners_list, id_list, counter, layout, mtx, dist)))
+
+    if select_frames and compare_full_calibration:
+        start = time.perf_counter()
+        _, full_mtx, full_dist, _, _ = aruco.calibrateCameraAruco(corners_list, id_list, counter, board, image_size, None, None)
+        print('Calibrated on all {} images in {:.1f} s, reprojection error over all images: {:.3f} px'.format(
+            len(counter), time.perf_counter() - start, reprojection_error(corners_list, id_list, counter, layout, full_mtx, full_dist)))
 
     # Save the camera matrix and distortion coefficients to a YAML file (calibration.yaml).
     print("Camera matrix is \n", mtx, "\n And is stored in calibration.yaml file along with distortion coefficients : \n", dist)
@@ -112,44 +162,41 @@ if calibrate_camera == True:
 
 
 # REAL TIME VALIDATION (TRIAL 1) ----------------------------------------------------------------------------------------------------------
-else:
+elif not validate_board:
+    # Undistortion with remap tables built once per (calibration, resolution, alpha) - see 'undistortion.py'
+    undistorter = Undistorter(root.joinpath("calibration.yaml"), alpha=1)
 
-    # Load the camera matrix and distortion coefficients from YAML file
-    with open('calibration.yaml') as f:
-        loadeddict = yaml.load(f, Loader=yaml.FullLoader)
-    mtx = loadeddict.get('camera_matrix')
-    dist = loadeddict.get('dist_coeff')
-    mtx = np.array(mtx)
-    dist = np.array(dist)
-
-    with picamera.PiCamera() as camera:
-    time.sleep(2)  # Allow camera to warm up
-    camera.resolution = (500, 500)  # Set camera resolution
-    camera.framerate = 30  # Set camera framerate
+    # Grayscale-first capture - frame.image is the Y plane of the YUV420 frame (500 x 500 at 30 fps, camera warm-up included)
+    with PiCameraSource(resolution=(500, 500), framerate=30, rotation=0, format="yuv") as source:
 
         last_print_time = time.time()
 
         # Capture frames continuously
-        for frame in camera.capture_continuous(picamera.array.PiRGBArray(camera)):
-            img = frame.array
-            img_gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        for frame in source:
+            img_gray = frame.image
             h, w = img_gray.shape[:2]
-            newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w, h), 1, (w, h))
+            newcameramtx = undistorter.new_camera_matrix((w, h))
 
-            img_aruco = img
+            # Colour frame for the display, converted from the YUV420 frame
+            img_aruco = to_bgr(img_gray)
 
-            # Undistort image
-            dst = cv2.undistort(img_gray, mtx, dist, None, newcameramtx)
-            corners, ids, _ = aruco.detectMarkers(dst, aruco.getPredefinedDictionary(aruco.DICT_6X6_250))
+            if undistort_corners_only:
+                # Detect on the distorted image and only undistort the detected corners
+                corners, ids, _ = aruco.detectMarkers(img_gray, aruco.getPredefinedDictionary(aruco.DICT_6X6_250))
+                corners = undistorter.undistort_points(corners, (w, h))
+            else:
+                # Undistort image - a single remap with the cached tables
+                dst = undistorter.undistort(img_gray)
+                corners, ids, _ = aruco.detectMarkers(dst, aruco.getPredefinedDictionary(aruco.DICT_6X6_250))
 
-            if corners is not None:
-                # Estimate pose
-                rvec, tvec, _ = aruco.estimatePoseSingleMarkers(corners, 60, newcameramtx, dist)
+            if ids is not None:
+                # Estimate pose (the corners are undistorted, hence the zero distortion coefficients)
+                rvec, tvec, _ = aruco.estimatePoseSingleMarkers(corners, 60, newcameramtx, undistorter.zero_distortion)
 
                 # Draw axis and markers
                 img_aruco = aruco.drawDetectedMarkers(img_aruco, corners, ids, (0, 255, 0))
                 for i in range(len(ids)):
-                    img_aruco = aruco.drawAxis(img_aruco, newcameramtx, dist, rvec[i], tvec[i], 100)
+                    img_aruco = aruco.drawAxis(img_aruco, newcameramtx, undistorter.zero_distortion, rvec[i], tvec[i], 100)
 
                 # Print relative distance values every 2 seconds
                 current_time = time.time()
@@ -171,44 +218,44 @@ else:
 
 # REAL TIME VALIDATION (TRIAL 2) ----------------------------------------------------------------------------------------------------------
 else:
-    with picamera.PiCamera() as camera:
-    camera.resolution = (500, 500)  # Set camera resolution
-    camera.framerate = 30  # Set camera framerate
-    time.sleep(2)  # Allow camera to warm up
-
-    # Load the camera matrix and distortion coefficients from YAML file
-    with open('calibration.yaml') as f:
-        loadeddict = yaml.load(f, Loader=yaml.FullLoader)
-    mtx = loadeddict.get('camera_matrix')
-    dist = loadeddict.get('dist_coeff')
-    mtx = np.array(mtx)
-    dist = np.array(dist)
-
-    count = 0
-    last_print_time = time.time()
-    for _ in camera.capture_continuous(picamera.array.PiRGBArray(camera)):
-        # Read a frame from the camera
-        frame = camera.array
-
-        # Check if the frame is not None
-        if frame is not None:
-            # Print the shape of the frame for debugging
-            print(frame.shape)
-
-            # Detect ArUco markers in undistorted frames
-            im_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-            h, w = im_gray.shape[:2]
-            newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w, h), 1, (w, h))
-            dst = cv2.undistort(im_gray, mtx, dist, None, newcameramtx)
-            corners, ids, rejectedImgPoints = aruco.detectMarkers(dst, aruco_dict)
-
-            if corners is not None:
-                # ret, rvec, tvec = aruco.estimatePoseBoard(corners, ids, board, newcameramtx, dist)  # For a board
-                ret, rvec, tvec = aruco.estimatePoseBoard(corners, ids, board, newcameramtx, dist, rvec=None, tvec=None)
-
-                if ret != 0:
+    # Undistortion with remap tables built once per (calibration, resolution, alpha) - see 'undistortion.py'
+    undistorter = Undistorter(root.joinpath("calibration.yaml"), alpha=1)
+
+    # Grayscale-first capture - capture.image is the Y plane of the YUV420 frame (500 x 500 at 30 fps)
+    with PiCameraSource(resolution=(500, 500), framerate=30, rotation=0, format="yuv") as source:
+
+        count = 0
+        last_print_time = time.time()
+        board_engine = None  # Created on the first frame, once the camera matrix of the frame size is known
+        for capture in source:
+            # Read a frame from the camera
+            im_gray = capture.image
+            frame = to_bgr(im_gray)  # Colour frame for the display
+
+            # Check if the frame is not None
+            if frame is not None:
+                # Print the shape of the frame for debugging
+                print(frame.shape)
+
+                # Detect ArUco markers in undistorted frames
+                h, w = im_gray.shape[:2]
+                newcameramtx = undistorter.new_camera_matrix((w, h))
+                if undistort_corners_only:
+                    corners, ids, rejectedImgPoints = aruco.detectMarkers(im_gray, aruco_dict)
+                    corners = undistorter.undistort_points(corners, (w, h))
+                else:
+                    dst = undistorter.undistort(im_gray)
+                    corners, ids, rejectedImgPoints = aruco.detectMarkers(dst, aruco_dict)
+
+                if board_engine is None:
+                    board_engine = BoardPoseEngine(board_layout(board), newcameramtx, undistorter.zero_distortion)
+
+                # Fused board pose, warm-started from the previous frame (replaces a cold aruco.estimatePoseBoard per frame)
+                board_pose = board_engine.estimate(corners, ids)
+                if board_pose is not None:
+                    rvec, tvec = board_pose.rvec, board_pose.tvec
                     frame = aruco.drawDetectedMarkers(frame, corners, ids, (0, 255, 0))
-                    frame = aruco.drawAxis(frame, newcameramtx, dist, rvec, tvec, 10)  # axis length 100 can be changed
+                    frame = aruco.drawAxis(frame, newcameramtx, undistorter.zero_distortion, rvec, tvec, 10)  # axis length 100 can be changed
 
                     # Print relative distance values every 2 seconds
                     current_time = time.time()
@@ -218,12 +265,12 @@ else:
                         print("-----------------------------")
                         last_print_time = current_time
 
-            # Display the current frame
-            cv2.imshow("img", frame)
+                # Display the current frame
+                cv2.imshow("img", frame)
 
-        # If 'q' key is pressed, exit the loop
-        if cv2.waitKey(0) & 0xFF == ord('q'):
-            break
+            # If 'q' key is pressed, exit the loop
+            if cv2.waitKey(0) & 0xFF == ord('q'):
+                break
 
     # Close the OpenCV window
-    cv2.destroyAllWindows()
\ No newline at end of file
+    cv2.destroyAllWindows()
@@ -0,0 +1,220 @@
+"""
+CAMERA CALIBRATION - FRAME SELECTION
+
+This script selects an informative subset of the calibration images for 'camera_calibration.py', between the marker extraction
+(see 'marker_extraction.py') and aruco.calibrateCameraAruco, whose runtime grows with the number of images while many of the
+images taken with 'data_generation.py' show the board at nearly the same angle.
+
+Every image (view) is described by:
+    - Marker count  : Number of detected board markers
+    - Coverage      : Cells of a coarse grid over the image that contain detected corners - the distortion coefficients are only
+                      constrained where the corners are
+    - Pose bin      : Tilt (angle between the board normal and the optical axis), tilt direction and apparent board size,
+                      binned. The pose is solved with an approximate camera matrix, which is accurate enough for the bins
+
+The selection then:
+    1) Drops near-duplicates - views with nearly the same board normal, board centre and board size - keeping the view with
+       the most markers
+    2) Greedily adds the view with the largest gain (newly covered grid cells, a new pose bin, marker count), until the
+       selected views cover 'coverage_target' of the grid cells and pose bins covered by all images, with at least
+       'min_views' views (and at most 'max_views')
+
+reprojection_error() evaluates a calibration on any set of views (e.g. all the images), so that calibrations with and without
+the subset can be compared on the same data.
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Make the shared modules in the project root importable
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+from board_pose import board_layout
+
+
+# Features of one view - cells is the boolean coverage grid (flattened), pose_bin None if no pose could be solved
+ViewFeatures = namedtuple("ViewFeatures", ["markers", "cells", "pose_bin", "normal", "centroid", "area"])
+
+TILT_EDGES = np.radians([10.0, 25.0, 40.0])     # Tilt bins - below the first edge the tilt direction is not binned
+AZIMUTH_SECTORS = 8                             # Tilt direction bins
+AREA_EDGES = (0.1, 0.3)                         # Apparent board size bins, as a fraction of the image area
+
+
+# VIEW FEATURES --------------------------------------------------------------------------------------------------------
+def split_views(corners_list, id_list, counter):
+    """Per-image (corners (N, 1, 4, 2), ids (N, 1)) of the stacked output of extract_markers."""
+    bounds = np.concatenate([[0], np.cumsum(counter)])
+    return [(corners_list[start:end], id_list[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def view_points(corners, ids, layout):
+    """Object points (M, 3) and image points (M, 2) of the markers of a view that belong to the board layout."""
+    objPoints, imgPoints = [], []
+    for markerCorners, markerID in zip(corners, ids.flatten()):
+        points = layout.get(int(markerID))
+        if points is not None:
+            objPoints.append(points)
+            imgPoints.append(markerCorners.reshape((4, 2)))
+    if not objPoints:
+        return np.empty((0, 3), dtype=np.float32), np.empty((0, 2), dtype=np.float32)
+    return np.concatenate(objPoints).astype(np.float32), np.concatenate(imgPoints).astype(np.float32)
+
+
+def approximate_camera_matrix(image_size):
+    """Camera matrix of a typical camera module (~60° horizontal field of view), centred on the image."""
+    w, h = image_size
+    f = 0.9 * max(w, h)
+    return np.array([[f, 0, w / 2.0], [0, f, h / 2.0], [0, 0, 1]], dtype=np.float64)
+
+
+def view_features(corners, ids, layout, image_size, grid=(8, 6), camMatrix=None):
+    """Marker count, coverage grid and pose bin of a view."""
+    w, h = image_size
+    points = corners.reshape((-1, 2))
+    columns = np.clip((points[:, 0] / w * grid[0]).astype(int), 0, grid[0] - 1)
+    rows = np.clip((points[:, 1] / h * grid[1]).astype(int), 0, grid[1] - 1)
+    cells = np.zeros(grid[0] * grid[1], dtype=bool)
+    cells[rows * grid[0] + columns] = True
+    centroid = points.mean(axis=0) / np.array([w, h]) if len(points) else np.full(2, 0.5)
+    area = cv2.contourArea(cv2.convexHull(points.astype(np.float32))) / (w * h) if len(points) >= 3 else 0.0
+
+    objPoints, imgPoints = view_points(corners, ids, layout)
+    if len(objPoints) < 4:
+        return ViewFeatures(len(ids), cells, None, None, centroid, area)
+    camMatrix = approximate_camera_matrix(image_size) if camMatrix is None else camMatrix
+    ok, rvec, tvec = cv2.solvePnP(objPoints, imgPoints, camMatrix, None, flags=cv2.SOLVEPNP_IPPE)
+    if not ok:
+        return ViewFeatures(len(ids), cells, None, None, centroid, area)
+
+    # Board normal in the camera frame, pointing towards the camera
+    normal = cv2.Rodrigues(rvec)[0][:, 2]
+    normal = -normal if normal[2] > 0 else normal
+    tilt = np.arccos(min(abs(normal[2]), 1.0))
+    tilt_bin = int(np.searchsorted(TILT_EDGES, tilt))
+    azimuth = np.arctan2(normal[1], normal[0]) % (2 * np.pi)
+    azimuth_bin = int(azimuth / (2 * np.pi) * AZIMUTH_SECTORS) % AZIMUTH_SECTORS if tilt_bin else 0
+    area_bin = int(np.searchsorted(AREA_EDGES, area))
+    return ViewFeatures(len(ids), cells, (tilt_bin, azimuth_bin, area_bin), normal, centroid, area)
+
+
+# SELECTION ------------------------------------------------------------------------------------------------------------
+def find_duplicates(features, max_angle=np.radians(3.0), max_shift=0.03, max_area_change=0.1):
+    """
+    Near-duplicate views - {dropped view: kept view}. Two views are near-duplicates if their board normals differ by less
+    than max_angle, their board centres by less than max_shift of the image, and their board sizes by less than
+    max_area_change (relative). Of a group of near-duplicates, the view with the most markers is kept.
+    """
+    order = sorted(range(len(features)), key=lambda i: -features[i].markers)
+    kept, duplicates = [], {}
+    for index in order:
+        view = features[index]
+        for other in kept:
+            reference = features[other]
+            if view.normal is None or reference.normal is None:
+                continue
+            angle = np.arccos(np.clip(np.dot(view.normal, reference.normal), -1.0, 1.0))
+            shift = np.linalg.norm(view.centroid - reference.centroid)
+            area_change = abs(view.area - reference.area) / max(reference.area, 1e-9)
+            if angle < max_angle and shift < max_shift and area_change < max_area_change:
+                duplicates[index] = other
+                break
+        else:
+            kept.append(index)
+    return duplicates
+
+
+class FrameSelection:
+    """
+    Greedy selection of informative calibration views.
+
+    Arguments:
+        features            : ViewFeatures of every view (see view_features)
+        board_markers       : Number of markers of the board, to normalize the marker count
+        coverage_target     : Fraction of the grid cells and pose bins covered by all views that the subset must cover
+        min_views           : Minimum number of selected views
+        max_views           : Maximum number of selected views (None for no limit)
+        pose_weight         : Gain of a view that adds a new pose bin, relative to covering all grid cells at once
+        marker_weight       : Gain of a view showing every marker of the board
+    """
+
+    def __init__(self, features, board_markers, coverage_target=0.95, min_views=10, max_views=None, pose_weight=0.5,
+                 marker_weight=0.1):
+        self.features = features
+        self.duplicates = find_duplicates(features)
+
+        all_cells = np.any([f.cells for f in features], axis=0) if features else np.zeros(0, dtype=bool)
+        all_bins = {f.pose_bin for f in features if f.pose_bin is not None}
+        cells_target = int(np.ceil(coverage_target * all_cells.sum()))
+        bins_target = int(np.ceil(coverage_target * len(all_bins)))
+        cells_total = max(int(all_cells.sum()), 1)
+
+        candidates = [i for i in range(len(features)) if i not in self.duplicates]
+        covered = np.zeros_like(all_cells)
+        bins = set()
+        self.selected = []
+        self.gains = []
+        while candidates:
+            done = covered.sum() >= cells_target and len(bins) >= bins_target
+            if (done and len(self.selected) >= min_views) or (max_views is not None and len(self.selected) >= max_views):
+                break
+            gains = [np.count_nonzero(features[i].cells & ~covered) / cells_total
+                     + (pose_weight if features[i].pose_bin is not None and features[i].pose_bin not in bins else 0.0)
+                     + marker_weight * features[i].markers / board_markers for i in candidates]
+            best = int(np.argmax(gains))
+            index = candidates.pop(best)
+            self.selected.append(index)
+            self.gains.append(gains[best])
+            covered |= features[index].cells
+            if features[index].pose_bin is not None:
+                bins.add(features[index].pose_bin)
+        self.selected.sort()
+
+        self.cell_coverage = covered.sum() / cells_total
+        self.pose_coverage = len(bins) / len(all_bins) if all_bins else 1.0
+
+    def subset(self, corners_list, id_list, counter):
+        """corners, ids and counter of the selected views, for aruco.calibrateCameraAruco."""
+        views = split_views(corners_list, id_list, counter)
+        corners = [views[i][0] for i in self.selected]
+        ids = [views[i][1] for i in self.selected]
+        return (np.concatenate(corners), np.concatenate(ids),
+                np.asarray([counter[i] for i in self.selected], dtype=counter.dtype))
+
+    def summary(self):
+        return (f"Selected {len(self.selected)} of {len(self.features)} images ({len(self.duplicates)} near-duplicates "
+                f"dropped), covering {self.cell_coverage:.0%} of the image grid and {self.pose_coverage:.0%} of the board "
+                f"poses of all images")
+
+
+def select_views(corners_list, id_list, counter, layout, image_size, **kwargs):
+    """FrameSelection of the stacked output of extract_markers (see FrameSelection for the keyword arguments)."""
+    features = [view_features(corners, ids, layout, image_size) for corners, ids in split_views(corners_list, id_list, counter)]
+    return FrameSelection(features, len(layout), **kwargs)
+
+
+# EVALUATION -----------------------------------------------------------------------------------------------------------
+def reprojection_error(corners_list, id_list, counter, layout, camMatrix, distCof):
+    """
+    RMS reprojection error [px] of a calibration over the given views - the board pose of every view is solved with the
+    calibration, then its corners are reprojected.
+    """
+    squared, points = 0.0, 0
+    for corners, ids in split_views(corners_list, id_list, counter):
+        objPoints, imgPoints = view_points(corners, ids, layout)
+        if len(objPoints) < 4:
+            continue
+        ok, rvec, tvec = cv2.solvePnP(objPoints, imgPoints, camMatrix, distCof, flags=cv2.SOLVEPNP_IPPE)
+        if not ok:
+            continue
+        rvec, tvec = cv2.solvePnPRefineLM(objPoints, imgPoints, camMatrix, distCof, rvec, tvec)
+        projected, _ = cv2.projectPoints(objPoints, rvec, tvec, camMatrix, distCof)
+        squared += float(np.sum((projected.reshape((-1, 2)) - imgPoints) ** 2))
+        points += len(objPoints)
+    return float(np.sqrt(squared / points)) if points else float("nan")
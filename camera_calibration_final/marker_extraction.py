@@ -0,0 +1,254 @@
+"""
+CAMERA CALIBRATION - MARKER EXTRACTION
+
+This script extracts the ArUco markers from the calibration images for 'camera_calibration.py' as a streaming pipeline:
+    a) The images are decoded (directly as grayscale) and detected in a process pool.
+    b) The number of images in flight is bounded, so only a few images are held in memory at any time and the peak memory is
+       independent of the number of calibration images.
+    c) The detections are written, in image order, into arrays preallocated for the maximum number of board markers per
+       image, and trimmed once at the end - instead of growing the arrays with np.vstack for every image.
+
+The returned corners, ids and counter can be passed straight to aruco.calibrateCameraAruco.
+
+Detection cache:
+    The detections of every image (corners, ids, image size) can be cached on disk, keyed by the SHA-256 of the image file
+    content. A rerun of the calibration then only decodes and detects new or changed images. The cache is stored under a
+    fingerprint of the dictionary, the board geometry and the DetectorParameters, so changing any of them automatically
+    invalidates (and removes) the previous cache entries.
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+# Third-Party Imports
+import cv2
+from cv2 import aruco
+import numpy as np
+
+# Make the shared modules in the project root importable
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+from aruco_detector import detector_params_from_dict, detector_params_to_dict
+
+
+# WORKER ---------------------------------------------------------------------------------------------------------------
+# Dictionary and detector parameters of the worker process - OpenCV objects cannot be pickled, so each worker builds its own
+_worker = {}
+
+
+def _load_detector(dictionary_id, params):
+    _worker["dictionary"] = aruco.getPredefinedDictionary(dictionary_id)
+    _worker["params"] = detector_params_from_dict(params)
+
+
+def _init_worker(dictionary_id, params):
+    # Pool workers only - in the calibrating process itself, this would leave calibrateCameraAruco single-threaded
+    cv2.setNumThreads(1)  # The parallelism comes from the process pool
+    _load_detector(dictionary_id, params)
+
+
+def detect_image(path):
+    """
+    Decode one calibration image as grayscale and detect its markers.
+    Returns (path, corners (N, 1, 4, 2), ids (N, 1), image size (w, h)), with corners/ids/size None if the image is unreadable.
+    """
+    img_gray = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    if img_gray is None:
+        return str(path), None, None, None
+
+    corners, ids, _ = aruco.detectMarkers(img_gray, _worker["dictionary"], parameters=_worker["params"])
+    if ids is None:
+        corners = np.empty((0, 1, 4, 2), dtype=np.float32)
+        ids = np.empty((0, 1), dtype=np.int32)
+    h, w = img_gray.shape
+    return str(path), np.asarray(corners, dtype=np.float32).reshape((-1, 1, 4, 2)), ids.astype(np.int32).reshape((-1, 1)), (w, h)
+
+
+# STREAMING PIPELINE ---------------------------------------------------------------------------------------------------
+def iter_detections(paths, dictionary_id, arucoParams, workers=None, max_in_flight=None):
+    """
+    Yield the detect_image() results of all paths in input order, with at most max_in_flight images being processed or
+    waiting to be yielded at any time. workers=1 runs everything in the current process.
+    """
+    params = detector_params_to_dict(arucoParams)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+
+    if workers == 1:
+        _load_detector(dictionary_id, params)
+        for path in paths:
+            yield detect_image(path)
+        return
+
+    # The pool is forked explicitly, as the calibration script has no __main__ guard and must not be re-imported by the workers
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+
+    paths = iter(paths)
+    pending, finished = {}, {}
+    submitted = next_index = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(dictionary_id, params)) as executor:
+
+        def refill():
+            nonlocal submitted
+            while len(pending) + len(finished) < max_in_flight:
+                path = next(paths, None)
+                if path is None:
+                    return
+                pending[executor.submit(detect_image, path)] = submitted
+                submitted += 1
+
+        refill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[pending.pop(future)] = future.result()
+
+            # Reorder buffer - results are yielded in input order
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+            refill()
+
+
+# DETECTION CACHE ------------------------------------------------------------------------------------------------------
+def file_hash(path):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    On-disk cache of per-image detection results.
+
+    Arguments:
+        cache_dir       : Root directory of the cache
+        dictionary_id   : Predefined dictionary of the board
+        arucoParams     : cv2.aruco.DetectorParameters used for the detection
+        board           : Board geometry, e.g. {"size": (4, 5), "markerLength": 3.5, "markerSeparation": 0.5}
+    """
+
+    def __init__(self, cache_dir, dictionary_id, arucoParams, board):
+        config = {
+            "dictionary": int(dictionary_id),
+            "board": board,
+            "params": detector_params_to_dict(arucoParams),
+            "opencv": cv2.__version__,
+        }
+        self.fingerprint = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+        self.root = Path(cache_dir)
+        self.directory = self.root / self.fingerprint
+        self.hits = self.misses = 0
+        self._invalidate_stale()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _invalidate_stale(self):
+        """Remove the entries of any other dictionary/board/parameter configuration."""
+        if not self.root.exists():
+            return
+        for entry in self.root.iterdir():
+            if entry.is_dir() and entry.name != self.fingerprint:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def _path(self, content_hash):
+        return self.directory / f"{content_hash}.npz"
+
+    def load(self, content_hash):
+        """Cached (corners, ids, image size) of an image, or None if it has not been cached."""
+        path = self._path(content_hash)
+        if not path.exists():
+            self.misses += 1
+            return None
+        with np.load(path) as data:
+            self.hits += 1
+            return data["corners"], data["ids"], tuple(int(v) for v in data["image_size"])
+
+    def store(self, content_hash, corners, ids, image_size):
+        path = self._path(content_hash)
+        tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, corners=corners, ids=ids, image_size=np.asarray(image_size, dtype=np.int32))
+        os.replace(tmp_path, path)
+
+
+def iter_cached_detections(paths, dictionary_id, arucoParams, cache, workers=None, max_in_flight=None):
+    """Same as iter_detections, but only new or changed images are detected - the others are served from the cache."""
+    paths = [str(p) for p in paths]
+    hashes = [file_hash(p) for p in paths]
+    cached = [cache.load(h) for h in hashes]
+    misses = [p for p, c in zip(paths, cached) if c is None]
+
+    detections = iter_detections(misses, dictionary_id, arucoParams, workers, max_in_flight)
+    for path, content_hash, result in zip(paths, hashes, cached):
+        if result is not None:
+            yield (path,) + result
+            continue
+        path, corners, ids, size = next(detections)
+        if ids is not None:
+            cache.store(content_hash, corners, ids, size)
+        yield path, corners, ids, size
+
+
+def extract_markers(paths, dictionary_id, arucoParams, board_ids, workers=None, max_in_flight=None, progress=None,
+                    cache=None):
+    """
+    Detect the board markers of all calibration images.
+
+    Arguments:
+        paths           : Calibration image paths
+        dictionary_id   : Predefined dictionary of the board, e.g. aruco.DICT_6X6_50
+        arucoParams     : cv2.aruco.DetectorParameters
+        board_ids       : Marker IDs of the board - other detections are discarded
+        progress        : Optional wrapper around the result iterator, e.g. tqdm
+        cache           : Optional DetectionCache, so that only new or changed images are detected
+
+    Returns (corners (N, 1, 4, 2), ids (N, 1), counter (markers per image), image size (w, h), used image paths). Images
+    without any board marker are skipped.
+    """
+    paths = list(paths)
+    board_ids = np.asarray(board_ids, dtype=np.int32).flatten()
+    capacity = len(paths) * len(board_ids)
+    corners_list = np.empty((capacity, 1, 4, 2), dtype=np.float32)
+    id_list = np.empty((capacity, 1), dtype=np.int32)
+    counter = np.empty(len(paths), dtype=np.int32)
+
+    total = images = 0
+    image_size = None
+    used_paths = []
+    if cache is not None:
+        results = iter_cached_detections(paths, dictionary_id, arucoParams, cache, workers, max_in_flight)
+    else:
+        results = iter_detections(paths, dictionary_id, arucoParams, workers, max_in_flight)
+    for path, corners, ids, size in (progress(results, total=len(paths)) if progress is not None else results):
+        if ids is None:
+            print(f"Unable to read {path}, skipped")
+            continue
+        if image_size is not None and size != image_size:
+            raise ValueError(f"{path} has size {size}, while the previous calibration images have size {image_size}")
+        image_size = size
+
+        keep = np.isin(ids.flatten(), board_ids)
+        count = int(keep.sum())
+        if count == 0:
+            continue
+        corners_list[total:total + count] = corners[keep]
+        id_list[total:total + count] = ids[keep]
+        counter[images] = count
+        used_paths.append(path)
+        total += count
+        images += 1
+
+    return corners_list[:total], id_list[:total], counter[:images], image_size, used_paths
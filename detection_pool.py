@@ -0,0 +1,195 @@
+"""
+This script provides a multi-process detection pipeline, to use all cores of the Raspberry Pi for the detection.
+
+Frames are numbered in dispatch order and sent to N worker processes, each with its own ArUco dictionary and detector
+parameters (OpenCV objects cannot be shared between processes). The workers run cv2.aruco.detectMarkers and
+cv2.aruco.estimatePoseSingleMarkers, and a reorder stage emits the results in capture order.
+
+Policies:
+    - when_full     : What submit() does when max_in_flight frames are already being processed - "drop" the new frame
+                      (live cameras, keeps latency bounded) or "block" until fewer than max_in_flight frames are being
+                      processed (recorded frames, no loss)
+    - stale_after   : If the oldest outstanding frame has been in flight for longer than this many seconds while later frames
+                      are already finished, it is skipped so that one slow frame does not hold back the output.
+                      None always waits, so every submitted frame is emitted.
+
+Usage:
+    with DetectionPool("DICT_6X6_50", arucoParams, camMatrix, distCof, MARKER_SIZE, workers=4) as pool:
+        for frame in source:
+            pool.submit(frame.seq, frame.timestamp, gray_frame)
+            for result in pool.results():
+                ...
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from arucoDict import get_dictionary
+from aruco_detector import detect_markers, detector_params_from_dict, detector_params_to_dict
+
+
+# Result of one frame: capture sequence number and timestamp, detections and poses (rVec/tVec are None without markers)
+DetectionResult = namedtuple("DetectionResult", ["seq", "timestamp", "corners", "ids", "rVec", "tVec"])
+
+
+# WORKER ---------------------------------------------------------------------------------------------------------------
+_worker = {}
+
+
+def _init_worker(dictionary, ids, params, camMatrix, distCof, marker_size):
+    cv2.setNumThreads(1)  # The parallelism comes from the process pool
+    _worker["dictionary"] = get_dictionary(dictionary, ids)
+    _worker["params"] = detector_params_from_dict(params)
+    _worker["camMatrix"] = camMatrix
+    _worker["distCof"] = distCof
+    _worker["marker_size"] = marker_size
+
+
+def _ready():
+    return os.getpid()
+
+
+def _detect(seq, timestamp, gray_frame):
+    corners, ids, _ = detect_markers(gray_frame, _worker["dictionary"], _worker["params"])
+    rVec = tVec = None
+    if ids is not None:
+        rVec, tVec, _ = cv2.aruco.estimatePoseSingleMarkers(
+            corners=corners, markerLength=_worker["marker_size"], cameraMatrix=_worker["camMatrix"],
+            distCoeffs=_worker["distCof"]
+        )
+        corners = np.asarray(corners, dtype=np.float32).reshape((-1, 1, 4, 2))
+    return DetectionResult(seq, timestamp, tuple(corners), ids, rVec, tVec)
+
+
+# DETECTION POOL -------------------------------------------------------------------------------------------------------
+class DetectionPool:
+    """
+    Pool of detection worker processes with in-order results.
+
+    Arguments:
+        dictionary              : Name of the ArUco dictionary in ARUCO_DICT
+        ids                     : Optional deployed marker IDs, to detect with a restricted dictionary (see 'arucoDict.py')
+        arucoParams             : cv2.aruco.DetectorParameters
+        camMatrix, distCof      : Camera calibration
+        marker_size             : Marker side length, in the unit of the translation vectors
+        workers                 : Number of worker processes
+        max_in_flight           : Maximum number of frames being processed or waiting to be emitted (default 2 * workers)
+        when_full               : "drop" or "block", see above
+        stale_after             : Seconds after which an outstanding frame may be skipped, see above
+    """
+
+    def __init__(self, dictionary, arucoParams, camMatrix, distCof, marker_size, workers=None, max_in_flight=None,
+                 when_full="drop", stale_after=None, ids=None):
+        if when_full not in ("drop", "block"):
+            raise ValueError(f"Unknown when_full policy {when_full}")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.when_full = when_full
+        self.stale_after = stale_after
+        self._initargs = (dictionary, None if ids is None else tuple(ids), detector_params_to_dict(arucoParams),
+                          np.asarray(camMatrix), np.asarray(distCof), marker_size)
+
+        self.submitted = 0          # Frames dispatched to the workers
+        self.dropped_full = 0       # Frames dropped by submit() because the pool was full
+        self.dropped_stale = 0      # Frames skipped by the reorder stage because they were stale
+        self._executor = None
+        self._pending = {}          # Future -> dispatch index
+        self._finished = {}         # Dispatch index -> DetectionResult
+        self._submit_time = {}      # Dispatch index -> time.monotonic() of the dispatch
+        self._next_index = 0        # Next dispatch index to emit
+
+    def start(self):
+        """Start the worker processes. Call this before starting any capture thread, as the workers are forked."""
+        if self._executor is not None:
+            return self
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                             initargs=self._initargs)
+        # Bring every worker up now rather than on the first frames
+        wait([self._executor.submit(_ready) for _ in range(self.workers)])
+        return self
+
+    def in_flight(self):
+        return len(self._pending) + len(self._finished)
+
+    def submit(self, seq, timestamp, gray_frame):
+        """Dispatch a frame to the workers. Returns False if the frame was dropped because the pool was full."""
+        if self.when_full == "drop" and self.in_flight() >= self.max_in_flight:
+            self.dropped_full += 1
+            return False
+        while len(self._pending) >= self.max_in_flight:
+            self._collect(timeout=None)
+
+        index = self.submitted
+        self._pending[self._executor.submit(_detect, seq, timestamp, gray_frame)] = index
+        self._submit_time[index] = time.monotonic()
+        self.submitted += 1
+        return True
+
+    def _collect(self, timeout=0):
+        """Move the completed futures into the reorder buffer."""
+        if not self._pending:
+            return
+        done, _ = wait(list(self._pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = self._pending.pop(future)
+            if index >= self._next_index:
+                self._finished[index] = future.result()
+            # Results of frames that were already skipped as stale are discarded
+
+    def results(self, timeout=0):
+        """
+        Return the list of results that are ready to be emitted in capture order. With a timeout, waits up to that long for
+        the first completion (None waits until at least one result is emitted or nothing is in flight).
+        """
+        emitted = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._collect(timeout=0 if emitted else (None if deadline is None else max(deadline - time.monotonic(), 0)))
+            while self._next_index < self.submitted:
+                if self._next_index in self._finished:
+                    emitted.append(self._finished.pop(self._next_index))
+                elif self._is_stale(self._next_index):
+                    self.dropped_stale += 1
+                else:
+                    break
+                self._submit_time.pop(self._next_index, None)
+                self._next_index += 1
+
+            if emitted or not self._pending or (deadline is not None and time.monotonic() >= deadline):
+                return emitted
+
+    def _is_stale(self, index):
+        if self.stale_after is None or not self._finished:
+            return False
+        return time.monotonic() - self._submit_time[index] > self.stale_after
+
+    def drain(self):
+        """Wait for all outstanding frames and return their results in capture order."""
+        emitted = []
+        while self._next_index < self.submitted:
+            emitted.extend(self.results(timeout=None))
+        return emitted
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
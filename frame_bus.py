@@ -0,0 +1,416 @@
+"""
+This script provides a shared-memory frame bus, so that capture and processing can run in separate processes without pickling
+the frames.
+
+The bus is a single multiprocessing.shared_memory block holding a fixed pool of frame slots:
+    - Header        : Geometry of the bus (slots, readers, frame shape), sequence number of the latest frame, closed flag
+    - Slot table    : Sequence number (-1 while being written) and capture timestamp of the frame in every slot
+    - Reader table  : PID of every attached reader, with the sequence number of the frame it currently holds and since when
+    - Frame data    : slots x height x width x channels uint8 frames
+
+One process (the capture process) captures the frames straight into the slots, and any number of reader processes (detection,
+recorder, display) get read-only NumPy views of the slots, without any copy. The writer never overwrites a frame a reader is
+holding, but a hold expires after 'lease_timeout' seconds. Readers that fall behind skip to the oldest frame still on the bus,
+and the skipped frames are counted as dropped. FrameBusSource, the frame source of the detection scripts, copies every frame
+out of its slot instead, as their consumers keep frames across reads.
+
+Every slot is guarded like a seqlock: the writer sets the sequence number of a slot to -1 before it looks at the holds of the
+readers and before it writes the frame, and a reader checks that the sequence number of the slot is still the one of its frame
+after it has used (or copied) the frame - with valid() - and discards it otherwise. A slot can only be overwritten while a reader
+uses it if the hold expired or the writer took the slot while the hold was being set, and valid() detects both.
+
+Usage:
+    # Capture process - publishes the frames of any frame source (see 'frame_source.py')
+    python frame_bus.py --source picamera --name aruco_frames
+
+    # Processing processes
+    python pose_estimation.py --source bus --bus-name aruco_frames
+    python aruco_detector_video.py --source bus --bus-name aruco_frames
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import argparse
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+# Third-Party Imports
+import numpy as np
+
+# Project-Specific Imports
+from frame_source import FRAME_SOURCES, Frame, FrameSource, create_source
+
+
+MAGIC = 0xF7A3E0B5
+HEADER_FIELDS = 16
+MAGIC_FIELD, SLOTS_FIELD, READERS_FIELD, HEIGHT_FIELD, WIDTH_FIELD, CHANNELS_FIELD, LATEST_FIELD, CLOSED_FIELD = range(8)
+
+
+def _layout(slots, max_readers, shape):
+    """Byte offsets of the header, slot table, reader table and frame data, and the total size."""
+    offsets = {}
+    size = 0
+    for name, nbytes in (("header", HEADER_FIELDS * 8), ("slot_seq", slots * 8), ("slot_time", slots * 8),
+                         ("reader_pid", max_readers * 8), ("reader_seq", max_readers * 8), ("reader_time", max_readers * 8)):
+        offsets[name] = size
+        size += nbytes
+    size = (size + 63) // 64 * 64  # Align the frames to a cache line
+    offsets["data"] = size
+    return offsets, size + slots * int(np.prod(shape))
+
+
+# FRAME BUS ------------------------------------------------------------------------------------------------------------
+class FrameBus:
+    """
+    Shared-memory pool of frame slots. Use FrameBus.create() in the capture process and FrameBus.attach() in the readers.
+
+    Arguments:
+        shm             : The multiprocessing.shared_memory.SharedMemory block
+        owner           : Whether this process created the block (and unlinks it on close)
+        lease_timeout   : Seconds after which the frame held by a reader may be overwritten anyway
+    """
+
+    def __init__(self, shm, owner=False, lease_timeout=1.0):
+        self.shm = shm
+        self.owner = owner
+        self.lease_timeout = lease_timeout
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if self.header[MAGIC_FIELD] != MAGIC:
+            raise ValueError(f"Shared memory block {shm.name} is not a frame bus")
+
+        self.slots = int(self.header[SLOTS_FIELD])
+        self.max_readers = int(self.header[READERS_FIELD])
+        self.shape = tuple(int(v) for v in self.header[HEIGHT_FIELD:CHANNELS_FIELD + 1])
+        offsets, _ = _layout(self.slots, self.max_readers, self.shape)
+        buf = shm.buf
+        self.slot_seq = np.ndarray((self.slots,), dtype=np.int64, buffer=buf, offset=offsets["slot_seq"])
+        self.slot_time = np.ndarray((self.slots,), dtype=np.float64, buffer=buf, offset=offsets["slot_time"])
+        self.reader_pid = np.ndarray((self.max_readers,), dtype=np.int64, buffer=buf, offset=offsets["reader_pid"])
+        self.reader_seq = np.ndarray((self.max_readers,), dtype=np.int64, buffer=buf, offset=offsets["reader_seq"])
+        self.reader_time = np.ndarray((self.max_readers,), dtype=np.float64, buffer=buf, offset=offsets["reader_time"])
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=offsets["data"])
+
+        self.reclaimed = 0      # Writer only - frames overwritten although a reader was still holding them
+        self._next_seq = int(self.header[LATEST_FIELD]) + 1
+
+    @classmethod
+    def create(cls, name, shape=(480, 640, 3), slots=8, max_readers=8, lease_timeout=1.0):
+        """Create a new bus for frames of the given (height, width, channels) shape, replacing any stale bus of that name."""
+        shape = tuple(shape) if len(shape) == 3 else tuple(shape) + (1,)
+        offsets, size = _layout(slots, max_readers, shape)
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[SLOTS_FIELD], header[READERS_FIELD] = slots, max_readers
+        header[HEIGHT_FIELD:CHANNELS_FIELD + 1] = shape
+        header[LATEST_FIELD] = -1
+        np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offsets["slot_seq"])[:] = -1
+        np.ndarray((max_readers,), dtype=np.int64, buffer=shm.buf, offset=offsets["reader_pid"])[:] = 0
+        np.ndarray((max_readers,), dtype=np.int64, buffer=shm.buf, offset=offsets["reader_seq"])[:] = -1
+        header[MAGIC_FIELD] = MAGIC  # Written last, so that a reader never attaches to a half-initialized bus
+        return cls(shm, owner=True, lease_timeout=lease_timeout)
+
+    @classmethod
+    def attach(cls, name, timeout=None):
+        """Attach to an existing bus, waiting up to timeout seconds (None waits forever) for the capture process to create it."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+                # The block belongs to the capture process - do not let this process' resource tracker unlink it on exit
+                resource_tracker.unregister(shm._name, "shared_memory")
+                if np.ndarray((1,), dtype=np.int64, buffer=shm.buf)[MAGIC_FIELD] == MAGIC:
+                    return cls(shm, owner=False)
+                shm.close()  # Still being initialized by the capture process
+            except FileNotFoundError:
+                pass
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Frame bus {name} is not available")
+            time.sleep(0.1)
+
+    # Writer -----------------------------------------------------------------------------------------------------------
+    def _held(self):
+        """Sequence numbers of the frames held by the readers whose hold has not expired."""
+        now = time.monotonic()
+        held = set()
+        for pid, seq, since in zip(self.reader_pid, self.reader_seq, self.reader_time):
+            if pid and seq >= 0 and now - since < self.lease_timeout:
+                held.add(int(seq))
+        return held
+
+    def acquire(self):
+        """
+        Reserve the slot for the next frame and return (slot index, writable view of the slot). The oldest slot that no reader
+        is holding is used; if every slot is held, the oldest one is reclaimed.
+        """
+        held = self._held()
+        order = np.argsort(self.slot_seq, kind="stable")  # Empty slots (-1) first, then oldest frame first
+        for slot in (int(i) for i in order):
+            seq = int(self.slot_seq[slot])
+            if seq in held:
+                continue
+            # Take the slot before checking the holds again: a reader that sets its hold on the frame from now on sees the
+            # slot taken when it re-checks it, and a reader that set it before is seen here - then the slot is given back
+            self.slot_seq[slot] = -1
+            if seq < 0 or seq not in self._held():
+                return slot, self.frames[slot]
+            self.slot_seq[slot] = seq
+
+        # Every slot is held - reclaim the oldest frame. Its reader finds out with valid(), as the sequence number changed
+        slot = int(order[0])
+        self.slot_seq[slot] = -1
+        self.reclaimed += 1
+        return slot, self.frames[slot]
+
+    def commit(self, slot, timestamp):
+        """Publish the frame written into the slot. Returns its sequence number."""
+        seq = self._next_seq
+        self.slot_time[slot] = timestamp
+        self.slot_seq[slot] = seq
+        self.header[LATEST_FIELD] = seq
+        self._next_seq += 1
+        return seq
+
+    def publish(self, image, timestamp):
+        """
+        Copy an image captured into a buffer of its own into the next slot and publish it. Returns its sequence number. Use
+        acquire() and commit() instead to capture straight into the slot (see publish_source).
+        """
+        slot, view = self.acquire()
+        np.copyto(view, image.reshape(self.shape))
+        return self.commit(slot, timestamp)
+
+    # Readers ----------------------------------------------------------------------------------------------------------
+    @property
+    def latest(self):
+        return int(self.header[LATEST_FIELD])
+
+    @property
+    def closed(self):
+        return bool(self.header[CLOSED_FIELD])
+
+    def mark_closed(self):
+        """Tell the readers that no more frames will be published."""
+        self.header[CLOSED_FIELD] = 1
+
+    def reader(self, poll_interval=0.001):
+        return FrameBusReader(self, poll_interval)
+
+    def close(self):
+        """Detach from the bus. The creator also marks it closed and removes it."""
+        if self.owner:
+            self.mark_closed()
+        # Drop the NumPy views before closing the shared memory block, which cannot be closed while they exist
+        self.header = self.slot_seq = self.slot_time = self.frames = None
+        self.reader_pid = self.reader_seq = self.reader_time = None
+        _close_shm(self.shm)
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FrameBusReader:
+    """
+    One reader of a FrameBus. read() returns Frame(seq, timestamp, image) tuples whose image is a read-only view of the slot,
+    held for this reader until the next read() or release(). Check valid(frame) once done with the view (or a copy of it),
+    and discard the result if it is False - the writer then reclaimed the slot while the frame was in use.
+    """
+
+    def __init__(self, bus, poll_interval=0.001):
+        self.bus = bus
+        self.poll_interval = poll_interval
+        self.last_seq = bus.latest - 1  # Start with the latest frame on the bus
+        self.dropped = 0                # Frames skipped because the reader fell behind
+        self.index = self._register()
+
+    def _register(self):
+        pid = os.getpid()
+        for index in range(self.bus.max_readers):
+            owner = int(self.bus.reader_pid[index])
+            if owner == 0 or not _pid_alive(owner):
+                self.bus.reader_seq[index] = -1
+                self.bus.reader_pid[index] = pid
+                time.sleep(0.01)
+                if int(self.bus.reader_pid[index]) == pid:  # Another reader may have claimed the same entry
+                    return index
+        raise RuntimeError(f"All {self.bus.max_readers} reader entries of the frame bus are in use")
+
+    def _find(self, after_seq):
+        """Slot holding the oldest frame newer than after_seq, or None."""
+        seqs = self.bus.slot_seq
+        candidates = np.flatnonzero(seqs > max(after_seq, -1))  # Never the empty slots and slots being written (-1)
+        if len(candidates) == 0:
+            return None
+        return int(candidates[np.argmin(seqs[candidates])])
+
+    def read(self, timeout=None, latest=False):
+        """
+        Next frame after the previous one (or the most recent frame with latest=True), or None once the bus is closed or the
+        timeout expires.
+        """
+        bus = self.bus
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            target = bus.latest if latest else self.last_seq + 1
+            slot = self._find(target - 1) if bus.latest > self.last_seq else None
+            if slot is not None:
+                seq = int(bus.slot_seq[slot])
+                if seq < 0:
+                    continue  # Taken by the writer since _find
+                bus.reader_time[self.index] = time.monotonic()
+                bus.reader_seq[self.index] = seq
+                if int(bus.slot_seq[slot]) == seq:  # The writer did not take the slot before the hold was set
+                    self.dropped += seq - self.last_seq - 1
+                    self.last_seq = seq
+                    image = bus.frames[slot]
+                    image.flags.writeable = False
+                    return Frame(seq, float(bus.slot_time[slot]), image)
+                continue
+
+            if bus.closed:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def valid(self, frame):
+        """Whether the frame is still on the bus, i.e. the writer has not taken its slot - so the frame read was not torn."""
+        return bool(np.any(self.bus.slot_seq == frame.seq))
+
+    def release(self):
+        """Release the frame held by this reader."""
+        self.bus.reader_seq[self.index] = -1
+
+    def close(self):
+        self.release()
+        self.bus.reader_pid[self.index] = 0
+
+
+# Blocks that could not be closed yet because views of their frames were still held - retried on every later close
+_unclosed = []
+
+
+def _close_shm(shm):
+    """Close a shared memory block, or defer it while views of it are still held by a consumer (BufferError)."""
+    for pending in list(_unclosed):
+        try:
+            pending.close()
+            _unclosed.remove(pending)
+        except BufferError:
+            pass
+    try:
+        shm.close()
+    except BufferError:
+        _unclosed.append(shm)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# FRAME SOURCE ---------------------------------------------------------------------------------------------------------
+class FrameBusSource(FrameSource):
+    """
+    Frame source reading from a frame bus published by another process, with the same interface as the other frame sources.
+    Consumers of a frame source keep frames across reads (tracker state, display, frames queued for the outputs), which a
+    view of a bus slot does not survive - the writer reuses the slot once the hold moves on, and the shared memory block
+    cannot be closed while views of it exist. Every frame is therefore copied out of its slot, and the slot released at once.
+    """
+
+    def __init__(self, name, attach_timeout=None):
+        super().__init__(buffer_size=1)
+        self.name = name
+        self.attach_timeout = attach_timeout
+        self._bus = None
+        self._reader = None
+
+    @property
+    def dropped(self):
+        return self._reader.dropped if self._reader is not None else 0
+
+    def start(self):
+        if self._bus is None:
+            self._bus = FrameBus.attach(self.name, timeout=self.attach_timeout)
+            self._reader = self._bus.reader()
+            self._running.set()
+        return self
+
+    def _read(self, timeout, latest):
+        """Copy of the next (or latest) frame, out of its slot, which is released for the writer."""
+        while True:
+            frame = self._reader.read(timeout, latest=latest)
+            if frame is None:
+                if self._bus.closed:
+                    self._running.clear()  # End of stream - the capture process closed the bus, so a None is not a timeout
+                return None
+            image = frame.image.copy()
+            valid = self._reader.valid(frame)
+            self._reader.release()
+            if valid:
+                self.frames_captured += 1
+                return frame._replace(image=image)
+            self._reader.dropped += 1  # Torn - the writer reclaimed the slot during the copy
+
+    def read(self, timeout=None):
+        return self._read(timeout, latest=False)
+
+    def read_latest(self, timeout=None):
+        return self._read(timeout, latest=True)
+
+    def stop(self):
+        self._running.clear()
+        if self._bus is not None:
+            self._reader.close()
+            self._bus.close()
+            self._bus = self._reader = None
+
+
+def publish_source(source, bus):
+    """
+    Capture every frame of a frame source (not started) straight into the slots of the bus, until the source ends. The bus
+    replaces the capture thread and ring buffer of the source (see FrameSource.capture_into).
+    """
+    source.capture_into(bus.acquire, bus.commit)
+
+
+# CAPTURE PROCESS ------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    arg = argparse.ArgumentParser()
+    arg.add_argument("-s", "--source", type=str, default="picamera", choices=[s for s in FRAME_SOURCES if s != "bus"],
+                     help="frame source to capture from")
+    arg.add_argument("-v", "--video", type=str, default=None, help="path to the video file used by the 'file' frame source")
+    arg.add_argument("-n", "--name", type=str, default="aruco_frames", help="name of the shared-memory frame bus")
+    arg.add_argument("--slots", type=int, default=8, help="number of frame slots of the bus")
+    arg.add_argument("--readers", type=int, default=8, help="maximum number of attached readers")
+    args = vars(arg.parse_args())  # Convert argument to dictionary
+
+    resolution = (640, 480)
+    with FrameBus.create(args["name"], shape=(resolution[1], resolution[0], 3), slots=args["slots"],
+                         max_readers=args["readers"]) as bus:
+        print(f"Publishing '{args['source']}' frames on frame bus '{args['name']}' - press Ctrl+C to stop")
+        source = create_source(args["source"], video=args["video"], resolution=resolution, framerate=32)
+        try:
+            publish_source(source, bus)
+        except KeyboardInterrupt:
+            pass
+        print(f"Published {bus.latest + 1} frames, {bus.reclaimed} reclaimed from readers that held them too long")
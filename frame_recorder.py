@@ -0,0 +1,244 @@
+"""
+This script records the live capture stream into a memory-mapped raw container, and replays such recordings as a frame source.
+
+'camera_calibration_final/data_generation.py' only saves the frames picked by an operator, as JPEG. To reproduce a failed
+docking attempt, the recorder instead keeps every captured frame, bit-exact:
+    <recording>/frames.npy  : Fixed-size frame slab, a (capacity, height, width[, 3]) uint8 array written through a memory map
+    <recording>/index.npy   : Sequence number and capture timestamp of every slot (seq = -1 for empty slots)
+    <recording>/meta.json   : Frame shape, capacity, grayscale/ring settings and the number of frames recorded and dropped
+With grayscale=True only the grayscale frames are stored, a third of the size of BGR frames. With ring=True the slab wraps
+around, so that it always holds the latest frames (e.g. the last minute before a failed docking), otherwise recording stops
+once the slab is full.
+
+The recorder never stalls the capture: record() only hands (a copy of) the frame to a writer thread through a bounded queue,
+and frames that arrive while the queue is full are counted as dropped. Both .npy files are valid at all times, so a recording cut short
+by a crash or power loss can still be replayed.
+
+ReplaySource serves the frames of a recording in sequence order, as zero-copy read-only views of the memory map, either at
+their original timing (realtime=True) or as fast as the consumer takes them - for reproducing bugs and benchmarking the
+throughput on a desktop:
+    python pose_estimation.py --record recordings/docking_01 --record-ring
+    python pose_estimation.py --source replay --recording recordings/docking_01 --display headless
+    python frame_recorder.py --source picamera --output recordings/docking_01 --gray
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import argparse
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+
+# Third-Party Imports
+import numpy as np
+
+# Project-Specific Imports
+from frame_source import FRAME_SOURCES, FrameSource, create_source, to_bgr, to_gray
+
+
+INDEX_DTYPE = np.dtype([("seq", np.int64), ("timestamp", np.float64)])
+
+
+def _write_meta(path, meta):
+    with open(Path(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+# RECORDER -------------------------------------------------------------------------------------------------------------
+class FrameRecorder:
+    """
+    Write captured frames into a memory-mapped raw container on a separate thread.
+
+    Arguments:
+        path        : Directory of the recording (created, must not contain a recording yet)
+        max_bytes   : Size of the frame slab - the capacity in frames follows from the shape of the first frame
+        grayscale   : Store the grayscale frames only
+        ring        : Wrap around when the slab is full, keeping the latest frames, instead of stopping the recording
+        queue_size  : Frames waiting for the writer thread before new frames are dropped
+    """
+
+    def __init__(self, path, max_bytes=1024 ** 3, grayscale=False, ring=False, queue_size=64):
+        self.path = Path(path)
+        if self.path.joinpath("meta.json").exists():
+            raise FileExistsError(f"{self.path} already contains a recording")
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.grayscale = grayscale
+        self.ring = ring
+        self.recorded = 0           # Frames written into the slab
+        self.dropped = 0            # Frames dropped because the writer thread fell behind (or the slab was full)
+        self._frames = None
+        self._index = None
+        self._meta = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, frame):
+        """Hand a captured frame to the writer thread, without ever blocking the caller."""
+        if self._queue.full():
+            self.dropped += 1
+            return
+        # The consumers may draw onto a writable BGR frame (e.g. the inline display) before the writer thread gets to it, so
+        # the recorder keeps its own copy. Read-only frames (frame bus, replay) and grayscale/YUV frames, which the display
+        # converts into a new image, are never drawn onto and are queued as they are
+        if frame.image.ndim == 3 and frame.image.flags.writeable:
+            frame = frame._replace(image=frame.image.copy())
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            self.dropped += 1
+
+    def _create(self, image):
+        """Create the container for frames of the shape of the first frame."""
+        shape = image.shape[:2] + (() if self.grayscale else (3,))
+        capacity = max(1, self.max_bytes // int(np.prod(shape)))
+        self._frames = np.lib.format.open_memmap(self.path.joinpath("frames.npy"), mode="w+", dtype=np.uint8,
+                                                 shape=(capacity,) + tuple(shape))
+        self._index = np.lib.format.open_memmap(self.path.joinpath("index.npy"), mode="w+", dtype=INDEX_DTYPE,
+                                                shape=(capacity,))
+        self._index["seq"] = -1
+        self._meta = {"shape": list(shape), "capacity": capacity, "grayscale": self.grayscale, "ring": self.ring,
+                      "recorded": 0, "dropped": 0, "started": time.time()}
+        _write_meta(self.path, self._meta)
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self._frames is None:
+                self._create(frame.image)
+            capacity = len(self._frames)
+            if self.recorded >= capacity and not self.ring:
+                self.dropped += 1
+                continue
+
+            # The frame is written before its index row, so that a row with a valid seq always has a complete frame
+            slot = self.recorded % capacity
+            self._index["seq"][slot] = -1
+            # Colour conversion happens here, on the writer thread - for grayscale-first frames only if colour is recorded
+            self._frames[slot] = to_gray(frame.image) if self.grayscale else to_bgr(frame.image)
+            self._index[slot] = (frame.seq, frame.timestamp)
+            self.recorded += 1
+
+    def close(self):
+        """Write the remaining queued frames, flush the container and update its metadata."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._frames is not None:
+            self._frames.flush()
+            self._index.flush()
+            self._meta.update(recorded=self.recorded, dropped=self.dropped)
+            _write_meta(self.path, self._meta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# REPLAY ---------------------------------------------------------------------------------------------------------------
+def load_recording(path):
+    """Memory-mapped (read-only) frames and index of a recording, and the slots of its frames in sequence order."""
+    path = Path(path)
+    frames = np.load(path.joinpath("frames.npy"), mmap_mode="r")
+    index = np.load(path.joinpath("index.npy"), mmap_mode="r")
+    slots = np.flatnonzero(index["seq"] >= 0)
+    return frames, index, slots[np.argsort(index["seq"][slots], kind="stable")]
+
+
+class ReplaySource(FrameSource):
+    """
+    Frames of a recording made by FrameRecorder, as read-only views of the memory map - copy a frame before drawing onto it.
+    With realtime=True the frames are paced at their recorded timing and old frames are dropped like a live camera,
+    otherwise every frame is delivered as fast as the consumer can take it.
+    """
+
+    def __init__(self, path, realtime=False, loop=False, buffer_size=8):
+        super().__init__(buffer_size=buffer_size, drop_oldest=realtime)
+        self.path = Path(path)
+        self.realtime = realtime
+        self.loop = loop
+        self._frames = None
+        self._index = None
+        self._order = None
+        self._position = 0
+        self._start = None
+
+    def _open(self):
+        self._frames, self._index, self._order = load_recording(self.path)
+        if len(self._order) == 0:
+            raise IOError(f"Recording {self.path} contains no frames")
+
+    def _grab(self):
+        if self._position == len(self._order):
+            if not self.loop:
+                return None
+            self._position = 0
+            self._start = None
+        slot = self._order[self._position]
+        self._position += 1
+
+        if self.realtime:
+            # Replay clock - the offset of every frame from the first one, as recorded
+            recorded = self._index["timestamp"][slot]
+            now = time.monotonic()
+            if self._start is None:
+                self._start = (now, recorded)
+            delay = self._start[0] + (recorded - self._start[1]) - now
+            if delay > 0:
+                time.sleep(delay)
+        return self._frames[slot]
+
+    def _close(self):
+        self._frames = self._index = None
+
+
+# CONFIGURATION --------------------------------------------------------------------------------------------------------
+def add_recorder_arguments(arg):
+    """Add the command line arguments of the recorder and the replay source to an argparse.ArgumentParser."""
+    arg.add_argument("--record", type=str, default=None, help="record the captured frames into this directory")
+    arg.add_argument("--record-gray", action="store_true", help="record the grayscale frames only")
+    arg.add_argument("--record-mb", type=float, default=1024.0, help="size of the recording frame slab [MB]")
+    arg.add_argument("--record-ring", action="store_true", help="keep the latest frames when the slab is full")
+    arg.add_argument("--recording", type=str, default=None, help="recording replayed by the 'replay' frame source")
+    arg.add_argument("--replay-realtime", action="store_true", help="replay at the recorded timing instead of as fast as possible")
+
+
+def create_recorder(args):
+    """Build the FrameRecorder selected by the arguments of add_recorder_arguments, or None without --record."""
+    if args["record"] is None:
+        return None
+    return FrameRecorder(args["record"], max_bytes=int(args["record_mb"] * 1024 ** 2), grayscale=args["record_gray"],
+                         ring=args["record_ring"])
+
+
+# RECORDING PROCESS ----------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    arg = argparse.ArgumentParser()
+    arg.add_argument("-s", "--source", type=str, default="picamera", choices=[s for s in FRAME_SOURCES if s != "bus"],
+                     help="frame source to capture from")
+    arg.add_argument("-v", "--video", type=str, default=None, help="path to the video file used by the 'file' frame source")
+    arg.add_argument("-o", "--output", type=str, required=True, help="directory of the recording")
+    arg.add_argument("--gray", action="store_true", help="record the grayscale frames only")
+    arg.add_argument("--mb", type=float, default=1024.0, help="size of the frame slab [MB]")
+    arg.add_argument("--ring", action="store_true", help="keep the latest frames when the slab is full")
+    args = vars(arg.parse_args())  # Convert argument to dictionary
+
+    with FrameRecorder(args["output"], max_bytes=int(args["mb"] * 1024 ** 2), grayscale=args["gray"],
+                       ring=args["ring"]) as recorder:
+        print(f"Recording '{args['source']}' frames into {args['output']} - press Ctrl+C to stop")
+        source = create_source(args["source"], video=args["video"], resolution=(640, 480), framerate=32)
+        source.recorder = recorder
+        with source:
+            try:
+                for _ in source:
+                    pass
+            except KeyboardInterrupt:
+                pass
+    print(f"Recorded {recorder.recorded} frames, {recorder.dropped} dropped")
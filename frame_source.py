@@ -0,0 +1,557 @@
+"""
+This script provides the frame sources that feed the detection scripts.
+
+Every source captures on its own thread and fills a bounded ring buffer of timestamped frames, while the detection loop consumes
+from that buffer. Capture and detection therefore overlap, so the throughput of the pipeline is set by the slower of the two
+stages rather than by the sum of both.
+
+The following backends are available:
+    - PiCameraSource     : Raspberry Pi (RPI) V2 camera module via the picamera library
+    - VideoStreamSource  : IMX camera module on the Jetson Nano (or any webcam) via the imutils video stream function
+    - VideoFileSource    : Recorded video files, either at their original frame rate or as fast as possible
+    - SyntheticSource    : Generated frames with a drifting ArUco marker, for testing without a camera
+    - FrameBusSource     : Frames published by a capture process on a shared-memory frame bus (see 'frame_bus.py')
+    - ReplaySource       : Frames of a raw recording, at their recorded timing or as fast as possible (see 'frame_recorder.py')
+
+Grayscale-first capture (yuv=True, PiCameraSource and SyntheticSource):
+    The camera delivers YUV420 (I420) frames instead of interleaved BGR, and frame.image is a LumaImage - the Y plane as a
+    zero-copy view of the captured buffer. Detection uses it directly (to_gray returns it as it is), which saves the
+    BGR -> gray conversion and two thirds of the bytes per frame. The colour image is only computed when it is needed, by
+    to_bgr() (e.g. by the display or a colour recording), from the chroma planes kept alongside the view.
+
+Any source except the frame bus can record its capture stream: assign a FrameRecorder (see 'frame_recorder.py') to
+source.recorder before starting it, and every captured frame is handed to the recorder on the capture thread.
+
+Instead of being started, a source can also capture straight into the buffers of a consumer with capture_into() - the slots of
+the frame bus, which then replace the capture thread and ring buffer (see 'frame_bus.py').
+
+Usage:
+    with PiCameraSource(resolution=(640, 480), framerate=32) as source:
+        for frame in source:
+            gray_frame = cv2.cvtColor(frame.image, cv2.COLOR_BGR2GRAY)
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import io
+import threading
+import time
+from collections import namedtuple
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from arucoDict import ARUCO_DICT
+from aruco_generator import load_atlas
+
+
+# A single captured frame: sequence number, capture timestamp (time.monotonic) and image
+Frame = namedtuple("Frame", ["seq", "timestamp", "image"])
+
+
+# LUMINANCE FRAMES -----------------------------------------------------------------------------------------------------
+class LumaImage(np.ndarray):
+    """
+    Y plane of a YUV420 (I420) frame, as a zero-copy view of the frame buffer. The buffer, and with it the chroma planes, is
+    kept in .yuv for to_bgr(). Slices and copies are plain grayscale images without the chroma planes.
+    """
+
+    def __array_finalize__(self, obj):
+        self.yuv = None
+        self.padded = None
+
+
+def luma_view(yuv, width, height):
+    """
+    LumaImage of an I420 buffer (bytes or array) of a width x height frame. Like the Raspberry Pi camera, the buffer may be
+    padded to a width that is a multiple of 32 and a height that is a multiple of 16.
+    """
+    yuv = np.frombuffer(yuv, dtype=np.uint8) if isinstance(yuv, (bytes, bytearray, memoryview)) else np.asarray(yuv)
+    padded_width = width if yuv.size == width * height * 3 // 2 else (width + 31) // 32 * 32
+    padded_height = height if yuv.size == width * height * 3 // 2 else (height + 15) // 16 * 16
+    yuv = yuv.reshape(-1)[:padded_width * padded_height * 3 // 2].reshape((padded_height * 3 // 2, padded_width))
+    image = yuv[:height, :width].view(LumaImage)
+    image.yuv = yuv
+    image.padded = (padded_width, padded_height)
+    return image
+
+
+def to_gray(image):
+    """Grayscale version of a BGR frame - grayscale frames (e.g. a LumaImage or a grayscale recording) are returned as they are."""
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def to_bgr(image, copy=False):
+    """
+    BGR version of a frame, converted from the chroma planes of a LumaImage or from a grayscale image. BGR frames are
+    returned as they are, or as a copy with copy=True, so that the result can always be drawn onto.
+    """
+    yuv = getattr(image, "yuv", None)
+    if yuv is not None:
+        height, width = image.shape
+        return np.ascontiguousarray(cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)[:height, :width])
+    if image.ndim == 2:
+        return cv2.cvtColor(np.asarray(image), cv2.COLOR_GRAY2BGR)
+    return image.copy() if copy or not image.flags.writeable else image
+
+
+# RING BUFFER ----------------------------------------------------------------------------------------------------------
+class FrameRingBuffer:
+    """
+    Bounded, thread-safe ring buffer of frames between a single capture thread and the detection loop.
+
+    When the buffer is full, a live source (drop_oldest=True) overwrites the oldest frame so detection always works on recent
+    data, whereas a recorded source (drop_oldest=False) blocks the capture thread so that no frame is lost.
+    """
+
+    def __init__(self, capacity=4, drop_oldest=True):
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least 1")
+        self.capacity = capacity
+        self.drop_oldest = drop_oldest
+        self.dropped = 0            # Number of frames overwritten before they were consumed
+        self._slots = [None] * capacity
+        self._head = 0              # Total number of frames written
+        self._tail = 0              # Total number of frames read (or dropped)
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return self._head - self._tail
+
+    def put(self, frame):
+        """Add a frame to the buffer. Returns False if the buffer has been closed."""
+        with self._cond:
+            while not self.drop_oldest and self._head - self._tail == self.capacity and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return False
+            if self._head - self._tail == self.capacity:
+                self._slots[self._tail % self.capacity] = None
+                self._tail += 1
+                self.dropped += 1
+            self._slots[self._head % self.capacity] = frame
+            self._head += 1
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Return the oldest unread frame, or None once the buffer is closed and drained (or the timeout expires)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._head > self._tail or self._closed, timeout):
+                return None
+            if self._head == self._tail:
+                return None
+            index = self._tail % self.capacity
+            frame = self._slots[index]
+            self._slots[index] = None
+            self._tail += 1
+            self._cond.notify_all()
+            return frame
+
+    def get_latest(self, timeout=None):
+        """Return the most recent frame and discard any older unread frames."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._head > self._tail or self._closed, timeout):
+                return None
+            if self._head == self._tail:
+                return None
+            skipped = self._head - self._tail - 1
+            self.dropped += skipped
+            for seq in range(self._tail, self._head):
+                frame, self._slots[seq % self.capacity] = self._slots[seq % self.capacity], None
+            self._tail = self._head
+            self._cond.notify_all()
+            return frame
+
+    def close(self):
+        """Wake up any waiting producer/consumer. Frames still in the buffer can be drained with get()."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# FRAME SOURCE BASE CLASS ----------------------------------------------------------------------------------------------
+class FrameSource:
+    """
+    Base class of all frame sources. Subclasses implement _open(), _grab() and _close(); _grab() returns the next image or
+    None at the end of the stream, and is only ever called from the capture thread.
+    """
+
+    def __init__(self, buffer_size=4, drop_oldest=True):
+        self.buffer = FrameRingBuffer(buffer_size, drop_oldest=drop_oldest)
+        self.frames_captured = 0
+        self.error = None           # Exception raised on the capture thread, if any
+        self.recorder = None        # Optional FrameRecorder receiving every captured frame (see 'frame_recorder.py')
+        self._running = threading.Event()
+        self._thread = None
+
+    # Backend hooks ----------------------------------------------------------------------------------------------------
+    def _open(self):
+        pass
+
+    def _grab(self):
+        raise NotImplementedError
+
+    def _grab_into(self, out):
+        """
+        Capture the next image straight into out, a writable array of the frame shape. Returns False at the end of the stream.
+        Backends that deliver their images in buffers of their own copy them into out.
+        """
+        image = self._grab()
+        if image is None:
+            return False
+        np.copyto(out, image.reshape(out.shape))
+        return True
+
+    def _close(self):
+        pass
+
+    # Capture thread ---------------------------------------------------------------------------------------------------
+    def _capture_loop(self):
+        try:
+            while self._running.is_set():
+                image = self._grab()
+                if image is None:
+                    break
+                frame = Frame(self.frames_captured, time.monotonic(), image)
+                if self.recorder is not None:
+                    self.recorder.record(frame)  # Never blocks - the recorder drops frames rather than stalling capture
+                if not self.buffer.put(frame):
+                    break
+                self.frames_captured += 1
+        except Exception as e:  # Surface capture errors to the consumer instead of dying silently
+            self.error = e
+        finally:
+            self._running.clear()
+            self.buffer.close()
+            self._close()
+
+    # Public interface -------------------------------------------------------------------------------------------------
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    @property
+    def dropped(self):
+        return self.buffer.dropped
+
+    def start(self):
+        """Open the backend and start the capture thread."""
+        if self._thread is not None:
+            return self
+        self._open()
+        self._running.set()
+        self._thread = threading.Thread(target=self._capture_loop, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def read(self, timeout=None):
+        """Return the next frame in capture order, or None at the end of the stream."""
+        frame = self.buffer.get(timeout)
+        if frame is None and self.error is not None:
+            raise RuntimeError(f"{type(self).__name__} capture failed") from self.error
+        return frame
+
+    def read_latest(self, timeout=None):
+        """Return the most recent frame, skipping any older frames still in the buffer."""
+        frame = self.buffer.get_latest(timeout)
+        if frame is None and self.error is not None:
+            raise RuntimeError(f"{type(self).__name__} capture failed") from self.error
+        return frame
+
+    def capture_into(self, acquire, commit):
+        """
+        Capture on the calling thread straight into buffers of the consumer, instead of into the ring buffer, until the end
+        of the stream. acquire() returns (slot, writable array of the frame shape) and commit(slot, timestamp) publishes the
+        frame captured into it - the acquire()/commit() pair of a FrameBus (see 'frame_bus.py'), whose slots are the ring
+        buffer. The source must not be started.
+        """
+        self._open()
+        self._running.set()
+        try:
+            while self._running.is_set():
+                slot, out = acquire()
+                if not self._grab_into(out):
+                    break
+                timestamp = time.monotonic()
+                if self.recorder is not None:
+                    self.recorder.record(Frame(self.frames_captured, timestamp, out))
+                commit(slot, timestamp)
+                self.frames_captured += 1
+        finally:
+            self._running.clear()
+            self._close()
+
+    def stop(self):
+        """Stop the capture thread and release the backend."""
+        self._running.clear()
+        self.buffer.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+# BACKENDS -------------------------------------------------------------------------------------------------------------
+class PiCameraSource(FrameSource):
+    """
+    Raspberry Pi (RPI) V2 camera module, captured through the video port with the picamera library. With format="yuv", the
+    raw YUV420 frames are captured and returned as LumaImage views, without any colour conversion.
+    """
+
+    def __init__(self, resolution=(640, 480), framerate=32, rotation=180, format="bgr", buffer_size=4):
+        super().__init__(buffer_size=buffer_size, drop_oldest=True)
+        self.resolution = resolution
+        self.framerate = framerate
+        self.rotation = rotation
+        self.format = format
+        self._camera = None
+        self._raw_capture = None
+        self._stream = None
+
+    def _open(self):
+        # picamera is only available on the Raspberry Pi, hence it is imported on demand
+        from picamera import PiCamera
+        from picamera.array import PiRGBArray
+
+        self._camera = PiCamera()
+        self._camera.resolution = self.resolution
+        self._camera.framerate = self.framerate
+        self._camera.rotation = self.rotation
+        if self.format == "yuv":
+            self._raw_capture = io.BytesIO()  # Raw I420 frames, padded to 32 x 16 pixel blocks
+        else:
+            self._raw_capture = PiRGBArray(self._camera, size=self.resolution)
+        time.sleep(2)  # Allow camera to warm up
+        self._stream = self._camera.capture_continuous(self._raw_capture, format=self.format, use_video_port=True)
+
+    def _grab(self):
+        if self.format == "yuv":
+            next(self._stream)
+            image = luma_view(self._raw_capture.getvalue(), *self.resolution)
+            self._raw_capture.seek(0)
+            self._raw_capture.truncate()
+            return image
+
+        frame = next(self._stream)
+        image = frame.array             # PiRGBArray allocates a new array on every flush, so no copy is needed
+        self._raw_capture.truncate(0)   # Clear the stream for the next frame
+        return image
+
+    def _close(self):
+        if self._stream is not None:
+            self._stream.close()
+        if self._camera is not None:
+            self._camera.close()
+
+
+class VideoStreamSource(FrameSource):
+    """imutils video stream, as used for the IMX camera module connected to the Jetson Nano."""
+
+    def __init__(self, src=0, resolution=None, buffer_size=4, poll_interval=0.001):
+        super().__init__(buffer_size=buffer_size, drop_oldest=True)
+        self.src = src
+        self.resolution = resolution
+        self.poll_interval = poll_interval
+        self._vs = None
+        self._last_image = None
+
+    def _open(self):
+        from imutils.video import VideoStream
+
+        self._vs = VideoStream(src=self.src).start()
+        time.sleep(2)  # Allow camera to warm up
+
+    def _grab(self):
+        # VideoStream.read() returns its latest frame without waiting, so only pass on frames that have not been seen yet
+        while self._running.is_set():
+            image = self._vs.read()
+            if image is not None and image is not self._last_image:
+                self._last_image = image
+                if self.resolution is not None:
+                    image = cv2.resize(image, self.resolution)
+                return image
+            time.sleep(self.poll_interval)
+        return None
+
+    def _close(self):
+        if self._vs is not None:
+            self._vs.stop()
+
+
+class VideoFileSource(FrameSource):
+    """
+    Recorded video file. With realtime=True the frames are paced at the file's frame rate and old frames are dropped like a
+    live camera, otherwise every frame is delivered as fast as the consumer can take it.
+    """
+
+    def __init__(self, path, realtime=False, loop=False, buffer_size=8):
+        super().__init__(buffer_size=buffer_size, drop_oldest=realtime)
+        self.path = str(path)
+        self.realtime = realtime
+        self.loop = loop
+        self._capture = None
+        self._frame_interval = 0.0
+        self._next_time = None
+
+    def _open(self):
+        self._capture = cv2.VideoCapture(self.path)
+        if not self._capture.isOpened():
+            raise IOError(f"Unable to open video file {self.path}")
+        fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self._frame_interval = 1.0 / fps if fps > 0 else 0.0
+
+    def _grab(self):
+        return self._read_frame(None)
+
+    def _grab_into(self, out):
+        image = self._read_frame(out)
+        if image is None:
+            return False
+        if not np.shares_memory(image, out):  # OpenCV decodes into out unless the frame has another size
+            np.copyto(out, image.reshape(out.shape))
+        return True
+
+    def _read_frame(self, out):
+        ret, image = self._capture.read(out)
+        if not ret and self.loop:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, image = self._capture.read(out)
+        if not ret:
+            return None
+
+        if self.realtime and self._frame_interval > 0:
+            now = time.monotonic()
+            if self._next_time is None:
+                self._next_time = now
+            delay = self._next_time - now
+            if delay > 0:
+                time.sleep(delay)
+            self._next_time += self._frame_interval
+        return image
+
+    def _close(self):
+        if self._capture is not None:
+            self._capture.release()
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generated BGR frames containing a single ArUco marker drifting across a grey background. Useful for testing and
+    benchmarking the pipeline on machines without a camera. With yuv=True, the frames are generated as I420 buffers and
+    returned as LumaImage views, like the grayscale-first capture of PiCameraSource.
+    """
+
+    def __init__(self, resolution=(640, 480), marker_id=25, dictionary="DICT_6X6_50", marker_pixels=120, num_frames=None,
+                 framerate=None, buffer_size=4, yuv=False):
+        super().__init__(buffer_size=buffer_size, drop_oldest=framerate is not None)
+        self.resolution = resolution
+        self.yuv = yuv
+        self.marker_id = marker_id
+        self.marker_pixels = marker_pixels
+        self.num_frames = num_frames
+        self.framerate = framerate
+
+        # Tag from the atlas of 'aruco_generator.py' if one of this size has been generated, or drawn on the fly
+        atlas = load_atlas(dictionary, marker_pixels)
+        if atlas is not None:
+            tag = np.array(atlas[marker_id])
+        else:
+            arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary])
+            tag = np.zeros((marker_pixels, marker_pixels), dtype="uint8")
+            cv2.aruco.drawMarker(arucoDict, marker_id, marker_pixels, tag, 1)
+        self._tag = cv2.cvtColor(tag, cv2.COLOR_GRAY2BGR)
+
+        # Quiet zone around the marker so that it can be detected
+        margin = marker_pixels // 6
+        self._patch = np.full((marker_pixels + 2 * margin, marker_pixels + 2 * margin, 3), 255, dtype="uint8")
+        self._patch[margin:margin + marker_pixels, margin:margin + marker_pixels] = self._tag
+        self._background = np.full((resolution[1], resolution[0], 3), 96, dtype="uint8")
+        if yuv:
+            # The scene is grey, so the chroma planes are neutral (128) and the Y plane is the grey level
+            self._patch = cv2.cvtColor(self._patch, cv2.COLOR_BGR2GRAY)
+            self._background = np.full((resolution[1] * 3 // 2, resolution[0]), 128, dtype="uint8")
+            self._background[:resolution[1]] = 96
+        self._count = 0
+
+    def marker_position(self, seq):
+        """Top-left pixel position of the marker patch in frame number seq."""
+        width, height = self.resolution
+        size = self._patch.shape[0]
+        x = (width - size) / 2 * (1 + 0.8 * np.sin(seq * 0.05))
+        y = (height - size) / 2 * (1 + 0.8 * np.cos(seq * 0.03))
+        return int(x), int(y)
+
+    def _grab(self):
+        return self._draw(self._background.copy())
+
+    def _grab_into(self, out):
+        if self.yuv:
+            return super()._grab_into(out)
+        np.copyto(out, self._background)
+        return self._draw(out) is not None
+
+    def _draw(self, image):
+        """Draw the marker of the next frame onto image, a copy of the background. Returns None at the end of the stream."""
+        if self.num_frames is not None and self._count >= self.num_frames:
+            return None
+        if self.framerate:
+            time.sleep(1.0 / self.framerate)
+
+        x, y = self.marker_position(self._count)
+        size = self._patch.shape[0]
+        image[y:y + size, x:x + size] = self._patch
+        self._count += 1
+        if self.yuv:
+            return luma_view(image, *self.resolution)
+        return image
+
+
+# Names accepted by the --source argument of the detection scripts
+FRAME_SOURCES = ("picamera", "videostream", "file", "synthetic", "bus", "replay")
+
+
+def create_source(name, video=None, resolution=(640, 480), framerate=32, bus_name="aruco_frames", recording=None,
+                  realtime=False, yuv=False):
+    """
+    Create one of the FRAME_SOURCES by name, with the settings shared by all detection scripts. yuv selects the
+    grayscale-first capture of the camera and synthetic sources - the other sources deliver BGR frames regardless.
+    """
+    if name == "picamera":
+        return PiCameraSource(resolution=resolution, framerate=framerate, format="yuv" if yuv else "bgr")
+    if name == "videostream":
+        return VideoStreamSource(resolution=resolution)
+    if name == "file":
+        if video is None:
+            raise ValueError("A video file path is required for the 'file' frame source")
+        return VideoFileSource(video)
+    if name == "synthetic":
+        return SyntheticSource(resolution=resolution, yuv=yuv)
+    if name == "bus":
+        # Frames published by a capture process on a shared-memory frame bus (see 'frame_bus.py')
+        from frame_bus import FrameBusSource
+        return FrameBusSource(bus_name)
+    if name == "replay":
+        if recording is None:
+            raise ValueError("A recording directory is required for the 'replay' frame source")
+        # Raw recording of a capture stream (see 'frame_recorder.py')
+        from frame_recorder import ReplaySource
+        return ReplaySource(recording, realtime=realtime)
+    raise ValueError(f"Frame source {name} is not supported.")
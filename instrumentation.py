@@ -0,0 +1,219 @@
+"""
+This script provides the lightweight instrumentation of the detection loop.
+
+Each stage of the loop (capture wait, color conversion, detection, pose, drawing, display) is timed with time.perf_counter_ns
+and recorded into a fixed-size log-linear histogram, so that recording costs a few integer operations and no allocation. The
+end-to-end latency from frame capture to pose and the number of dropped frames are recorded as well.
+
+The data can be read through:
+    - A periodic one-line summary with the p50/p95/p99 of each stage, printed every 'interval' seconds
+    - A JSON metrics file, rewritten atomically every 'interval' seconds (e.g. for a dashboard or a field log)
+    - JSON datagrams sent to a local UDP port every 'interval' seconds
+
+Usage:
+    metrics = PipelineMetrics(("capture_wait", "color", "detect"), interval=5.0)
+    t = metrics.now()
+    frame = source.read()
+    t = metrics.lap("capture_wait", t)
+    ...
+    metrics.pose_ready(frame.timestamp)
+    ...
+    metrics.frame_done(dropped=source.dropped)
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import json
+import os
+import socket
+import time
+from pathlib import Path
+
+
+# HISTOGRAM ------------------------------------------------------------------------------------------------------------
+class Histogram:
+    """
+    Fixed-size log-linear histogram of nanosecond durations. Values are grouped per power of two, with 'sub_buckets' linear
+    buckets within each power of two, which bounds the relative error of the percentiles to 1 / sub_buckets.
+    """
+
+    def __init__(self, max_exponent=36, sub_bits=4):
+        self.sub_bits = sub_bits
+        self.sub_buckets = 1 << sub_bits
+        self.counts = [0] * ((max_exponent + 1) * self.sub_buckets)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value):
+        exponent = value.bit_length()
+        if exponent <= self.sub_bits:
+            return value
+        shift = exponent - self.sub_bits - 1
+        return min((shift + 1) * self.sub_buckets + ((value >> shift) - self.sub_buckets), len(self.counts) - 1)
+
+    def _lower_bound(self, index):
+        if index < self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        return (self.sub_buckets + index % self.sub_buckets) << shift
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Approximate q-th percentile (0-100), as the midpoint of the matching bucket."""
+        if self.count == 0:
+            return 0
+        rank = max(1, int(round(q / 100.0 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                low, high = self._lower_bound(index), self._lower_bound(index + 1)
+                return min((low + high) // 2, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def summary(self):
+        """Count, mean and p50/p95/p99/max in milliseconds."""
+        return {
+            "count": self.count,
+            "mean_ms": self.mean() / 1e6,
+            "p50_ms": self.percentile(50) / 1e6,
+            "p95_ms": self.percentile(95) / 1e6,
+            "p99_ms": self.percentile(99) / 1e6,
+            "max_ms": self.max / 1e6,
+        }
+
+
+# PIPELINE METRICS -----------------------------------------------------------------------------------------------------
+class PipelineMetrics:
+    """
+    Per-stage histograms of the detection loop, plus end-to-end latency, frame rate and frame drops.
+
+    Arguments:
+        stages          : Names of the timed stages, in loop order
+        interval        : Seconds between summaries/exports (0 disables them)
+        print_summary   : Print a one-line summary every interval
+        metrics_file    : Optional JSON file rewritten every interval
+        udp_port        : Optional local UDP port that receives the JSON metrics every interval
+        cumulative      : Keep the histograms over the whole run instead of resetting them after every interval
+    """
+
+    def __init__(self, stages, interval=5.0, print_summary=True, metrics_file=None, udp_port=None, cumulative=False):
+        self.stages = tuple(stages)
+        self.histograms = {stage: Histogram() for stage in self.stages}
+        self.latency = Histogram()      # Capture-to-pose latency
+        self.interval = interval
+        self.print_summary = print_summary
+        self.metrics_file = Path(metrics_file) if metrics_file is not None else None
+        self.udp_port = udp_port
+        self.cumulative = cumulative
+
+        self.frames = 0
+        self.dropped = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if udp_port is not None else None
+        self._interval_ns = int(interval * 1e9)
+        self._window_start = time.monotonic_ns()
+        self._window_frames = 0
+        self._next_report = self._window_start + self._interval_ns
+
+    @staticmethod
+    def now():
+        return time.perf_counter_ns()
+
+    def lap(self, stage, start):
+        """Record the time since 'start' for the stage and return the current time, to be used as the next start."""
+        end = time.perf_counter_ns()
+        self.histograms[stage].record(end - start)
+        return end
+
+    def pose_ready(self, capture_timestamp):
+        """Record the capture-to-pose latency, capture_timestamp being the time.monotonic() of the capture (Frame.timestamp)."""
+        self.latency.record(time.monotonic_ns() - int(capture_timestamp * 1e9))
+
+    def frame_done(self, dropped=None):
+        """Mark the end of a frame. dropped is the total number of frames dropped so far by the frame source."""
+        now = time.monotonic_ns()
+        self.frames += 1
+        self._window_frames += 1
+        if dropped is not None:
+            self.dropped = dropped
+        if self._interval_ns and now >= self._next_report:
+            self.report(now)
+
+    def snapshot(self, now=None):
+        """Current metrics as a JSON-serializable dictionary."""
+        now = time.monotonic_ns() if now is None else now
+        elapsed = (now - self._window_start) / 1e9
+        return {
+            "time": time.time(),
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "fps": self._window_frames / elapsed if elapsed > 0 else 0.0,
+            "latency": self.latency.summary(),
+            "stages": {stage: self.histograms[stage].summary() for stage in self.stages},
+        }
+
+    def summary_line(self, snapshot):
+        stages = " ".join(f"{stage}={s['p50_ms']:.1f}/{s['p95_ms']:.1f}/{s['p99_ms']:.1f}"
+                          for stage, s in snapshot["stages"].items())
+        latency = snapshot["latency"]
+        return (f"[metrics] fps={snapshot['fps']:.1f} dropped={snapshot['dropped']} "
+                f"latency={latency['p50_ms']:.1f}/{latency['p95_ms']:.1f}/{latency['p99_ms']:.1f} {stages} (p50/p95/p99 ms)")
+
+    def report(self, now=None):
+        """Print and export the metrics of the current interval, then start a new interval."""
+        now = time.monotonic_ns() if now is None else now
+        snapshot = self.snapshot(now)
+        if self.print_summary:
+            print(self.summary_line(snapshot))
+        if self.metrics_file is not None or self._socket is not None:
+            data = json.dumps(snapshot)
+            if self.metrics_file is not None:
+                tmp_path = self.metrics_file.with_name(self.metrics_file.name + ".tmp")
+                tmp_path.write_text(data)
+                os.replace(tmp_path, self.metrics_file)
+            if self._socket is not None:
+                self._socket.sendto(data.encode(), ("127.0.0.1", self.udp_port))
+
+        if not self.cumulative:
+            for histogram in list(self.histograms.values()) + [self.latency]:
+                histogram.reset()
+        self._window_start = now
+        self._window_frames = 0
+        self._next_report = now + self._interval_ns
+        return snapshot
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+
+
+def add_metrics_arguments(arg):
+    """Add the command line arguments of the instrumentation to an argparse.ArgumentParser."""
+    arg.add_argument("--metrics-interval", type=float, default=5.0, help="seconds between metrics summaries (0 disables them)")
+    arg.add_argument("--metrics-file", type=str, default=None, help="JSON file the metrics are written to every interval")
+    arg.add_argument("--metrics-port", type=int, default=None, help="local UDP port the metrics are sent to every interval")
+
+
+def create_metrics(stages, args):
+    """Build the PipelineMetrics selected by the arguments of add_metrics_arguments."""
+    return PipelineMetrics(stages, interval=args["metrics_interval"], metrics_file=args["metrics_file"],
+                           udp_port=args["metrics_port"])
@@ -0,0 +1,214 @@
+"""
+This script tunes the cv2.aruco.DetectorParameters offline, against a recorded or synthetic frame set.
+
+With the default parameters, cv2.aruco.detectMarkers thresholds every frame at many adaptive-threshold window sizes
+(adaptiveThreshWinSizeMin/Max/Step) and checks every candidate exhaustively, which is most of the detection time. The tuner:
+    1) Samples candidate parameter sets from SEARCH_SPACE (the OpenCV defaults are always included)
+    2) Runs every candidate over the frame set in a process pool, recording the detection latency, recall, false positives
+       and corner error (see 'benchmark.py')
+    3) Re-times the fastest candidates that meet the targets (--target-recall, --max-corner-error, --max-false-positives)
+       on their own, as the timings of the parallel pass compete for the CPU cores
+    4) Saves the fastest of them as a named profile in 'detector_profiles/<name>.json', which 'pose_estimation.py',
+       'aruco_detector_video.py' and 'benchmark.py' load with --profile <name>
+
+Synthetic frames come with their true corners. For recorded images/videos, the detections of the default parameters (with
+sub-pixel corner refinement) are used as the reference instead, so the recall is relative to the defaults.
+
+Every lighting condition gets its own profile, named after the lighting unless --name is given:
+    python param_tuner.py --lighting dark
+    python param_tuner.py --lighting all
+    python param_tuner.py --images recorded_frames --name hangar
+    python pose_estimation.py --profile dark
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from arucoDict import ARUCO_DICT
+from aruco_detector import PROFILE_DIR, detector_params_from_dict, detector_params_to_dict, detect_markers
+from benchmark import detection_quality, load_image_frames, load_video_frames, score_detection, synthetic_frames
+
+
+# Values tried for every tuned parameter - all other parameters keep their OpenCV default
+SEARCH_SPACE = {
+    "adaptiveThreshWinSizeMin": [3, 5, 7, 11],
+    "adaptiveThreshWinSizeMax": [7, 11, 15, 23, 31],
+    "adaptiveThreshWinSizeStep": [4, 6, 10, 20],
+    "adaptiveThreshConstant": [5, 7, 10],
+    "minMarkerPerimeterRate": [0.02, 0.03, 0.05],
+    "polygonalApproxAccuracyRate": [0.03, 0.05],
+    "perspectiveRemovePixelPerCell": [4, 6, 8],
+    "cornerRefinementMethod": [cv2.aruco.CORNER_REFINE_NONE, cv2.aruco.CORNER_REFINE_SUBPIX],
+}
+LIGHTINGS = ("normal", "dark", "bright")
+
+
+def sample_candidates(count, seed=0):
+    """The default parameters followed by up to count - 1 distinct random (valid) combinations of SEARCH_SPACE."""
+    defaults = detector_params_to_dict(cv2.aruco.DetectorParameters_create())
+    candidates = [{name: defaults[name] for name in SEARCH_SPACE}]
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    grid = [c for c in grid if c["adaptiveThreshWinSizeMin"] <= c["adaptiveThreshWinSizeMax"] and c != candidates[0]]
+    rng = np.random.default_rng(seed)
+    for index in rng.permutation(len(grid))[:count - 1]:
+        candidates.append(grid[index])
+    return candidates
+
+
+# EVALUATION -----------------------------------------------------------------------------------------------------------
+# Frame set of the worker processes - inherited through fork, so the frames are never pickled
+_frames = {}
+
+
+def _set_frames(grays, truths, dictionary):
+    _frames["grays"] = grays
+    _frames["truths"] = truths
+    _frames["dictionary"] = dictionary
+
+
+def evaluate(params):
+    """Detection latency [ms] and quality of one candidate over the frame set."""
+    cv2.setNumThreads(1)  # Candidates are compared single-threaded, as they run in parallel
+    arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[_frames["dictionary"]])
+    arucoParams = detector_params_from_dict(params)
+    latencies, scores = [], []
+    for gray_frame, truth in zip(_frames["grays"], _frames["truths"]):
+        start = time.perf_counter_ns()
+        corners, ids, _ = detect_markers(gray_frame, arucoDict, arucoParams)
+        latencies.append(time.perf_counter_ns() - start)
+        scores.append(score_detection(corners, ids, truth))
+
+    latencies = np.asarray(latencies, dtype=np.float64) / 1e6
+    return {
+        "params": params,
+        "latency_ms_mean": float(latencies.mean()),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        **detection_quality(scores),
+    }
+
+
+def reference_truth(grays, dictionary):
+    """Detections of the default parameters with sub-pixel refinement, used as the ground truth of recorded frames."""
+    arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT[dictionary])
+    arucoParams = cv2.aruco.DetectorParameters_create()
+    arucoParams.cornerRefinementMethod = cv2.aruco.CORNER_REFINE_SUBPIX
+    truths = []
+    for gray_frame in grays:
+        corners, ids, _ = detect_markers(gray_frame, arucoDict, arucoParams)
+        truths.append({} if ids is None else {int(i): c.reshape((4, 2)) for c, i in zip(corners, ids.flatten())})
+    return truths
+
+
+def meets_targets(result, target_recall, max_corner_error, max_false_positives):
+    error = result["corner_error_px_mean"]
+    return (result["recall"] >= target_recall and result["false_positives"] <= max_false_positives
+            and (error is None or error <= max_corner_error))
+
+
+def tune(frames, dictionary="DICT_6X6_50", candidates=64, target_recall=0.98, max_corner_error=0.5,
+         max_false_positives=0, workers=None, finalists=5, seed=0):
+    """
+    Search the candidate parameter sets and return (best result, all results sorted by latency). The best result is None if
+    no candidate meets the targets.
+    """
+    grays = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image, _ in frames]
+    truths = [truth for _, truth in frames]
+    if any(truth is None for truth in truths):
+        truths = reference_truth(grays, dictionary)
+    _set_frames(grays, truths, dictionary)
+
+    # Parallel pass over all candidates - the workers are forked, so they inherit the frame set
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        results = list(executor.map(evaluate, sample_candidates(candidates, seed)))
+    results.sort(key=lambda r: r["latency_ms_mean"])
+
+    # Re-time the fastest feasible candidates one at a time, for latencies that are not distorted by the parallel pass
+    feasible = [r for r in results if meets_targets(r, target_recall, max_corner_error, max_false_positives)]
+    timed = [evaluate(r["params"]) for r in feasible[:finalists]]
+    timed = [r for r in timed if meets_targets(r, target_recall, max_corner_error, max_false_positives)]
+    best = min(timed, key=lambda r: r["latency_ms_mean"]) if timed else None
+    return best, results
+
+
+def save_profile(name, result, baseline, frame_set):
+    """Write a detector profile to PROFILE_DIR/<name>.json and return its path."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR.joinpath(f"{name}.json")
+    profile = {
+        "name": name,
+        "params": result["params"],
+        "metrics": {key: value for key, value in result.items() if key != "params"},
+        "baseline": {key: value for key, value in baseline.items() if key != "params"},
+        "frame_set": frame_set,
+        "opencv": cv2.__version__,
+    }
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+    return path
+
+
+# MAIN -----------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    arg = argparse.ArgumentParser()
+    arg.add_argument("-i", "--images", type=str, default=None, help="folder of recorded images to tune on")
+    arg.add_argument("-v", "--video", type=str, default=None, help="recorded video to tune on")
+    arg.add_argument("--synthetic", type=int, default=150, help="number of synthetic frames (if no recording is given)")
+    arg.add_argument("--lighting", type=str, default="normal", choices=LIGHTINGS + ("all",), help="lighting of the synthetic frames")
+    arg.add_argument("--seed", type=int, default=0, help="random seed of the synthetic frames and the candidate sampling")
+    arg.add_argument("--limit", type=int, default=None, help="maximum number of recorded frames to load")
+    arg.add_argument("--type", type=str, default="DICT_6X6_50", help="type of ArUco marker to detect")
+    arg.add_argument("-n", "--name", type=str, default=None, help="profile name (defaults to the lighting)")
+    arg.add_argument("--candidates", type=int, default=64, help="number of parameter sets to try")
+    arg.add_argument("--workers", type=int, default=None, help="number of parallel processes (default: one per CPU core)")
+    arg.add_argument("--target-recall", type=float, default=0.98, help="minimum recall of the tuned parameters")
+    arg.add_argument("--max-corner-error", type=float, default=0.5, help="maximum mean corner error [px]")
+    arg.add_argument("--max-false-positives", type=int, default=0, help="maximum number of false positives over the frame set")
+    args = vars(arg.parse_args())  # Convert argument to dictionary
+
+    # One tuning run per frame set - with --lighting all, one per lighting condition
+    if args["images"] is not None:
+        runs = [(args["name"] or Path(args["images"]).name, load_image_frames(args["images"], args["limit"]),
+                 {"images": args["images"]})]
+    elif args["video"] is not None:
+        runs = [(args["name"] or Path(args["video"]).stem, load_video_frames(args["video"], args["limit"]),
+                 {"video": args["video"]})]
+    else:
+        lightings = LIGHTINGS if args["lighting"] == "all" else (args["lighting"],)
+        runs = [((args["name"] if len(lightings) == 1 and args["name"] else lighting),
+                 synthetic_frames(args["synthetic"], dictionary=args["type"], lighting=lighting, seed=args["seed"]),
+                 {"synthetic": args["synthetic"], "lighting": lighting, "seed": args["seed"]})
+                for lighting in lightings]
+
+    for name, frames, frame_set in runs:
+        if not frames:
+            raise SystemExit(f"No frames to tune profile {name} on.")
+        print(f"Tuning profile '{name}' on {len(frames)} frames with {args['candidates']} candidates...")
+        best, results = tune(frames, dictionary=args["type"], candidates=args["candidates"],
+                             target_recall=args["target_recall"], max_corner_error=args["max_corner_error"],
+                             max_false_positives=args["max_false_positives"], workers=args["workers"], seed=args["seed"])
+        baseline = evaluate(sample_candidates(1)[0])
+        print(f"    defaults : {baseline['latency_ms_mean']:.2f} ms, recall {baseline['recall']:.3f}, "
+              f"corner error {baseline['corner_error_px_mean']} px")
+        if best is None:
+            print(f"    No candidate meets the targets - profile '{name}' not saved. Loosen the targets or add candidates.")
+            continue
+        print(f"    tuned    : {best['latency_ms_mean']:.2f} ms, recall {best['recall']:.3f}, "
+              f"corner error {best['corner_error_px_mean']} px")
+        print(f"    Profile saved to {save_profile(name, best, baseline, frame_set)}")
@@ -0,0 +1,121 @@
+"""
+This script performs the post-processing of the pose estimates of all markers in a frame in one vectorized pass.
+
+The rVec/tVec arrays returned by cv2.aruco.estimatePoseSingleMarkers are converted into a NumPy structured array with one
+row per marker, so that printing and any downstream consumer work on the whole batch instead of on per-marker Python scalars.
+
+Fields of POSE_DTYPE:
+    - id            : Marker ID, or BOARD_ID for the fused pose of a board of markers (see 'board_pose.py')
+    - tvec          : Translation vector (x, y, z) [same unit as the marker size, mm in this project]
+    - rvec          : Rotation vector (Rodrigues) [rad]
+    - R             : Radius, i.e. distance from the camera to the marker
+    - theta         : Polar angle in the image plane, arctan2(y, x) [rad]
+    - phi           : Inclination from the optical (z) axis, arccos(z / R) [rad]
+    - euler         : Euler angles (roll, pitch, yaw) about the camera x, y and z axes [rad]
+    - center_offset : Offset of the marker centre from the principal point [px], rightwards and upwards positive
+    - predicted     : True if the pose was predicted by the pose filter instead of measured (see 'pose_filter.py')
+
+Created by: Jalen
+"""
+
+# Third-Party Imports
+import numpy as np
+
+
+# ID of the fused pose of a board of markers - not a valid marker ID
+BOARD_ID = -1
+
+POSE_DTYPE = np.dtype([
+    ("id", np.int32),
+    ("tvec", np.float64, (3,)),
+    ("rvec", np.float64, (3,)),
+    ("R", np.float64),
+    ("theta", np.float64),
+    ("phi", np.float64),
+    ("euler", np.float64, (3,)),
+    ("center_offset", np.float64, (2,)),
+    ("predicted", np.bool_),
+])
+
+
+def rotation_matrices(rvecs):
+    """Vectorized Rodrigues formula: (N, 3) rotation vectors -> (N, 3, 3) rotation matrices."""
+    angle = np.linalg.norm(rvecs, axis=1)
+    axis = np.divide(rvecs, angle[:, None], out=np.zeros_like(rvecs), where=angle[:, None] > 0)
+    kx, ky, kz = axis[:, 0], axis[:, 1], axis[:, 2]
+    zero = np.zeros_like(kx)
+
+    K = np.stack([np.stack([zero, -kz, ky], axis=1),
+                  np.stack([kz, zero, -kx], axis=1),
+                  np.stack([-ky, kx, zero], axis=1)], axis=1)
+    sin, cos = np.sin(angle)[:, None, None], np.cos(angle)[:, None, None]
+    return np.eye(3) + sin * K + (1 - cos) * (K @ K)
+
+
+def euler_angles(rotations):
+    """(N, 3, 3) rotation matrices -> (N, 3) Euler angles (roll, pitch, yaw) in the ZYX convention [rad]."""
+    sy = np.hypot(rotations[:, 0, 0], rotations[:, 1, 0])
+    roll = np.arctan2(rotations[:, 2, 1], rotations[:, 2, 2])
+    pitch = np.arctan2(-rotations[:, 2, 0], sy)
+    yaw = np.arctan2(rotations[:, 1, 0], rotations[:, 0, 0])
+    return np.stack([roll, pitch, yaw], axis=1)
+
+
+def compute_poses(ids, corners, rVec, tVec, camMatrix, out=None):
+    """
+    Fill a structured array of POSE_DTYPE for all markers of a frame.
+
+    Arguments:
+        ids, corners    : Output of cv2.aruco.detectMarkers. Without corners (None), the marker centre is the projection of tvec.
+        rVec, tVec      : Output of cv2.aruco.estimatePoseSingleMarkers, shape (N, 1, 3)
+        camMatrix       : Camera matrix, for the principal point
+        out             : Optional preallocated POSE_DTYPE array with room for at least N markers, reused between frames
+
+    Returns a POSE_DTYPE array of length N (a view into out if it was given).
+    """
+    count = 0 if ids is None else len(ids)
+    if out is not None and len(out) >= count:
+        poses = out[:count]
+    else:
+        poses = np.empty(count, dtype=POSE_DTYPE)
+    if count == 0:
+        return poses
+
+    tvecs = np.asarray(tVec, dtype=np.float64).reshape((count, 3))
+    rvecs = np.asarray(rVec, dtype=np.float64).reshape((count, 3))
+    x, y, z = tvecs[:, 0], tvecs[:, 1], tvecs[:, 2]
+
+    poses["id"] = np.asarray(ids).reshape(count)
+    poses["tvec"] = tvecs
+    poses["rvec"] = rvecs
+    poses["R"] = np.sqrt(x**2 + y**2 + z**2)
+    poses["theta"] = np.arctan2(y, x)  # arctan2 ensures correct usage of four quadrants
+    poses["phi"] = np.arccos(np.divide(z, poses["R"], out=np.ones_like(z), where=poses["R"] > 0))
+    poses["euler"] = euler_angles(rotation_matrices(rvecs))
+
+    # Marker centre relative to the principal point, with rightwards and upwards positive
+    if corners is not None:
+        centers = np.asarray(corners, dtype=np.float64).reshape((count, 4, 2)).mean(axis=1)
+        poses["center_offset"][:, 0] = centers[:, 0] - camMatrix[0, 2]
+        poses["center_offset"][:, 1] = camMatrix[1, 2] - centers[:, 1]
+    else:
+        depth = np.where(np.abs(z) > 1e-9, z, 1e-9)
+        poses["center_offset"][:, 0] = camMatrix[0, 0] * x / depth
+        poses["center_offset"][:, 1] = -camMatrix[1, 1] * y / depth
+    poses["predicted"] = False
+    return poses
+
+
+def format_poses(poses):
+    """Human-readable summary of a batch of poses, as printed by 'pose_estimation.py'."""
+    theta_degrees = np.degrees(poses["theta"])
+    euler_degrees = np.degrees(poses["euler"])
+    lines = []
+    for pose, theta, euler in zip(poses, theta_degrees, euler_degrees):
+        name = "Board" if pose["id"] == BOARD_ID else f"Marker ID: {pose['id']}"
+        lines.append(name + (" (predicted)" if pose["predicted"] else ""))
+        lines.append(f"Translation Vector (Cartesian): {pose['tvec']} mm")
+        lines.append(f"Translation Vector (Polar): R = {pose['R']} mm, θ = {theta} degrees")
+        lines.append(f"Rotation (Euler roll, pitch, yaw): {euler} degrees")
+        lines.append("-----------------------------")
+    return "\n".join(lines)
@@ -5,69 +5,112 @@ This script can be divided into three sections:
         - Define the marker size and dictionary
 
     2) Load camera data
-        - Load the camera matrix and distortion coefficients calculated and stored in the YAML file.
+        - Load the camera matrix and distortion coefficients calculated and stored in the YAML file (see 'calibration.py').
 
     3) Execution
-        - Initialize the camera
-        - Detect any ArUco marker present in the camera frame by drawing polylines and frame axes
-        - Pose estimate and print out the translational (cartesian & polar coordinates) and rotational values of the marker
-        - Annotate the pose for better visualization purposes
+        - Start the frame source (see 'frame_source.py')
+        - Detect any ArUco marker present in the camera frame and pose estimate it (see 'stages.py' and 'aruco_detector.py')
+        - Print, publish and annotate the pose of every marker, each as an output of the asyncio runtime (see 'runtime.py')
+
+Usage:
+    python pose_estimation.py --source picamera
+    python pose_estimation.py --source synthetic --display thread
+    python pose_estimation.py --help    # All detection, pose, telemetry, recording and display options
 
 Quick note regarding the main difference between Jetson Nano & Raspberry Pi, to initialize the camera:
-    - The IMX camera module, connected to a Jetson Nano uses the imutils video stream function
-    - The Raspberry Pi (RPI) V2 camera module uses the picamera library
+    - The IMX camera module, connected to a Jetson Nano uses the imutils video stream function (--source videostream)
+    - The Raspberry Pi (RPI) V2 camera module uses the picamera library (--source picamera, default)
 
 Created by: Jalen
 """
 
 # Standard Imports
-import time
-from pathlib import Path
-import os
-
-# Third-Party Imports
-import cv2
-import numpy as np
-from picamera import PiCamera
-from picamera.array import PiRGBArray
-import yaml
+import argparse
+import asyncio
 
 # Project-Specific Imports
-from arucoDict import ARUCO_DICT
-
+from arucoDict import get_dictionary
+from calibration import load_calibration
+from frame_source import FRAME_SOURCES, create_source
+from frame_recorder import add_recorder_arguments, create_recorder
+from aruco_detector import add_detector_arguments, create_detector, load_detector_params
+from pose_batch import format_poses
+from instrumentation import add_metrics_arguments, create_metrics
+from renderer import Renderer, add_display_arguments, create_display
+from telemetry import add_telemetry_arguments, create_telemetry
+from pose_filter import add_filter_arguments, create_pose_filter
+from board_pose import add_board_arguments, create_board_engine
+from stages import PoseStage
+from runtime import (DisplayOutput, PoseSlotOutput, PrintOutput, Runtime, TelemetryOutput, add_runtime_arguments,
+                     create_services)
+from pose_slot import add_slot_arguments, create_pose_slot
+
+
+# ARGUMENTS -----------------------------------------------------------------------------------------------------------
+arg = argparse.ArgumentParser()
+arg.add_argument("-s", "--source", type=str, default="picamera", choices=FRAME_SOURCES, help="frame source to capture from")
+arg.add_argument("-v", "--video", type=str, default=None, help="path to the video file used by the 'file' frame source")
+arg.add_argument("--bus-name", type=str, default="aruco_frames", help="frame bus used by the 'bus' frame source")
+arg.add_argument("--yuv", action="store_true",
+                 help="grayscale-first capture: detect on the Y plane of YUV420 frames, colour only for display/recording")
+add_recorder_arguments(arg)  # Raw recording and replay: --record, --record-gray, --record-mb, --record-ring, --recording, --replay-realtime
+add_detector_arguments(arg)  # Detection mode: --track, --flow, --scale, --marker-pixels, --auto-scale, --profile, --ids
+arg.add_argument("-w", "--workers", type=int, default=0,
+                 help="number of detection worker processes (0 detects in the main loop, see 'detection_pool.py')")
+arg.add_argument("--when-full", type=str, default="drop", choices=("drop", "block"),
+                 help="with --workers, drop new frames or block when all workers are busy")
+arg.add_argument("--stale-after", type=float, default=None,
+                 help="with --workers, skip a frame still in flight after this many seconds once later frames are done")
+add_metrics_arguments(arg)   # Instrumentation: --metrics-interval, --metrics-file, --metrics-port
+add_display_arguments(arg)   # Display: --display inline/thread/headless, --display-fps
+add_telemetry_arguments(arg) # Pose telemetry: --telemetry-udp, --telemetry-unix, --telemetry-log, --telemetry-log-mb
+add_slot_arguments(arg)      # Latest-pose slot: --pose-slot
+add_filter_arguments(arg)    # Pose filter: --filter, --max-skip, --max-sigma-mm, --max-sigma-deg
+add_board_arguments(arg)     # Board pose: --layout, --board-max-error
+add_runtime_arguments(arg)   # Runtime: --control-port, --drain-timeout
+args = vars(arg.parse_args())  # Convert argument to dictionary
+if args["record"] is not None and args["source"] == "bus":
+    arg.error("--record needs a local frame source and cannot be used with the 'bus' frame source")
+if args["filter"] and args["workers"]:
+    arg.error("--filter skips the detection of predictable frames and cannot be combined with --workers")
 
 
 # DEFINITIONS ---------------------------------------------------------------------------------------------------------------------------------
 # Marker
 MARKER_SIZE = 60  # Square size [mm] - allow for pose and distance estimation
-arucoDict = cv2.aruco.Dictionary_get(ARUCO_DICT["DICT_6X6_50"])
-arucoParams = cv2.aruco.DetectorParameters_create()  # Use default parameters
+arucoDict = get_dictionary("DICT_6X6_50", args["ids"])  # Restricted to the deployed --ids, if given
+arucoParams = load_detector_params(args["profile"])  # Default parameters, or a tuned --profile
+
+# Detection mode - plain, ROI tracking, pyramid detection and/or optical-flow tracking (see 'aruco_detector.py')
+detect, tracker = create_detector(arucoDict, arucoParams, args)
 
 
 
 # LOAD CAMERA DATA -----------------------------------------------------------------------------------------------------------------------------
-# Load the camera matrix and distortion coefficients from YAML file
-with open('camera_calibration_final/calibration.yaml') as f:
-    loadeddict = yaml.load(f, Loader=yaml.FullLoader)
-camMatrix = loadeddict.get('camera_matrix')
-distCof = loadeddict.get('dist_coeff')
-camMatrix = np.array(camMatrix)
-distCof = np.array(distCof)
+# Load the camera matrix and distortion coefficients from YAML file, through its compiled binary cache
+camMatrix, distCof, _ = load_calibration('camera_calibration_final/calibration.yaml')
 
 print("Loaded calibration data successfully")
 
 
 
 # EXECUTION ------------------------------------------------------------------------------------------------------------
-# Initialize the picamera
-camera = PiCamera()
-camera.resolution = (640, 480)
-camera.framerate = 32
-camera.rotation = 180
-raw_capture = PiRGBArray(camera, size=(640, 480))
-time.sleep(2)
-
-last_print_time = time.time()
+# With --workers, the detection and single-marker pose run in a pool of worker processes (see 'detection_pool.py'). The pool
+# is started first, as its workers are forked and must not inherit the capture thread
+pool = None
+if args["workers"]:
+    from detection_pool import DetectionPool  # Only imported when the pool is used, for a faster start
+    pool = DetectionPool("DICT_6X6_50", arucoParams, camMatrix, distCof, MARKER_SIZE, workers=args["workers"],
+                         when_full=args["when_full"], stale_after=args["stale_after"], ids=args["ids"]).start()
+
+# Start the frame source - frames are captured on a separate thread while the runtime performs the detection
+source = create_source(args["source"], video=args["video"], resolution=(640, 480), framerate=32,
+                       bus_name=args["bus_name"], recording=args["recording"], realtime=args["replay_realtime"], yuv=args["yuv"])
+
+# Raw recording of every captured frame, written on its own thread (see 'frame_recorder.py')
+recorder = create_recorder(args)
+source.recorder = recorder
+source.start()
 
 # # Create a VideoWriter object to save the video
 # output_folder = 'Videos'
@@ -77,81 +120,53 @@ last_print_time = time.time()
 # # 10s framerate, 1000x800 resolution
 # result = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (1000, 800))     
 
-for frame in camera.capture_continuous(raw_capture, format="bgr", use_video_port=True):
-    image = frame.array
-    gray_frame = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    (corners, ids, rejected) = cv2.aruco.detectMarkers(image=gray_frame,
-                                                       dictionary=arucoDict,
-                                                       parameters=arucoParams)
-
-    # If ArUco marker is detected
-    if corners:
-        rVec, tVec, _ = cv2.aruco.estimatePoseSingleMarkers(
-            corners=corners, markerLength=MARKER_SIZE, cameraMatrix=camMatrix, distCoeffs=distCof
-        )
-
-        total_markers = range(0, ids.size)
-
-        # Print pose estimation values every 2s for each marker
-        current_time = time.time()
-        if current_time - last_print_time >= 2.0:
-            for markerID, i in zip(ids, total_markers):
-
-                #  Translation vector coordinates
-                translation_vector = tVec[i].flatten()
-                x, y, z = translation_vector
-
-                # Calculate radius (R)
-                R = np.sqrt(x**2 + y**2 + z**2)
-        
-                # Calculate polar angle (theta) in radians
-                theta = np.arctan2(y, x)  # arctan2 ensures correct usage of four quadrants
-        
-                # Convert theta to degrees for better readability
-                theta_degrees = np.degrees(theta)
-
-                print(f"Marker ID: {markerID}")
-                print(f"Translation Vector (Cartesian): {translation_vector} mm")
-                print(f"Translation Vector (Polar): R = {R} mm, θ = {theta_degrees} degrees")
-                print("-----------------------------")
-
-                # print("Translation Vector (tvec):")
-                # for value in tVec.flatten():
-                #     print(f"    {value}")
-                
-                # print("Rotation Vector (rvec):")
-                # for value in rVec.flatten():
-                #     print(f"    {value}")
-            
-            # For better visualization purposes by separating out every time step of 2 seconds
-            print()
-            print()
-            print()
-            last_print_time = current_time
-
-        
-        for markerID, corner, i in zip(ids, corners, total_markers):
-
-            topLeft, topRight, btmRight, btmLeft = corner.reshape((4, 2))
-
-            # Draw polylines on marker for better visualization
-            cv2.polylines(
-                image, [corner.astype(np.int32)], isClosed=True, color=(0, 255, 255), thickness=3, lineType=cv2.LINE_AA
-            )
-
-            # Annotate Pose
-            cv2.drawFrameAxes(image, camMatrix, distCof, rVec[i], tVec[i], length=50, thickness=3)
-
-    cv2.imshow("Pose Estimation Frame", image)
-
-    # Terminate program and cleanup when 'q' is pressed
-    key = cv2.waitKey(1)
-    if key == ord('q'):
-        break
-
-    # Clear the stream for the next frame
-    raw_capture.truncate(0)
-
-cv2.destroyAllWindows()
-vs.stop()
-
+# Per-stage timings, reported every --metrics-interval seconds (see 'instrumentation.py')
+metrics = create_metrics(("capture_wait", "color", "detect", "pose", "display"), args)
+
+# Fused pose of a board of markers with a known --layout, instead of one pose per marker (see 'board_pose.py')
+board = create_board_engine(camMatrix, distCof, args)
+
+# Predictive pose filter - detection only runs when the predicted poses are too uncertain (see 'pose_filter.py')
+pose_filter = create_pose_filter(camMatrix, args)
+
+# Detection path - detection, pose, board pose and filter of every frame (see 'stages.py')
+stage = PoseStage(detect, camMatrix, distCof, MARKER_SIZE, source, metrics, pool=pool, board=board, pose_filter=pose_filter)
+
+
+def describe_poses(result):
+    """Pose estimation values of every marker, separated from the next print by blank lines for better visualization."""
+    if result.poses is None or len(result.poses) == 0:
+        return None
+    return format_poses(result.poses) + "\n\n\n"
+
+
+# Outputs, each consuming the results on its own without delaying the detection path (see 'runtime.py')
+#   - Print the pose estimation values of each marker every 2s
+#   - Publish the pose of every marker of every frame as binary telemetry records (see 'telemetry.py')
+#   - Publish the latest pose of every marker into a shared-memory slot, for other processes to query (see 'pose_slot.py')
+#   - Draw polylines and pose axes on the markers and show the frame - terminate the program when 'q' is pressed (see 'renderer.py')
+outputs = [PrintOutput(describe_poses, interval=2.0)]
+telemetry = create_telemetry(args)
+if telemetry is not None:
+    outputs.append(TelemetryOutput(telemetry))
+pose_slot = create_pose_slot(args)
+if pose_slot is not None:
+    outputs.append(PoseSlotOutput(pose_slot))
+display = create_display(Renderer("Pose Estimation Frame", camMatrix, distCof, axis_length=50, thickness=3), args, metrics)
+outputs.append(DisplayOutput(display))
+
+runtime = Runtime(source, stage, outputs, services=create_services(args), metrics=metrics,
+                  drain_timeout=args["drain_timeout"])
+try:
+    asyncio.run(runtime.run())
+finally:
+    if recorder is not None:
+        recorder.close()
+        print(f"Recorded {recorder.recorded} frames into {args['record']}, {recorder.dropped} dropped")
+print(runtime.summary())
+if tracker is not None:
+    print(tracker.summary())
+if board is not None:
+    print(board.summary())
+if pose_filter is not None:
+    print(f"Detection ran on {pose_filter.detection_rate:.0%} of the frames")
@@ -0,0 +1,188 @@
+"""
+This script provides a predictive pose filter, so that the detection only runs when the marker pose is no longer predictable.
+
+Every marker is tracked by a constant-velocity Kalman filter over its tvec and rvec. The six axes are independent, so each
+axis is a 2-state (value, velocity) filter and the whole filter is a handful of vectorized NumPy operations per frame.
+
+On every frame, needs_detection() predicts the uncertainty of all tracked poses at the frame's capture time. Full detection
+and pose estimation only run if:
+    - Nothing is tracked, or a track has not yet been confirmed by 'min_hits' detections
+    - The predicted standard deviation of a translation exceeds 'max_sigma_t' [mm] or that of a rotation 'max_sigma_r' [rad]
+    - 'max_skip' frames have passed since the last detection
+Otherwise the poses are predicted, and flagged with predicted = True (POSE_DTYPE, see 'pose_batch.py'). During a slow, steady
+approach the detection therefore only runs every few frames, while the pose output stays at the camera rate; when the marker
+moves unpredictably, the uncertainty grows faster and the detection runs on every frame.
+
+Usage:
+    if pose_filter.needs_detection(frame.timestamp):
+        ... detect, estimatePoseSingleMarkers, compute_poses ...
+        poses = pose_filter.step(frame.timestamp, poses)
+    else:
+        poses = pose_filter.step(frame.timestamp)
+
+Created by: Jalen
+"""
+
+# Third-Party Imports
+import numpy as np
+
+# Project-Specific Imports
+from pose_batch import POSE_DTYPE, compute_poses
+
+
+def _closest_rvec(rvec, reference):
+    """The rotation vector equivalent to rvec (same rotation) that is closest to the reference, to avoid jumps at 180°."""
+    angle = np.linalg.norm(rvec)
+    if angle < 1e-9:
+        return rvec
+    alternative = rvec * (1.0 - 2.0 * np.pi / angle)
+    return alternative if np.linalg.norm(alternative - reference) < np.linalg.norm(rvec - reference) else rvec
+
+
+class _Track:
+    """Constant-velocity Kalman filter of one marker: value/velocity and 2x2 covariance (p00, p01, p11) per axis."""
+
+    def __init__(self, marker_id, z, timestamp, measurement_var, velocity_var):
+        self.id = marker_id
+        self.x = z.copy()                       # tvec (3) + rvec (3)
+        self.v = np.zeros(6)
+        self.p00 = measurement_var.copy()
+        self.p01 = np.zeros(6)
+        self.p11 = velocity_var.copy()
+        self.timestamp = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+
+    def predicted_variance(self, timestamp, q):
+        dt = max(timestamp - self.timestamp, 0.0)
+        return self.p00 + 2 * dt * self.p01 + dt * dt * self.p11 + q * dt ** 3 / 3
+
+    def predict(self, timestamp, q):
+        dt = max(timestamp - self.timestamp, 0.0)
+        if dt == 0.0:
+            return
+        self.x = self.x + dt * self.v
+        self.p00 = self.p00 + 2 * dt * self.p01 + dt * dt * self.p11 + q * dt ** 3 / 3
+        self.p01 = self.p01 + dt * self.p11 + q * dt * dt / 2
+        self.p11 = self.p11 + q * dt
+        self.timestamp = timestamp
+
+    def update(self, z, r):
+        z = z.copy()
+        z[3:] = _closest_rvec(z[3:], self.x[3:])
+        s = self.p00 + r
+        k0, k1 = self.p00 / s, self.p01 / s
+        innovation = z - self.x
+        self.x = self.x + k0 * innovation
+        self.v = self.v + k1 * innovation
+        self.p11 = self.p11 - k1 * self.p01
+        self.p01 = (1 - k0) * self.p01
+        self.p00 = (1 - k0) * self.p00
+        self.last_seen = self.timestamp
+        self.hits += 1
+
+
+class PoseFilter:
+    """
+    Per-marker constant-velocity Kalman filters with adaptive detection skipping.
+
+    Arguments:
+        camMatrix           : Camera matrix, to compute the pixel offset of the predicted poses
+        max_sigma_t         : Predicted translation standard deviation [mm] above which the detection runs
+        max_sigma_r         : Predicted rotation standard deviation [rad] above which the detection runs
+        max_skip            : Maximum number of consecutive frames without detection
+        min_hits            : Detections needed before a new track may be predicted
+        lost_after          : Seconds after which a marker that is not detected any more is dropped
+        accel_t, accel_r    : Process noise - standard deviation of the acceleration [mm/s², rad/s²]
+        noise_t, noise_r    : Measurement noise - standard deviation of a detected tvec [mm] and rvec [rad]
+        max_markers         : Room of the output pose buffer
+    """
+
+    def __init__(self, camMatrix, max_sigma_t=5.0, max_sigma_r=np.radians(2.0), max_skip=10, min_hits=3, lost_after=0.5,
+                 accel_t=200.0, accel_r=1.0, noise_t=2.0, noise_r=np.radians(1.0), max_markers=64):
+        self.camMatrix = camMatrix
+        self.max_var = np.array([max_sigma_t ** 2] * 3 + [max_sigma_r ** 2] * 3)
+        self.max_skip = max_skip
+        self.min_hits = min_hits
+        self.lost_after = lost_after
+        self.q = np.array([accel_t ** 2] * 3 + [accel_r ** 2] * 3)
+        self.r = np.array([noise_t ** 2] * 3 + [noise_r ** 2] * 3)
+        self.velocity_var = np.array([200.0 ** 2] * 3 + [1.0] * 3)  # Unknown velocity of a new track
+        self.tracks = {}
+        self.skipped = 0            # Consecutive frames without detection
+        self.detections = 0         # Frames with detection
+        self.predictions = 0        # Frames with predicted poses only
+        self._out = np.empty(max_markers, dtype=POSE_DTYPE)
+
+    @property
+    def detection_rate(self):
+        frames = self.detections + self.predictions
+        return self.detections / frames if frames else 1.0
+
+    def needs_detection(self, timestamp):
+        """Whether the full detection has to run for the frame captured at timestamp."""
+        if not self.tracks or self.skipped >= self.max_skip:
+            return True
+        for track in self.tracks.values():
+            if track.hits < self.min_hits or np.any(track.predicted_variance(timestamp, self.q) > self.max_var):
+                return True
+        return False
+
+    def step(self, timestamp, poses=None):
+        """
+        Advance the filter to the frame captured at timestamp. poses is the POSE_DTYPE array of the detection, or None if the
+        detection was skipped. Returns the poses of all tracked markers (a view into a buffer reused by the next call); those
+        that were not measured on this frame are flagged as predicted.
+        """
+        for track in self.tracks.values():
+            track.predict(timestamp, self.q)
+
+        measured = set()
+        if poses is not None:
+            self.detections += 1
+            self.skipped = 0
+            for pose in poses:
+                marker_id = int(pose["id"])
+                z = np.concatenate([pose["tvec"], pose["rvec"]])
+                if marker_id in self.tracks:
+                    self.tracks[marker_id].update(z, self.r)
+                else:
+                    self.tracks[marker_id] = _Track(marker_id, z, timestamp, self.r, self.velocity_var)
+                measured.add(marker_id)
+            # Drop the markers that have not been detected for a while
+            for marker_id in [i for i, t in self.tracks.items() if timestamp - t.last_seen > self.lost_after]:
+                del self.tracks[marker_id]
+        else:
+            self.predictions += 1
+            self.skipped += 1
+
+        tracks = list(self.tracks.values())[:len(self._out)]
+        if not tracks:
+            return self._out[:0]
+        ids = np.array([t.id for t in tracks], dtype=np.int32)
+        states = np.array([t.x for t in tracks])
+        out = compute_poses(ids, None, states[:, 3:], states[:, :3], self.camMatrix, out=self._out)
+        out["predicted"] = [t.id not in measured for t in tracks]
+        if poses is not None:
+            # Measured markers keep the pixel offset of their detected corners
+            offsets = {int(marker_id): offset for marker_id, offset in zip(poses["id"], poses["center_offset"])}
+            for index, marker_id in enumerate(ids):
+                if int(marker_id) in offsets:
+                    out["center_offset"][index] = offsets[int(marker_id)]
+        return out
+
+
+def add_filter_arguments(arg):
+    """Add the command line arguments of the pose filter to an argparse.ArgumentParser."""
+    arg.add_argument("--filter", action="store_true", help="predict the poses between detections with a Kalman filter per marker")
+    arg.add_argument("--max-skip", type=int, default=10, help="with --filter, maximum number of consecutive frames without detection")
+    arg.add_argument("--max-sigma-mm", type=float, default=5.0, help="with --filter, translation uncertainty [mm] that triggers a detection")
+    arg.add_argument("--max-sigma-deg", type=float, default=2.0, help="with --filter, rotation uncertainty [deg] that triggers a detection")
+
+
+def create_pose_filter(camMatrix, args):
+    """Build the PoseFilter selected by the arguments of add_filter_arguments, or None without --filter."""
+    if not args["filter"]:
+        return None
+    return PoseFilter(camMatrix, max_sigma_t=args["max_sigma_mm"], max_sigma_r=np.radians(args["max_sigma_deg"]),
+                      max_skip=args["max_skip"])
@@ -0,0 +1,413 @@
+"""
+This script publishes the latest pose of every marker into a shared-memory slot, and serves it to other processes on the
+companion computer (e.g. the mission logic and the gimbal controller) on demand, at their own rate.
+
+The slot is a single multiprocessing.shared_memory block with one writer (the pose pipeline) and any number of readers:
+    - Header    : Geometry of the slot, seqlock sequence number, number of markers, sequence number and capture time of the
+                  latest frame, closed flag and PID of the writer
+    - Table     : Latest pose of every marker seen so far (SLOT_DTYPE - the POSE_DTYPE fields of 'pose_batch.py' plus the
+                  sequence number and capture time of the frame it was measured or predicted on)
+
+Every frame is published under a seqlock: the writer makes the sequence number odd, updates the rows of the markers of the
+frame and the header, and makes it even again. A reader copies the table between two reads of the sequence number and retries
+if it changed or was odd. A row is invalid (seq -1) until all its fields are written, so that an update failing half-way
+leaves invalid rows that readers skip rather than a torn table. Readers never write into the block, so they can never block
+or slow down the detector, and a read is a copy of a few kB - a few microseconds. Markers that are not in the latest frame
+keep their last pose, and the age of each pose follows from its capture time (time.monotonic(), which is shared by all
+processes of the machine).
+
+Query API - a line-based Unix-domain socket server (a separate process, reading the slot like any other reader), which
+answers every request line with one JSON line:
+    pose            : Latest pose of every marker, with its age [s]
+    pose <id>       : Latest pose of one marker ({"markers": []} if it was never seen)
+    status          : Sequence number and age of the latest frame, and whether the writer is still running
+
+Usage:
+    python pose_estimation.py --pose-slot aruco_pose
+    python pose_slot.py --mode serve --name aruco_pose --socket /tmp/aruco_pose_query.sock
+    python pose_slot.py --mode query --socket /tmp/aruco_pose_query.sock --id 25     # Stand-in client
+    python pose_slot.py --mode read --name aruco_pose                                # Direct shared-memory reads
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import argparse
+import json
+import os
+import socket
+import socketserver
+import time
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+# Third-Party Imports
+import numpy as np
+
+# Project-Specific Imports
+from pose_batch import POSE_DTYPE
+
+
+MAGIC = 0x9D5E0A71
+HEADER_FIELDS = 16
+(MAGIC_FIELD, CAPACITY_FIELD, SEQUENCE_FIELD, COUNT_FIELD, FRAME_SEQ_FIELD, FRAME_TIME_FIELD, CLOSED_FIELD,
+ WRITER_PID_FIELD) = range(8)
+
+SLOT_DTYPE = np.dtype([("seq", np.int64), ("timestamp", np.float64)] + POSE_DTYPE.descr)
+
+# Consistent copy of the slot - frame_seq/frame_time of the latest frame, poses a SLOT_DTYPE array (one row per marker)
+SlotSnapshot = namedtuple("SlotSnapshot", ["frame_seq", "frame_time", "poses"])
+
+
+def _table_offset():
+    return (HEADER_FIELDS * 8 + 63) // 64 * 64  # Rows aligned to a cache line
+
+
+# POSE SLOT ------------------------------------------------------------------------------------------------------------
+class PoseSlot:
+    """
+    Shared-memory latest-pose slot. Use PoseSlot.create() in the pose pipeline and PoseSlot.attach() in the readers.
+
+    Arguments:
+        shm     : The multiprocessing.shared_memory.SharedMemory block
+        owner   : Whether this process created the block - the single writer, which unlinks it on close
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if self.header[MAGIC_FIELD] != MAGIC:
+            raise ValueError(f"Shared memory block {shm.name} is not a pose slot")
+        self.frame_time = np.ndarray((1,), dtype=np.float64, buffer=shm.buf, offset=FRAME_TIME_FIELD * 8)
+        self.capacity = int(self.header[CAPACITY_FIELD])
+        self.table = np.ndarray((self.capacity,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=_table_offset())
+
+        self.published = 0      # Writer only - frames published
+        self.overflow = 0       # Writer only - poses not published because the table was full
+        self._rows = {}         # Writer only - marker ID -> row of the table
+
+    @classmethod
+    def create(cls, name, capacity=64):
+        """Create a new slot with room for capacity markers, replacing any stale slot of that name."""
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=_table_offset() + capacity * SLOT_DTYPE.itemsize)
+
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[CAPACITY_FIELD] = capacity
+        header[FRAME_SEQ_FIELD] = -1
+        header[WRITER_PID_FIELD] = os.getpid()
+        np.ndarray((capacity,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=_table_offset())["seq"] = -1  # No pose yet
+        header[MAGIC_FIELD] = MAGIC  # Written last, so that a reader never attaches to a half-initialized slot
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, timeout=None):
+        """Attach to an existing slot, waiting up to timeout seconds (None waits forever) for the pose pipeline to create it."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+                # The block belongs to the pose pipeline - do not let this process' resource tracker unlink it on exit
+                resource_tracker.unregister(shm._name, "shared_memory")
+                if np.ndarray((1,), dtype=np.int64, buffer=shm.buf)[MAGIC_FIELD] == MAGIC:
+                    return cls(shm, owner=False)
+                shm.close()  # Still being initialized by the pose pipeline
+            except FileNotFoundError:
+                pass
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Pose slot {name} is not available")
+            time.sleep(0.1)
+
+    # Writer -----------------------------------------------------------------------------------------------------------
+    def publish(self, seq, timestamp, poses):
+        """Publish the poses (POSE_DTYPE array) of a frame. Markers not in the frame keep their previous pose."""
+        if poses.dtype != POSE_DTYPE:
+            raise TypeError(f"Poses of dtype {poses.dtype} cannot be published, expected POSE_DTYPE (see 'pose_batch.py')")
+        seq, timestamp = int(seq), float(timestamp)
+        header, table = self.header, self.table
+        rows = []
+        for marker_id in poses["id"]:
+            row = self._rows.get(int(marker_id))
+            if row is None:
+                if len(self._rows) == self.capacity:
+                    self.overflow += 1
+                    rows.append(-1)
+                    continue
+                row = self._rows[int(marker_id)] = len(self._rows)
+            rows.append(row)
+        rows = np.asarray(rows, dtype=np.intp)
+        kept = rows >= 0
+        rows, poses = rows[kept], poses[kept]
+
+        header[SEQUENCE_FIELD] += 1  # Odd - readers retry until the update is complete
+        try:
+            # The rows stay invalid until all their fields are written, and the header is only updated once they are
+            table["seq"][rows] = -1
+            for name in POSE_DTYPE.names:
+                table[name][rows] = poses[name]
+            table["timestamp"][rows] = timestamp
+            table["seq"][rows] = seq
+            header[COUNT_FIELD] = len(self._rows)
+            self.frame_time[0] = timestamp
+            header[FRAME_SEQ_FIELD] = seq
+        finally:
+            header[SEQUENCE_FIELD] += 1  # Even - consistent again, with the rows of a failed update invalid
+        self.published += 1
+
+    @property
+    def closed(self):
+        return bool(self.header[CLOSED_FIELD])
+
+    def reader(self):
+        return PoseSlotReader(self)
+
+    def close(self):
+        """Detach from the slot. The writer also marks it closed and removes it."""
+        if self.owner:
+            self.header[CLOSED_FIELD] = 1
+        # Drop the NumPy views before closing the shared memory block, which cannot be closed while they exist
+        self.header = self.frame_time = self.table = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PoseSlotReader:
+    """
+    One reader of a PoseSlot, with a preallocated copy of the table. read() returns a SlotSnapshot whose poses are a view of
+    that copy, overwritten by the next read() - copy them to keep them. Invalid rows (seq -1) are left out.
+    """
+
+    def __init__(self, slot, max_retries=10000):
+        self.slot = slot
+        self.max_retries = max_retries
+        self.reads = 0          # Consistent reads
+        self.retries = 0        # Copies discarded because the writer was publishing
+        self._out = np.empty(slot.capacity, dtype=SLOT_DTYPE)
+
+    def read(self):
+        """Consistent copy of the slot, or None if the writer stayed in the middle of an update (e.g. it died there)."""
+        header = self.slot.header
+        for attempt in range(self.max_retries):
+            before = int(header[SEQUENCE_FIELD])
+            if not before & 1:
+                count = int(header[COUNT_FIELD])
+                frame_seq = int(header[FRAME_SEQ_FIELD])
+                frame_time = float(self.slot.frame_time[0])
+                np.copyto(self._out[:count], self.slot.table[:count])
+                if int(header[SEQUENCE_FIELD]) == before:
+                    self.reads += 1
+                    poses = self._out[:count]
+                    if np.any(poses["seq"] < 0):
+                        poses = poses[poses["seq"] >= 0]  # Rows of an update that failed half-way
+                    return SlotSnapshot(frame_seq, frame_time, poses)
+            self.retries += 1
+            if attempt % 100 == 99:
+                time.sleep(0)  # Let the writer finish its update
+        return None
+
+    def latest(self, marker_id=None):
+        """Latest poses (all markers, or only marker_id) and their age [s], or None if the slot could not be read."""
+        snapshot = self.read()
+        if snapshot is None:
+            return None
+        poses = snapshot.poses
+        if marker_id is not None:
+            poses = poses[poses["id"] == marker_id]
+        return poses, time.monotonic() - poses["timestamp"]
+
+
+def pose_json(pose, age):
+    """JSON-serializable dictionary of a SLOT_DTYPE row."""
+    return {
+        "id": int(pose["id"]),
+        "age_s": float(age),
+        "seq": int(pose["seq"]),
+        "timestamp": float(pose["timestamp"]),
+        "predicted": bool(pose["predicted"]),
+        "tvec": pose["tvec"].tolist(),
+        "rvec": pose["rvec"].tolist(),
+        "R": float(pose["R"]),
+        "theta": float(pose["theta"]),
+        "phi": float(pose["phi"]),
+        "euler": pose["euler"].tolist(),
+        "center_offset": pose["center_offset"].tolist(),
+    }
+
+
+# QUERY SERVICE --------------------------------------------------------------------------------------------------------
+class PoseQueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix-domain socket server answering pose queries from a pose slot (see the module docstring for the requests). Every
+    connection gets its own reader of the slot; the slot is re-attached when the pose pipeline restarts.
+
+    Arguments:
+        path        : Path of the Unix-domain socket (replaced if it exists)
+        name        : Name of the pose slot
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, name):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.path = path
+        self.name = name
+        self.slot = PoseSlot.attach(name)
+        super().__init__(path, _QueryHandler)
+
+    def current_slot(self):
+        """The attached slot - re-attached once the writer has closed it, e.g. after a restart of the pose pipeline."""
+        if self.slot.closed:
+            try:
+                slot = PoseSlot.attach(self.name, timeout=0)
+            except TimeoutError:
+                return self.slot
+            self.slot = slot  # The previous block stays mapped for the connections still reading it
+        return self.slot
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        slot, reader = None, None
+        for line in self.rfile:
+            request = line.decode(errors="replace").split()
+            if not request:
+                continue
+            if self.server.current_slot() is not slot:
+                slot = self.server.current_slot()
+                reader = slot.reader()
+            reply = self.answer(slot, reader, request)
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+    @staticmethod
+    def answer(slot, reader, request):
+        if request[0] == "status":
+            snapshot = reader.read()
+            if snapshot is None:
+                return {"error": "pose slot is being updated"}
+            return {"frame_seq": snapshot.frame_seq, "frame_age_s": time.monotonic() - snapshot.frame_time
+                    if snapshot.frame_seq >= 0 else None, "markers": len(snapshot.poses), "writer_running": not slot.closed}
+        if request[0] == "pose":
+            try:
+                marker_id = int(request[1]) if len(request) > 1 else None
+            except ValueError:
+                return {"error": f"invalid marker ID {request[1]}"}
+            latest = reader.latest(marker_id)
+            if latest is None:
+                return {"error": "pose slot is being updated"}
+            return {"markers": [pose_json(pose, age) for pose, age in zip(*latest)]}
+        return {"error": f"unknown request {request[0]}, expected 'pose [id]' or 'status'"}
+
+
+class PoseQueryClient:
+    """Stand-in client of the query service, e.g. for the mission logic or for tests."""
+
+    def __init__(self, path, timeout=1.0):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(str(path))
+        self._file = self._socket.makefile("rb")
+
+    def request(self, line):
+        self._socket.sendall(line.encode() + b"\n")
+        return json.loads(self._file.readline())
+
+    def latest(self, marker_id=None):
+        """Latest pose of every marker, or of one marker, as a list of dictionaries with their age_s."""
+        reply = self.request("pose" if marker_id is None else f"pose {marker_id}")
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply["markers"]
+
+    def status(self):
+        return self.request("status")
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# CONFIGURATION --------------------------------------------------------------------------------------------------------
+def add_slot_arguments(arg):
+    """Add the command line arguments of the pose slot to an argparse.ArgumentParser."""
+    arg.add_argument("--pose-slot", type=str, default=None,
+                     help="publish the latest pose of every marker into the shared-memory slot of this name (see 'pose_slot.py')")
+
+
+def create_pose_slot(args):
+    """Build the PoseSlot selected by the arguments of add_slot_arguments, or None without --pose-slot."""
+    if args["pose_slot"] is None:
+        return None
+    return PoseSlot.create(args["pose_slot"])
+
+
+# QUERY SERVICE / STAND-IN CLIENT --------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    arg = argparse.ArgumentParser()
+    arg.add_argument("-m", "--mode", type=str, default="serve", choices=("serve", "query", "read"),
+                     help="run the query service, query it as a client, or read the slot directly")
+    arg.add_argument("-n", "--name", type=str, default="aruco_pose", help="name of the shared-memory pose slot")
+    arg.add_argument("--socket", type=str, default="/tmp/aruco_pose_query.sock", help="Unix-domain socket of the query service")
+    arg.add_argument("--id", type=int, default=None, help="marker ID to query (default: all markers)")
+    arg.add_argument("--rate", type=float, default=2.0, help="queries/reads per second of the client (0 queries once)")
+    args = vars(arg.parse_args())  # Convert argument to dictionary
+
+    try:
+        if args["mode"] == "serve":
+            print(f"Waiting for pose slot '{args['name']}'...")
+            with PoseQueryServer(args["socket"], args["name"]) as server:
+                print(f"Serving pose slot '{args['name']}' on {args['socket']} - press Ctrl+C to stop")
+                server.serve_forever()
+
+        elif args["mode"] == "query":
+            with PoseQueryClient(args["socket"]) as client:
+                while True:
+                    for marker in client.latest(args["id"]):
+                        print(f"id={marker['id']} age={marker['age_s'] * 1e3:.1f} ms tvec={marker['tvec']} "
+                              f"R={marker['R']:.1f}{' (predicted)' if marker['predicted'] else ''}")
+                    if not args["rate"]:
+                        break
+                    time.sleep(1.0 / args["rate"])
+
+        else:
+            slot = PoseSlot.attach(args["name"])
+            reader = slot.reader()
+            while True:
+                start = time.perf_counter_ns()
+                latest = reader.latest(args["id"])
+                elapsed_us = (time.perf_counter_ns() - start) / 1e3
+                if latest is not None:
+                    for pose, age in zip(*latest):
+                        print(f"id={pose['id']} age={age * 1e3:.1f} ms tvec={pose['tvec']}")
+                print(f"[pose slot] read in {elapsed_us:.1f} us, {reader.retries} retries over {reader.reads} reads")
+                if not args["rate"]:
+                    break
+                time.sleep(1.0 / args["rate"])
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,217 @@
+"""
+This script contains the annotation and display of the detection results, shared by 'pose_estimation.py',
+'aruco_detector_video.py' and 'camera_calibration_final/real_time_validation.py'.
+
+Renderer:
+    Draws the detections of a frame - the marker outlines (or the outline, centre and ID of each tag), the pose axes of each
+    marker and optionally a cross at the principal point.
+
+Display modes (--display):
+    - inline    : Annotate and show every frame on the calling thread (cv2.imshow + cv2.waitKey) - in the runtime, the
+                  display output's own thread (see 'runtime.py')
+    - thread    : The detection loop only hands over the latest frame and result. A separate thread annotates a copy of the
+                  latest frame and shows it at no more than --display-fps frames/second, so the display never stalls the
+                  detection. Frames arriving faster than that are simply not shown.
+    - headless  : No annotation and no window at all (e.g. on the drone)
+
+With metrics (see 'instrumentation.py'), the annotation and cv2.imshow/cv2.waitKey of every frame shown are timed into its
+"display" stage, on the thread that shows the frame.
+
+Usage:
+    display = create_display(Renderer("Pose Estimation Frame", camMatrix, distCof), args, metrics)
+    while True:
+        ...
+        if display.show(image, corners, ids, poses):
+            break   # 'q' was pressed
+    display.close()
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import threading
+import time
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from frame_source import to_bgr
+
+
+DISPLAY_MODES = ("inline", "thread", "headless")
+
+
+# ANNOTATION -----------------------------------------------------------------------------------------------------------
+def annotate_tags(frame, markerID, topLeft, topRight, btmRight, btmLeft):
+    """Draw the bounding box, centre point and ID of a detected marker onto the frame."""
+    cv2.line(frame, topLeft, topRight, (0, 255, 0), 2)
+    cv2.line(frame, topRight, btmRight, (0, 255, 0), 2)
+    cv2.line(frame, btmRight, btmLeft, (0, 255, 0), 2)
+    cv2.line(frame, btmLeft, topLeft, (0, 255, 0), 2)
+
+    cX = int((topLeft[0] + btmRight[0]) / 2.0)
+    cY = int((topLeft[1] + btmRight[1]) / 2.0)
+    cv2.circle(frame, (cX, cY), 4, (0, 0, 255), -1)
+
+    cv2.putText(frame, str(markerID), (topLeft[0], topLeft[1] - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+
+class Renderer:
+    """
+    Annotation of the detections of a frame.
+
+    Arguments:
+        window          : Name of the display window
+        camMatrix       : Camera matrix, needed to draw the pose axes and the principal point
+        distCof         : Distortion coefficients, needed to draw the pose axes
+        tags            : Draw the outline, centre and ID of each tag (annotate_tags) instead of the marker polylines
+        axis_length     : Length of the pose axes, in the unit of the translation vectors
+        thickness       : Line thickness of the polylines and pose axes
+        center_cross    : Draw a cross at the principal point
+    """
+
+    def __init__(self, window, camMatrix=None, distCof=None, tags=False, axis_length=50, thickness=3, center_cross=False):
+        self.window = window
+        self.camMatrix = camMatrix
+        self.distCof = distCof
+        self.tags = tags
+        self.axis_length = axis_length
+        self.thickness = thickness
+        self.center_cross = center_cross
+
+    def render(self, image, corners, ids, poses=None):
+        """Draw the detections (and poses, a POSE_DTYPE array) onto the image, in place."""
+        if corners is not None and len(corners) > 0:
+            if self.tags:
+                for markerCorners, markerID in zip(corners, np.asarray(ids).flatten()):
+                    # Corner are always in the order: top-left, top-right, bottom-right, bottom-left
+                    topLeft, topRight, btmRight, btmLeft = (tuple(int(v) for v in p) for p in markerCorners.reshape((4, 2)))
+                    annotate_tags(image, markerID, topLeft, topRight, btmRight, btmLeft)
+            else:
+                cv2.polylines(image, [np.asarray(c).astype(np.int32) for c in corners], isClosed=True, color=(0, 255, 255),
+                              thickness=self.thickness, lineType=cv2.LINE_AA)
+
+        if poses is not None and self.camMatrix is not None:
+            for pose in poses:
+                cv2.drawFrameAxes(image, self.camMatrix, self.distCof, pose["rvec"], pose["tvec"], length=self.axis_length,
+                                  thickness=self.thickness)
+
+        if self.center_cross and self.camMatrix is not None:
+            center = (int(self.camMatrix[0, 2]), int(self.camMatrix[1, 2]))
+            cv2.drawMarker(image, center, color=(0, 255, 0), markerType=cv2.MARKER_CROSS, markerSize=20, thickness=2)
+        return image
+
+
+# DISPLAYS -------------------------------------------------------------------------------------------------------------
+class HeadlessDisplay:
+    """No annotation and no window."""
+
+    def __init__(self, renderer=None, metrics=None):
+        self.renderer = renderer
+        self.metrics = metrics  # PipelineMetrics with a "display" stage, or None
+        self.shown = 0
+
+    def show(self, image, corners, ids, poses=None):
+        """Hand over a frame and its detections. Returns True once 'q' has been pressed in the window."""
+        return False
+
+    def close(self):
+        pass
+
+
+class InlineDisplay(HeadlessDisplay):
+    """Annotate and show every frame on the calling thread."""
+
+    def show(self, image, corners, ids, poses=None):
+        t = time.perf_counter_ns()
+        # Colour image to draw onto - converted from grayscale-first frames, and copied from read-only views (frame bus, replay)
+        image = to_bgr(image)
+        self.renderer.render(image, corners, ids, poses)
+        cv2.imshow(self.renderer.window, image)
+        self.shown += 1
+        key = cv2.waitKey(1) & 0xFF  # Waits for a key event for 1ms, extract the least significant 8 bits of results
+        if self.metrics is not None:
+            self.metrics.lap("display", t)
+        return key == ord('q')
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+
+class ThreadedDisplay(HeadlessDisplay):
+    """
+    Annotate and show the latest frame on a separate thread, at no more than max_fps frames/second.
+
+    show() only swaps references under a lock - the frame must not be modified by the caller afterwards, which holds for the
+    frame sources as they capture every frame into a new array. The display thread annotates a copy of the frame (or its
+    colour conversion, for grayscale-first frames), so the conversion is only paid for the frames actually shown.
+    """
+
+    def __init__(self, renderer, max_fps=15.0, metrics=None):
+        super().__init__(renderer, metrics)
+        self.period = 1.0 / max_fps if max_fps else 0.0
+        self._latest = None
+        self._lock = threading.Lock()
+        self._new_frame = threading.Event()
+        self._stop = threading.Event()
+        self._quit = False
+        self._thread = threading.Thread(target=self._run, name="display", daemon=True)
+        self._thread.start()
+
+    def show(self, image, corners, ids, poses=None):
+        # The pose array is usually a view into a buffer reused by the next frame, so it is copied
+        latest = (image, corners, ids, None if poses is None else np.array(poses))
+        with self._lock:
+            self._latest = latest
+        self._new_frame.set()
+        return self._quit
+
+    def _run(self):
+        next_show = time.monotonic()
+        while not self._stop.is_set():
+            if not self._new_frame.wait(timeout=0.1):
+                # Keep the window responsive while no frame arrives
+                if self.shown and (cv2.waitKey(1) & 0xFF) == ord('q'):
+                    self._quit = True
+                continue
+
+            # Rate limit - frames handed over while waiting are replaced by the latest one
+            delay = next_show - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            with self._lock:
+                image, corners, ids, poses = self._latest
+                self._new_frame.clear()
+            next_show = time.monotonic() + self.period
+
+            t = time.perf_counter_ns()
+            image = self.renderer.render(to_bgr(image, copy=True), corners, ids, poses)
+            cv2.imshow(self.renderer.window, image)
+            self.shown += 1
+            if (cv2.waitKey(1) & 0xFF) == ord('q'):
+                self._quit = True
+            if self.metrics is not None:
+                self.metrics.lap("display", t)
+        cv2.destroyAllWindows()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def add_display_arguments(arg):
+    """Add the command line arguments of the display to an argparse.ArgumentParser."""
+    arg.add_argument("--display", type=str, default="inline", choices=DISPLAY_MODES,
+                     help="show the annotated frames on the calling thread, on a separate rate-limited thread, or not at all")
+    arg.add_argument("--display-fps", type=float, default=15.0, help="maximum frame rate of the 'thread' display")
+
+
+def create_display(renderer, args, metrics=None):
+    """Build the display selected by the arguments of add_display_arguments, timed into the "display" stage of metrics."""
+    if args["display"] == "headless":
+        return HeadlessDisplay(renderer, metrics)
+    if args["display"] == "thread":
+        return ThreadedDisplay(renderer, max_fps=args["display_fps"], metrics=metrics)
+    return InlineDisplay(renderer, metrics)
@@ -0,0 +1,361 @@
+"""
+This script contains the asyncio runtime shared by 'pose_estimation.py' and 'aruco_detector_video.py'.
+
+The entry points used to be a single loop doing everything in turn - capture, detection, pose, telemetry, printing and the
+display - so that every output added its own time to the detection path, and nothing else (commands, health checks) could
+run next to it. The Runtime splits the work between:
+    - The processing loop, the only task on the detection path. It awaits the next frame on a capture executor thread and
+      the CPU-bound stage (see 'stages.py') on a detection executor thread, so the event loop itself never blocks, and hands
+      every result to the outputs without waiting for them.
+    - Outputs, one asyncio task each with its own bounded queue (fan-out). When an output falls behind, its oldest queued
+      results are dropped and counted, so a slow output never slows down the detection or the other outputs. Outputs with
+      blocking work (the display) run it on their own executor thread.
+    - Services, any other coroutines run next to the loop, e.g. the ControlServer answering 'status' health checks and
+      'quit' commands over TCP (--control-port).
+
+Shutdown is clean whatever triggers it - end of the stream, Ctrl+C/SIGTERM, the 'q' key of the display or a 'quit' command:
+the processing loop is cancelled, the outputs are given --drain-timeout seconds to empty their queues, all tasks are
+cancelled and awaited, and the executors, the frame source, the stage and the outputs are closed.
+
+Usage:
+    runtime = Runtime(source, stage, outputs=[PrintOutput(describe), DisplayOutput(display)], metrics=metrics)
+    asyncio.run(runtime.run())
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import asyncio
+import json
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# OUTPUTS --------------------------------------------------------------------------------------------------------------
+class Output:
+    """
+    Async consumer of the results of the processing stage, fed through its own bounded queue. Subclasses implement
+    consume(result), and close() if they own resources.
+
+    Arguments:
+        queue_size  : Results waiting for the output before the oldest ones are dropped
+    """
+
+    name = "output"
+
+    def __init__(self, queue_size=1):
+        self.queue_size = queue_size
+        self.consumed = 0           # Results consumed
+        self.dropped = 0            # Results dropped because the output fell behind
+        self.queue = None
+
+    def offer(self, result):
+        """Queue a result without ever waiting - the oldest queued result is dropped if the queue is full."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.dropped += 1
+        self.queue.put_nowait(result)
+
+    async def run(self, runtime):
+        while True:
+            result = await self.queue.get()
+            try:
+                await self.consume(result)
+                self.consumed += 1
+            finally:
+                self.queue.task_done()
+
+    async def consume(self, result):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class PrintOutput(Output):
+    """
+    Print the text that describe(result) returns for a result - or nothing if it returns None - at most once every
+    interval seconds (0 prints every described result).
+    """
+
+    name = "print"
+
+    def __init__(self, describe, interval=0.0, queue_size=8):
+        super().__init__(queue_size)
+        self.describe = describe
+        self.interval = interval
+        self._last_print = None
+
+    async def consume(self, result):
+        now = time.monotonic()
+        if self._last_print is not None and now - self._last_print < self.interval:
+            return
+        text = self.describe(result)
+        if text is not None:
+            print(text)
+            self._last_print = now
+
+
+class TelemetryOutput(Output):
+    """Publish the poses of every result (see 'telemetry.py'). Publishing never blocks, so it runs on the event loop."""
+
+    name = "telemetry"
+
+    def __init__(self, telemetry, queue_size=64):
+        super().__init__(queue_size)
+        self.telemetry = telemetry
+
+    async def consume(self, result):
+        if result.poses is not None and len(result.poses) > 0:
+            self.telemetry.publish(result.seq, result.timestamp, result.poses)
+
+    async def close(self):
+        self.telemetry.close()
+
+
+class PoseSlotOutput(Output):
+    """
+    Publish the poses of every result into a shared-memory latest-pose slot (see 'pose_slot.py'), on the event loop as
+    publishing takes microseconds. Frames without markers are published too, so that readers see the pipeline is alive.
+    """
+
+    name = "pose_slot"
+
+    def __init__(self, slot, queue_size=64):
+        super().__init__(queue_size)
+        self.slot = slot
+
+    async def consume(self, result):
+        if result.poses is not None:
+            self.slot.publish(result.seq, result.timestamp, result.poses)
+
+    async def close(self):
+        self.slot.close()
+
+
+class DisplayOutput(Output):
+    """
+    Show the latest result on a display of 'renderer.py', on a thread of its own as cv2.imshow/cv2.waitKey block. Only the
+    latest result is queued, so the display shows what it can keep up with. Pressing 'q' stops the runtime.
+    """
+
+    name = "display"
+
+    def __init__(self, display):
+        super().__init__(queue_size=1)
+        self.display = display
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="display")
+
+    async def run(self, runtime):
+        self._runtime = runtime
+        await super().run(runtime)
+
+    async def consume(self, result):
+        loop = asyncio.get_running_loop()
+        quit_requested = await loop.run_in_executor(self._executor, self.display.show, result.image, result.corners,
+                                                    result.ids, result.poses)
+        if quit_requested:
+            self._runtime.stop()
+
+    async def close(self):
+        # The window is destroyed by the thread that created it
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.display.close)
+        self._executor.shutdown(wait=True)
+
+
+# SERVICES -------------------------------------------------------------------------------------------------------------
+class ControlServer:
+    """
+    Line-based TCP control of the runtime - 'status' answers a JSON health report (see Runtime.status), 'quit' stops the
+    runtime. Try it with: nc 127.0.0.1 <port>
+    """
+
+    name = "control"
+    COMMANDS = ("status", "quit", "help")
+
+    def __init__(self, port, host="127.0.0.1"):
+        self.port = port
+        self.host = host
+
+    async def run(self, runtime):
+        async def handle(reader, writer):
+            try:
+                while not reader.at_eof():
+                    line = await reader.readline()
+                    command = line.decode(errors="replace").strip().lower()
+                    if not command:
+                        continue
+                    if command == "status":
+                        reply = json.dumps(runtime.status())
+                    elif command == "quit":
+                        runtime.stop()
+                        reply = "stopping"
+                    else:
+                        reply = f"commands: {', '.join(self.COMMANDS)}"
+                    writer.write(reply.encode() + b"\n")
+                    await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+
+# RUNTIME --------------------------------------------------------------------------------------------------------------
+class Runtime:
+    """
+    Capture -> processing stage -> fan-out to the outputs, on an asyncio event loop.
+
+    Arguments:
+        source          : Started frame source (see 'frame_source.py') - stopped by the runtime
+        stage           : Processing stage with process(frame, start) -> list of results, flush() -> list of results at the
+                          end of the stream and close() (see 'stages.py'), only ever called from the detection executor thread
+        outputs         : Outputs receiving every result (Output subclasses)
+        services        : Objects with a coroutine run(runtime), run next to the processing loop (e.g. ControlServer)
+        metrics         : PipelineMetrics (see 'instrumentation.py') - its capture_wait stage is timed by the runtime
+        drain_timeout   : Seconds the outputs get to empty their queues on shutdown
+        poll_interval   : Seconds a frame read waits before checking again whether the runtime was stopped
+    """
+
+    def __init__(self, source, stage, outputs=(), services=(), metrics=None, drain_timeout=1.0, poll_interval=0.1):
+        self.source = source
+        self.stage = stage
+        self.outputs = list(outputs)
+        self.services = list(services)
+        self.metrics = metrics
+        self.drain_timeout = drain_timeout
+        self.poll_interval = poll_interval
+
+        self.frames = 0             # Frames processed
+        self.results = 0            # Results fanned out
+        self._started = None
+        self._last_result = None    # time.monotonic() of the last result
+        self._stopping = None
+
+    def stop(self):
+        """Request a clean shutdown - safe to call from any task, signal handler or (through the loop) any thread."""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def status(self):
+        """Health report of the runtime, its source and outputs."""
+        now = time.monotonic()
+        elapsed = now - self._started if self._started is not None else 0.0
+        return {
+            "uptime_s": elapsed,
+            "frames": self.frames,
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+            "results": self.results,
+            "last_result_age_s": now - self._last_result if self._last_result is not None else None,
+            "source_running": self.source.running,
+            "source_dropped": self.source.dropped,
+            "outputs": {output.name: {"consumed": output.consumed, "dropped": output.dropped,
+                                      "queued": output.queue.qsize() if output.queue is not None else 0}
+                        for output in self.outputs},
+        }
+
+    async def _process_loop(self, capture_executor, detect_executor):
+        """The detection path - capture and process every frame in order, and fan the results out."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = self.metrics.now() if self.metrics is not None else None
+            frame = await loop.run_in_executor(capture_executor, self.source.read, self.poll_interval)
+            if frame is None:
+                if self.source.running:
+                    continue  # Read timed out - check for cancellation and wait again
+                break
+            if self.metrics is not None:
+                start = self.metrics.lap("capture_wait", start)
+
+            results = await loop.run_in_executor(detect_executor, self.stage.process, frame, start)
+            self.frames += 1
+            self._fan_out(results)
+
+        # End of the stream - the results of the frames still in flight in the stage (e.g. a detection pool)
+        self._fan_out(await loop.run_in_executor(detect_executor, self.stage.flush))
+
+    def _fan_out(self, results):
+        """Hand the results to every output, without waiting for any of them."""
+        for result in results:
+            for output in self.outputs:
+                output.offer(result)
+            self.results += 1
+            self._last_result = time.monotonic()
+
+    async def run(self):
+        """Run until the stream ends or stop() is called, then shut everything down."""
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._started = time.monotonic()
+        handled = []
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+                handled.append(sig)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass  # Not on the main thread, or not supported by the platform - Ctrl+C then raises KeyboardInterrupt
+
+        # One thread each for capture and detection - the stage keeps tracking state and must see the frames in order
+        capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        detect_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="detect")
+        for output in self.outputs:
+            output.queue = asyncio.Queue(maxsize=output.queue_size)
+        tasks = [asyncio.create_task(output.run(self)) for output in self.outputs]
+        tasks += [asyncio.create_task(service.run(self)) for service in self.services]
+        processing = asyncio.create_task(self._process_loop(capture_executor, detect_executor))
+        stopping = asyncio.create_task(self._stopping.wait())
+        try:
+            await asyncio.wait([processing, stopping, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            processing.cancel()
+            stopping.cancel()
+            await asyncio.gather(processing, stopping, return_exceptions=True)
+
+            # Let the outputs catch up with what is queued, then cancel them and the services
+            drains = [asyncio.ensure_future(output.queue.join()) for output in self.outputs if not output.queue.empty()]
+            if drains:
+                await asyncio.wait(drains, timeout=self.drain_timeout)
+                for drain in drains:
+                    drain.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            # The executor threads finish their current frame read/processing before the source and stage are closed
+            await loop.run_in_executor(None, capture_executor.shutdown, True)
+            await loop.run_in_executor(None, detect_executor.shutdown, True)
+            self.source.stop()
+            self.stage.close()
+            for output in self.outputs:
+                await output.close()
+            if self.metrics is not None:
+                self.metrics.close()
+            for sig in handled:
+                loop.remove_signal_handler(sig)
+
+        # Errors of the processing loop, the outputs or the services are raised once everything is shut down
+        for task in [processing, *tasks]:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    def summary(self):
+        drops = ", ".join(f"{output.name} {output.dropped}" for output in self.outputs)
+        return f"Runtime: {self.frames} frames, {self.results} results" + (f", dropped by the outputs: {drops}" if drops else "")
+
+
+def add_runtime_arguments(arg):
+    """Add the command line arguments of the runtime to an argparse.ArgumentParser."""
+    arg.add_argument("--control-port", type=int, default=None,
+                     help="local TCP port of the control service ('status' health report, 'quit')")
+    arg.add_argument("--drain-timeout", type=float, default=1.0, help="seconds the outputs get to catch up on shutdown")
+
+
+def create_services(args):
+    """Build the services selected by the arguments of add_runtime_arguments."""
+    return [ControlServer(args["control_port"])] if args["control_port"] is not None else []
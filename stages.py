@@ -0,0 +1,174 @@
+"""
+This script contains the processing stages run by the asyncio runtime (see 'runtime.py') - the CPU-bound part of the
+detection path, between the capture and the outputs.
+
+A stage's process(frame, start) runs on the detection executor thread of the runtime, one frame at a time and in capture
+order, and returns the list of Results to fan out to the outputs (usually one, none or several with --workers as the pool
+emits the frames it has finished). At the end of the stream, flush() returns the Results of the frames still in flight.
+The arrays of a Result are owned by it - outputs consume them after the stage has moved on to the next frames.
+    - DetectionStage : Detection only, for 'aruco_detector_video.py'
+    - PoseStage      : Detection, pose, board pose and pose filter, optionally in a detection pool, for 'pose_estimation.py'
+
+Created by: Jalen
+"""
+
+# Standard Imports
+from collections import namedtuple
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from frame_source import to_gray
+from pose_batch import POSE_DTYPE, compute_poses
+
+
+# Output of a stage for one frame - poses is a POSE_DTYPE array (None without pose estimation), rejected the rejected
+# candidates of the detection (None if unknown)
+Result = namedtuple("Result", ["seq", "timestamp", "image", "corners", "ids", "poses", "rejected"])
+
+
+class DetectionStage:
+    """
+    Marker detection of every frame.
+
+    Arguments:
+        detect      : Detection function of create_detector (see 'aruco_detector.py')
+        source      : Frame source, for its drop count
+        metrics     : PipelineMetrics with the stages color and detect (see 'instrumentation.py')
+    """
+
+    def __init__(self, detect, source, metrics):
+        self.detect = detect
+        self.source = source
+        self.metrics = metrics
+
+    def process(self, frame, start):
+        t = start
+        gray_frame = to_gray(frame.image)
+        t = self.metrics.lap("color", t)
+        corners, ids, rejected = self.detect(gray_frame)
+        self.metrics.lap("detect", t)
+        self.metrics.frame_done(dropped=self.source.dropped)
+        return [Result(frame.seq, frame.timestamp, frame.image, corners, ids, None, rejected)]
+
+    def flush(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class PoseStage:
+    """
+    Marker detection and pose estimation of every frame.
+
+    Arguments:
+        detect              : Detection function of create_detector (see 'aruco_detector.py')
+        camMatrix, distCof  : Camera calibration
+        marker_size         : Marker side length, in the unit of the translation vectors
+        source              : Frame source, for its drop count
+        metrics             : PipelineMetrics with the stages color, detect and pose (see 'instrumentation.py')
+        pool                : Started DetectionPool - detection and single-marker pose then run in its workers
+        board               : BoardPoseEngine fusing the markers into one pose per frame (see 'board_pose.py')
+        pose_filter         : PoseFilter predicting the poses between detections (see 'pose_filter.py')
+        max_markers         : Room of the reused pose buffer
+    """
+
+    def __init__(self, detect, camMatrix, distCof, marker_size, source, metrics, pool=None, board=None, pose_filter=None,
+                 max_markers=64):
+        if pool is not None and pose_filter is not None:
+            raise ValueError("The pose filter skips the detection of predictable frames and cannot be used with a pool")
+        self.detect = detect
+        self.camMatrix = camMatrix
+        self.distCof = distCof
+        self.marker_size = marker_size
+        self.source = source
+        self.metrics = metrics
+        self.pool = pool
+        self.board = board
+        self.pose_filter = pose_filter
+        self._pose_buffer = np.empty(max_markers, dtype=POSE_DTYPE)
+        self._pool_images = {}  # Frame sequence number -> colour image, for the frames being processed by the pool
+
+    def _detections(self, frame, t):
+        """Detections of the frames to output: the current frame, or with a pool the frames it has finished in capture order."""
+        if self.pool is None:
+            # With the filter, the detection of the current frame is skipped while it can predict the poses
+            detected = self.pose_filter is None or self.pose_filter.needs_detection(frame.timestamp)
+            corners, ids, rVec, tVec = (), None, None, None
+            if detected:
+                gray_frame = to_gray(frame.image)
+                t = self.metrics.lap("color", t)
+                (corners, ids, rejected) = self.detect(gray_frame)
+                if corners and self.board is None:
+                    rVec, tVec, _ = cv2.aruco.estimatePoseSingleMarkers(
+                        corners=corners, markerLength=self.marker_size, cameraMatrix=self.camMatrix, distCoeffs=self.distCof
+                    )
+            return [(frame.image, frame.seq, frame.timestamp, detected, corners, ids, rVec, tVec)], t
+
+        gray_frame = to_gray(frame.image)
+        t = self.metrics.lap("color", t)
+        if self.pool.submit(frame.seq, frame.timestamp, gray_frame):
+            self._pool_images[frame.seq] = frame.image
+        return self._pool_detections(self.pool.results()), t
+
+    def _pool_detections(self, pool_results):
+        """Detections of the results emitted by the pool, with the images of their frames."""
+        detections = []
+        for result in pool_results:
+            # Forget the images of frames the pool skipped as stale
+            while next(iter(self._pool_images)) < result.seq:
+                self._pool_images.pop(next(iter(self._pool_images)))
+            detections.append((self._pool_images.pop(result.seq), result.seq, result.timestamp, True, result.corners,
+                               result.ids, result.rVec, result.tVec))
+        return detections
+
+    def process(self, frame, start):
+        detections, t = self._detections(frame, start)
+        t = self.metrics.lap("detect", t)
+        results = self._results(detections, t)
+
+        dropped = self.source.dropped
+        if self.pool is not None:
+            dropped += self.pool.dropped_full + self.pool.dropped_stale
+        self.metrics.frame_done(dropped=dropped)
+        return results
+
+    def flush(self):
+        """Results of the frames still in flight in the pool at the end of the stream, in capture order."""
+        if self.pool is None:
+            return []
+        return self._results(self._pool_detections(self.pool.drain()), self.metrics.now())
+
+    def _results(self, detections, t):
+        """Poses of the detections - board pose, per-marker poses and pose filter."""
+        results = []
+        for image, seq, timestamp, detected, corners, ids, rVec, tVec in detections:
+            poses = None
+            if self.board is not None and detected:
+                # One pose of the whole board, from a single warm-started solvePnP over the corners of all its markers
+                poses = self.board.poses(corners, ids, out=self._pose_buffer)
+            elif corners:
+                # Post-process the poses of all markers in one vectorized pass (see 'pose_batch.py')
+                poses = compute_poses(ids, corners, rVec, tVec, self.camMatrix, out=self._pose_buffer)
+            elif detected:
+                poses = self._pose_buffer[:0]
+
+            # Filtered poses, predicted for the markers that were not measured on this frame
+            if self.pose_filter is not None:
+                poses = self.pose_filter.step(timestamp, poses if detected else None)
+
+            if poses is not None:
+                # The pose buffers are reused by the next frame, while the outputs may still hold this result
+                poses = np.array(poses)
+                if len(poses) > 0:
+                    self.metrics.pose_ready(timestamp)
+            results.append(Result(seq, timestamp, image, corners, ids, poses, None))
+            t = self.metrics.lap("pose", t)
+        return results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
@@ -0,0 +1,295 @@
+"""
+This script streams the pose of every detected marker of every frame as compact binary telemetry, e.g. for the flight
+controller bridge.
+
+Record layout (little-endian, packed, 92 bytes - RECORD_FORMAT for struct, TELEMETRY_DTYPE for NumPy):
+    - magic         : uint16, 0xA7C0 - marks the start of a record
+    - version       : uint8, layout version (2)
+    - flags         : uint8, FLAG_PREDICTED if the pose was predicted by the pose filter instead of measured
+    - seq           : uint32, frame sequence number
+    - timestamp     : float64, capture time of the frame [s, time.monotonic() of the capturing machine]
+    - id            : int32, marker ID
+    - tvec          : 3 x float64, translation vector (x, y, z) [mm]
+    - rvec          : 3 x float64, rotation vector (Rodrigues) [rad]
+    - polar         : 3 x float64, R [mm], theta [rad], phi [rad] (see 'pose_batch.py')
+
+All the records of a frame are sent as one datagram over a local UDP or Unix-domain datagram socket, and can be appended to a
+rotating binary log file. The records are filled in a preallocated NumPy buffer, so publishing allocates nothing per record.
+A frame without markers produces no datagram.
+
+Stand-in subscriber, to test the stream on any Linux machine:
+    python telemetry.py --udp 9871
+    python telemetry.py --unix /tmp/aruco_pose.sock
+    python telemetry.py --log pose_telemetry.bin
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import argparse
+import os
+import socket
+import struct
+import time
+from pathlib import Path
+
+# Third-Party Imports
+import numpy as np
+
+
+MAGIC = 0xA7C0
+VERSION = 2
+FLAG_PREDICTED = 0x01
+RECORD_FORMAT = "<HBBIdi3d3d3d"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+TELEMETRY_DTYPE = np.dtype([
+    ("magic", "<u2"),
+    ("version", "u1"),
+    ("flags", "u1"),
+    ("seq", "<u4"),
+    ("timestamp", "<f8"),
+    ("id", "<i4"),
+    ("tvec", "<f8", (3,)),
+    ("rvec", "<f8", (3,)),
+    ("polar", "<f8", (3,)),
+])
+assert TELEMETRY_DTYPE.itemsize == RECORD_SIZE
+
+
+# LOG FILE -------------------------------------------------------------------------------------------------------------
+class RotatingLog:
+    """
+    Binary log file that is rotated once it exceeds max_bytes: path -> path.1 -> ... -> path.<backups>, the oldest being
+    deleted. Frames are never split across two files.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backups=5):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def write(self, data):
+        if self.max_bytes and self._size and self._size + len(data) > self.max_bytes:
+            self.rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{index}")
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backups:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, "ab")
+        self._size = 0
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# PUBLISHER ------------------------------------------------------------------------------------------------------------
+class TelemetryPublisher:
+    """
+    Publishes the poses of every frame as binary records.
+
+    Arguments:
+        udp_port        : Local UDP port to send the records to
+        unix_path       : Path of a Unix-domain datagram socket to send the records to
+        log_path        : Optional binary log file the records are appended to
+        log_max_bytes   : Size at which the log file is rotated (0 never rotates)
+        log_backups     : Number of rotated log files kept
+        max_markers     : Room of the preallocated record buffer - poses beyond it are not published
+        host            : Host of the UDP subscriber
+    """
+
+    def __init__(self, udp_port=None, unix_path=None, log_path=None, log_max_bytes=64 * 1024 * 1024, log_backups=5,
+                 max_markers=64, host="127.0.0.1"):
+        self._records = np.zeros(max_markers, dtype=TELEMETRY_DTYPE)
+        self._records["magic"] = MAGIC
+        self._records["version"] = VERSION
+        self._bytes = self._records.view(np.uint8)
+
+        self._socket = None
+        self._address = None
+        if udp_port is not None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._address = (host, udp_port)
+        elif unix_path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._address = str(unix_path)
+        if self._socket is not None:
+            self._socket.setblocking(False)  # Never stall the detection loop on a slow subscriber
+        self._log = RotatingLog(log_path, log_max_bytes, log_backups) if log_path is not None else None
+
+        self.records = 0        # Records published
+        self.send_errors = 0    # Datagrams not delivered (no subscriber, socket buffer full)
+
+    def publish(self, seq, timestamp, poses):
+        """Publish the poses (POSE_DTYPE array) of one frame. Returns the number of records."""
+        count = min(len(poses), len(self._records))
+        if count == 0:
+            return 0
+        records = self._records[:count]
+        records["seq"] = seq
+        records["timestamp"] = timestamp
+        records["id"] = poses["id"][:count]
+        records["flags"] = np.where(poses["predicted"][:count], FLAG_PREDICTED, 0)
+        records["tvec"] = poses["tvec"][:count]
+        records["rvec"] = poses["rvec"][:count]
+        records["polar"][:, 0] = poses["R"][:count]
+        records["polar"][:, 1] = poses["theta"][:count]
+        records["polar"][:, 2] = poses["phi"][:count]
+
+        data = self._bytes[:count * RECORD_SIZE]
+        if self._socket is not None:
+            try:
+                self._socket.sendto(data, self._address)
+            except OSError:
+                self.send_errors += 1
+        if self._log is not None:
+            self._log.write(data)
+        self.records += count
+        return count
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+        if self._log is not None:
+            self._log.close()
+
+
+def add_telemetry_arguments(arg):
+    """Add the command line arguments of the telemetry to an argparse.ArgumentParser."""
+    arg.add_argument("--telemetry-udp", type=int, default=None, help="local UDP port the pose telemetry is sent to")
+    arg.add_argument("--telemetry-unix", type=str, default=None, help="Unix-domain datagram socket the pose telemetry is sent to")
+    arg.add_argument("--telemetry-log", type=str, default=None, help="binary log file the pose telemetry is appended to")
+    arg.add_argument("--telemetry-log-mb", type=float, default=64, help="size [MB] at which the telemetry log is rotated")
+
+
+def create_telemetry(args):
+    """Build the TelemetryPublisher selected by the arguments of add_telemetry_arguments, or None if none is selected."""
+    if args["telemetry_udp"] is None and args["telemetry_unix"] is None and args["telemetry_log"] is None:
+        return None
+    return TelemetryPublisher(udp_port=args["telemetry_udp"], unix_path=args["telemetry_unix"],
+                              log_path=args["telemetry_log"], log_max_bytes=int(args["telemetry_log_mb"] * 1024 * 1024))
+
+
+# READER ---------------------------------------------------------------------------------------------------------------
+def decode(data):
+    """Records (TELEMETRY_DTYPE array, a view into data) of a datagram or log file content."""
+    if len(data) % RECORD_SIZE:
+        raise ValueError(f"Telemetry data of {len(data)} bytes is not a whole number of {RECORD_SIZE}-byte records")
+    records = np.frombuffer(data, dtype=TELEMETRY_DTYPE)
+    if len(records) and (np.any(records["magic"] != MAGIC) or np.any(records["version"] != VERSION)):
+        raise ValueError("Telemetry data has an unknown record magic or version")
+    return records
+
+
+def read_log(path):
+    """All records of a telemetry log file, memory-mapped."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return np.empty(0, dtype=TELEMETRY_DTYPE)
+    return decode(np.memmap(path, dtype=np.uint8, mode="r", shape=(size - size % RECORD_SIZE,)))
+
+
+class TelemetrySubscriber:
+    """
+    Receives the telemetry datagrams of a TelemetryPublisher.
+
+    Arguments:
+        udp_port        : Local UDP port to listen on
+        unix_path       : Path of the Unix-domain datagram socket to bind (replaced if it exists)
+        max_markers     : Largest number of records per datagram
+    """
+
+    def __init__(self, udp_port=None, unix_path=None, max_markers=64, host="127.0.0.1"):
+        self._buffer = bytearray(max_markers * RECORD_SIZE)
+        self._unix_path = None
+        if udp_port is not None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.bind((host, udp_port))
+        elif unix_path is not None:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.bind(str(unix_path))
+            self._unix_path = unix_path
+        else:
+            raise ValueError("A UDP port or a Unix socket path is required")
+
+    def receive(self, timeout=None):
+        """
+        Records of the next datagram, or None on timeout. The records are a view into a buffer reused by the next call -
+        copy them to keep them.
+        """
+        self._socket.settimeout(timeout)
+        try:
+            size = self._socket.recv_into(self._buffer)
+        except socket.timeout:
+            return None
+        return decode(memoryview(self._buffer)[:size])
+
+    def __iter__(self):
+        while True:
+            records = self.receive()
+            if records is not None:
+                yield records
+
+    def close(self):
+        self._socket.close()
+        if self._unix_path is not None and os.path.exists(self._unix_path):
+            os.unlink(self._unix_path)
+
+
+def format_records(records):
+    lines = []
+    for record in records:
+        R, theta, phi = record["polar"]
+        predicted = " (predicted)" if record["flags"] & FLAG_PREDICTED else ""
+        lines.append(f"seq={record['seq']} t={record['timestamp']:.3f} id={record['id']}{predicted} tvec={record['tvec']} "
+                     f"rvec={record['rvec']} R={R:.1f} theta={np.degrees(theta):.1f} phi={np.degrees(phi):.1f}")
+    return "\n".join(lines)
+
+
+# STAND-IN SUBSCRIBER --------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    arg = argparse.ArgumentParser()
+    arg.add_argument("--udp", type=int, default=None, help="local UDP port to listen on")
+    arg.add_argument("--unix", type=str, default=None, help="Unix-domain datagram socket to listen on")
+    arg.add_argument("--log", type=str, default=None, help="telemetry log file to print instead of listening")
+    arg.add_argument("-q", "--quiet", action="store_true", help="only print the record rate and latency every second")
+    args = vars(arg.parse_args())  # Convert argument to dictionary
+
+    if args["log"] is not None:
+        records = read_log(args["log"])
+        print(format_records(records))
+        print(f"{len(records)} records, {len(np.unique(records['seq']))} frames")
+    else:
+        subscriber = TelemetrySubscriber(udp_port=args["udp"], unix_path=args["unix"])
+        count, window_start = 0, time.monotonic()
+        try:
+            for records in subscriber:
+                count += len(records)
+                if not args["quiet"]:
+                    print(format_records(records))
+                now = time.monotonic()
+                if now - window_start >= 1.0:
+                    # The capture timestamps are time.monotonic() - the latency is only meaningful on the same machine
+                    latency = (now - records["timestamp"][-1]) * 1e3
+                    print(f"[telemetry] {count / (now - window_start):.0f} records/s, latency {latency:.1f} ms")
+                    count, window_start = 0, now
+        except KeyboardInterrupt:
+            pass
+        finally:
+            subscriber.close()
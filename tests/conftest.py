@@ -0,0 +1,8 @@
+# Standard Imports
+import sys
+from pathlib import Path
+
+# The modules live in the project root and in camera_calibration_final, not in a package
+ROOT = Path(__file__).parent.absolute().parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "camera_calibration_final"))
@@ -0,0 +1,170 @@
+# Standard Imports
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Third-Party Imports
+import numpy as np
+import pytest
+
+# Project-Specific Imports
+from frame_bus import FrameBus, FrameBusSource, publish_source
+from frame_source import SyntheticSource
+
+
+ROOT = Path(__file__).parent.absolute().parent
+SHAPE = (48, 64, 3)
+
+
+@pytest.fixture
+def bus_name():
+    return f"test_frame_bus_{os.getpid()}_{time.monotonic_ns()}"
+
+
+def _fill(value):
+    return np.full(SHAPE, value % 251, dtype=np.uint8)
+
+
+def test_slot_reuse_skips_held_frames(bus_name):
+    with FrameBus.create(bus_name, shape=SHAPE, slots=2, max_readers=2, lease_timeout=60.0) as bus:
+        reader = bus.reader()
+        bus.publish(_fill(0), 0.0)
+        held = reader.read(timeout=0)
+        assert held.seq == 0
+
+        # Only the other slot is free, so the held frame survives any number of frames
+        for seq in range(1, 6):
+            bus.publish(_fill(seq), float(seq))
+        assert reader.valid(held)
+        assert np.all(held.image == 0)
+        assert bus.reclaimed == 0
+
+        # Once released, its slot is reused
+        reader.release()
+        bus.publish(_fill(6), 6.0)
+        assert not reader.valid(held)
+        reader.close()
+
+
+def test_reclaimed_slot_invalidates_frame(bus_name):
+    with FrameBus.create(bus_name, shape=SHAPE, slots=2, max_readers=2, lease_timeout=0.0) as bus:
+        reader = bus.reader()
+        bus.publish(_fill(0), 0.0)
+        held = reader.read(timeout=0)
+        bus.publish(_fill(1), 1.0)
+        bus.publish(_fill(2), 2.0)  # The hold has expired - the slot of frame 0 is overwritten
+        assert not reader.valid(held)
+        reader.close()
+
+
+def test_reader_skips_slot_taken_by_writer(bus_name):
+    with FrameBus.create(bus_name, shape=SHAPE, slots=4, max_readers=2) as bus:
+        reader = bus.reader()
+        bus.publish(_fill(0), 0.0)
+        slot, view = bus.acquire()  # Being written - not visible to readers until committed
+        assert reader.read(timeout=0).seq == 0
+        assert reader.read(timeout=0) is None
+        view[:] = 1
+        bus.commit(slot, 1.0)
+        assert reader.read(timeout=0).seq == 1
+        reader.close()
+
+
+def test_writer_gives_back_slot_held_during_acquire(bus_name):
+    with FrameBus.create(bus_name, shape=SHAPE, slots=2, max_readers=2, lease_timeout=60.0) as bus:
+        reader = bus.reader()
+        bus.publish(_fill(0), 0.0)
+        bus.publish(_fill(1), 1.0)
+
+        # The reader sets its hold on frame 0 right after the writer has looked at the holds, before it takes the slot
+        frames = []
+        held = bus._held
+
+        def racing_held():
+            holds = held()
+            if not frames:
+                frames.append(reader.read(timeout=0))
+            return holds
+
+        bus._held = racing_held
+        slot, view = bus.acquire()
+        view[:] = 2
+        bus.commit(slot, 2.0)
+
+        frame = frames[0]
+        assert frame.seq == 0
+        assert reader.valid(frame)
+        assert np.all(frame.image == 0)
+        reader.close()
+
+
+def test_publish_source_captures_into_slots(bus_name):
+    with FrameBus.create(bus_name, shape=SHAPE, slots=8, max_readers=2) as bus:
+        reader = bus.reader()
+        source = SyntheticSource(resolution=(SHAPE[1], SHAPE[0]), marker_pixels=24, num_frames=5)
+        publish_source(source, bus)
+        assert bus.latest == 4
+        frames = [reader.read(timeout=0) for _ in range(5)]
+        assert [frame.seq for frame in frames] == [0, 1, 2, 3, 4]
+        assert all(frame.image.shape == SHAPE for frame in frames)
+        reader.close()
+
+
+# Writer process - captures frames straight into the slots, each frame filled with its sequence number. It runs in an
+# interpreter of its own, like the capture process of 'frame_bus.py'
+HAMMER_WRITER = """
+import sys, time
+from frame_bus import FrameBus
+name, lease_timeout, frames = sys.argv[1], float(sys.argv[2]), int(sys.argv[3])
+with FrameBus.create(name, shape=(240, 320, 3), slots=3, max_readers=2, lease_timeout=lease_timeout) as bus:
+    while not bus.reader_pid.any():
+        time.sleep(0.001)
+    for seq in range(frames):
+        slot, view = bus.acquire()
+        view[:] = seq % 251
+        bus.commit(slot, time.monotonic())
+    print(bus.reclaimed)
+"""
+
+
+@pytest.mark.parametrize("lease_timeout", [60.0, 0.0])
+def test_no_torn_frames_between_processes(bus_name, lease_timeout):
+    # With a long lease the writer never takes a held slot, so every frame read must be valid. Without a lease it reclaims
+    # slots all the time, and valid() must catch every frame it overwrote while the reader was using it
+    writer = subprocess.Popen([sys.executable, "-c", HAMMER_WRITER, bus_name, str(lease_timeout), "20000"], cwd=ROOT,
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        source = FrameBusSource(bus_name, attach_timeout=30.0).start()
+        reader = source._reader
+        checked = torn = 0
+        while True:
+            # Zero-copy view, validated after use - the sleep lets the writer run in the meantime, even on a single core
+            frame = reader.read(timeout=5.0)
+            if frame is None:
+                break
+            time.sleep(0.0005)
+            uniform = frame.image.min() == frame.image.max() == frame.seq % 251
+            if reader.valid(frame):
+                assert uniform, f"Torn frame {frame.seq}"
+                checked += 1
+            else:
+                torn += 1
+
+            # Copy of FrameBusSource, which discards the frames that were overwritten during the copy
+            frame = source.read(timeout=5.0)
+            if frame is None:
+                break
+            assert frame.image.min() == frame.image.max() == frame.seq % 251, f"Torn copy of frame {frame.seq}"
+            checked += 1
+        source.stop()
+        reclaimed = int(writer.communicate(timeout=30.0)[0])
+    finally:
+        writer.kill()
+    assert writer.returncode == 0
+    assert checked > 0
+    if lease_timeout > 0:
+        assert reclaimed == 0 and torn == 0
+    else:
+        assert torn > 0
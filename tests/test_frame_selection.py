@@ -0,0 +1,116 @@
+# Third-Party Imports
+import cv2
+import numpy as np
+import pytest
+
+# Project-Specific Imports
+from board_pose import grid_layout
+from frame_selection import (FrameSelection, ViewFeatures, approximate_camera_matrix, find_duplicates, reprojection_error,
+                             select_views, split_views, view_features)
+
+
+IMAGE_SIZE = (1280, 720)
+CAM_MATRIX = approximate_camera_matrix(IMAGE_SIZE)
+CENTRED = (-77.5, -97.5, 500.0)     # Translation of the 155 x 195 mm grid board that centres it in the image
+
+
+@pytest.fixture(scope="module")
+def layout():
+    return grid_layout()
+
+
+def _view(layout, rvec, tvec, markers=None):
+    """Synthetic detections (corners (N, 1, 4, 2), ids (N, 1)) - the board markers projected with the camera matrix."""
+    ids = np.array(sorted(layout) if markers is None else markers)
+    objPoints = np.concatenate([layout[markerID] for markerID in ids])
+    imgPoints, _ = cv2.projectPoints(objPoints, np.radians(rvec), np.asarray(tvec, dtype=np.float64), CAM_MATRIX, None)
+    return imgPoints.reshape((-1, 1, 4, 2)).astype(np.float32), ids.reshape((-1, 1)).astype(np.int32)
+
+
+def _stack(views):
+    """Views in the stacked format of extract_markers."""
+    return (np.concatenate([corners for corners, _ in views]), np.concatenate([ids for _, ids in views]),
+            np.array([len(ids) for _, ids in views], dtype=np.int32))
+
+
+def _features(markers, cells, pose_bin, normal=(0.0, 0.0, -1.0), centroid=(0.5, 0.5), area=0.2):
+    grid = np.zeros(48, dtype=bool)
+    grid[list(cells)] = True
+    return ViewFeatures(markers, grid, pose_bin, None if normal is None else np.asarray(normal), np.asarray(centroid), area)
+
+
+def test_split_views(layout):
+    views = [_view(layout, (0, 0, 0), CENTRED, markers) for markers in ([0, 1], [2], [3, 4, 5])]
+    corners_list, id_list, counter = _stack(views)
+    for (corners, ids), (expected_corners, expected_ids) in zip(split_views(corners_list, id_list, counter), views):
+        np.testing.assert_array_equal(corners, expected_corners)
+        np.testing.assert_array_equal(ids, expected_ids)
+
+
+def test_view_features_pose_bins(layout):
+    frontal = view_features(*_view(layout, (0, 0, 0), CENTRED), layout, IMAGE_SIZE)
+    assert frontal.markers == 20 and frontal.pose_bin == (0, 0, 1)
+    np.testing.assert_allclose(frontal.normal, [0, 0, -1], atol=1e-3)
+    np.testing.assert_allclose(frontal.centroid, [0.5, 0.5], atol=0.01)
+
+    # 30° tilt -> third tilt bin, closer board -> larger area bin
+    tilted = view_features(*_view(layout, (0, 30, 0), CENTRED), layout, IMAGE_SIZE)
+    assert tilted.pose_bin[0] == 2 and np.degrees(np.arccos(-tilted.normal[2])) == pytest.approx(30.0, abs=0.1)
+    close = view_features(*_view(layout, (0, 0, 0), (-77.5, -97.5, 350.0)), layout, IMAGE_SIZE)
+    assert close.pose_bin[2] == 2 and close.cells.sum() > frontal.cells.sum()
+
+    # No marker of the layout - no pose
+    corners, ids = _view(layout, (0, 0, 0), CENTRED, [3])
+    unknown = view_features(corners, ids + 100, layout, IMAGE_SIZE)
+    assert unknown.markers == 1 and unknown.cells.any() and unknown.pose_bin is None and unknown.normal is None
+
+
+def test_near_duplicates_keep_the_view_with_most_markers(layout):
+    interior = [5, 6, 9, 10, 13, 14]
+    views = [_view(layout, (0, 0, 0), CENTRED, [i for i in range(20) if i not in interior[:2]]),
+             _view(layout, (0.5, 0, 0), CENTRED),
+             _view(layout, (0, 30, 0), CENTRED),
+             _view(layout, (0, 0, 0), (-300.0, -97.5, 900.0))]
+    features = [view_features(corners, ids, layout, IMAGE_SIZE) for corners, ids in views]
+    assert find_duplicates(features) == {0: 1}
+
+
+def test_selection_covers_all_cells_and_pose_bins():
+    features = [_features(20, range(0, 16), (0, 0, 1)),
+                _features(20, range(0, 16), (0, 0, 1), normal=(0.001, 0.0, -1.0)),       # Duplicate of the first
+                _features(20, range(8, 24), (2, 3, 1), normal=(0.5, 0.0, -0.866)),
+                _features(10, range(30, 34), (1, 5, 0), normal=(0.0, 0.3, -0.954), centroid=(0.2, 0.7)),
+                _features(20, range(0, 16), (0, 0, 1), centroid=(0.3, 0.5)),             # Adds nothing new
+                _features(2, range(44, 48), None, normal=None, centroid=(0.9, 0.9))]
+    selection = FrameSelection(features, 20, coverage_target=1.0, min_views=1)
+    assert selection.duplicates == {1: 0}
+    assert selection.selected == [0, 2, 3, 5]
+    assert selection.cell_coverage == 1.0 and selection.pose_coverage == 1.0
+    assert len(selection.gains) == 4 and selection.gains == sorted(selection.gains, reverse=True)
+    assert "Selected 4 of 6 images (1 near-duplicates dropped)" in selection.summary()
+
+    # The minimum number of views is filled up with the remaining views, the maximum cuts the coverage short
+    assert FrameSelection(features, 20, coverage_target=1.0, min_views=5).selected == [0, 2, 3, 4, 5]
+    limited = FrameSelection(features, 20, coverage_target=1.0, min_views=1, max_views=2)
+    assert len(limited.selected) == 2 and limited.cell_coverage < 1.0
+
+
+def test_select_views_subset_and_reprojection_error(layout):
+    views = [_view(layout, rvec, tvec) for rvec, tvec in (((0, 0, 0), CENTRED), ((0.5, 0, 0), CENTRED),
+                                                          ((0, 30, 0), CENTRED), ((-20, 0, 0), (-77.5, -97.5, 400.0)),
+                                                          ((0, 0, 0), (-300.0, -97.5, 900.0)))]
+    corners_list, id_list, counter = _stack(views)
+    selection = select_views(corners_list, id_list, counter, layout, IMAGE_SIZE, coverage_target=1.0, min_views=1)
+    assert selection.duplicates == {1: 0} and selection.selected == [0, 2, 3, 4]
+
+    corners, ids, subset_counter = selection.subset(corners_list, id_list, counter)
+    assert list(subset_counter) == [20, 20, 20, 20] and len(corners) == len(ids) == 80
+    np.testing.assert_array_equal(corners[20:40], views[2][0])
+
+    # The views were projected without distortion, so the true camera matrix reprojects them exactly
+    assert reprojection_error(corners_list, id_list, counter, layout, CAM_MATRIX, np.zeros(5)) < 1e-3
+    wrong = CAM_MATRIX.copy()
+    wrong[0, 2] += 20.0
+    assert reprojection_error(corners_list, id_list, counter, layout, wrong, np.zeros(5)) > 0.1
+    corners, ids = _view(layout, (0, 0, 0), CENTRED, [3])
+    assert np.isnan(reprojection_error(*_stack([(corners, ids + 100)]), layout, CAM_MATRIX, None))
@@ -0,0 +1,115 @@
+# Standard Imports
+import json
+import socket
+import time
+
+# Third-Party Imports
+import numpy as np
+import pytest
+
+# Project-Specific Imports
+from instrumentation import Histogram, PipelineMetrics
+
+
+def test_small_values_are_exact():
+    histogram = Histogram()
+    for value in range(16):
+        histogram.record(value)
+    assert [histogram.percentile(q) for q in (25, 50, 100)] == [3, 7, 15]
+
+
+@pytest.mark.parametrize("values", [
+    np.arange(1, 100001),                                               # Uniform
+    np.random.default_rng(0).lognormal(mean=13, sigma=1.0, size=20000),   # Long tail, around 0.5 ms
+])
+def test_percentiles_within_bucket_error(values):
+    histogram = Histogram()
+    for value in values.astype(np.int64):
+        histogram.record(int(value))
+    for q in (50, 95, 99):
+        expected = np.percentile(values, q)
+        assert abs(histogram.percentile(q) - expected) <= expected / histogram.sub_buckets
+    assert histogram.count == len(values)
+    assert histogram.max == int(values.max())
+    assert histogram.mean() == pytest.approx(values.astype(np.int64).mean())
+
+
+def test_percentile_never_exceeds_max():
+    histogram = Histogram()
+    histogram.record(1000)
+    assert histogram.percentile(99) == 1000
+
+
+def test_negative_and_overflowing_values():
+    histogram = Histogram(max_exponent=10)
+    histogram.record(-5)
+    histogram.record(1 << 40)
+    assert histogram.percentile(1) == 0
+    assert histogram.count == 2 and histogram.max == 1 << 40
+
+
+def test_reset_and_summary():
+    histogram = Histogram()
+    assert histogram.percentile(50) == 0 and histogram.mean() == 0
+    histogram.record(2_000_000)
+    summary = histogram.summary()
+    assert summary["count"] == 1 and summary["max_ms"] == 2.0
+    assert abs(summary["p50_ms"] - 2.0) <= 2.0 / histogram.sub_buckets
+    histogram.reset()
+    assert histogram.count == 0 and histogram.max == 0 and sum(histogram.counts) == 0
+
+
+def test_stages_latency_and_drops():
+    metrics = PipelineMetrics(("capture_wait", "detect"), interval=0, print_summary=False)
+    t = metrics.now()
+    t = metrics.lap("capture_wait", t)
+    metrics.lap("detect", t)
+    metrics.pose_ready(time.monotonic() - 0.01)
+    metrics.frame_done(dropped=3)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["frames"] == 1 and snapshot["dropped"] == 3
+    assert list(snapshot["stages"]) == ["capture_wait", "detect"]
+    assert all(stage["count"] == 1 for stage in snapshot["stages"].values())
+    assert snapshot["latency"]["count"] == 1 and snapshot["latency"]["p50_ms"] >= 10.0 * (1 - 1 / 16)
+    with pytest.raises(KeyError):
+        metrics.lap("display", t)
+
+
+def test_periodic_export(tmp_path):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(2.0)
+    metrics_file = tmp_path / "metrics.json"
+    metrics = PipelineMetrics(("detect",), interval=0.01, print_summary=False, metrics_file=metrics_file,
+                              udp_port=receiver.getsockname()[1])
+    try:
+        metrics.lap("detect", metrics.now())
+        time.sleep(0.02)
+        metrics.frame_done()
+
+        exported = json.loads(metrics_file.read_text())
+        assert exported["frames"] == 1 and exported["stages"]["detect"]["count"] == 1
+        assert json.loads(receiver.recv(65536)) == exported
+        assert not list(tmp_path.glob("*.tmp"))
+
+        # A new interval starts with empty histograms, unless the metrics are cumulative
+        assert metrics.histograms["detect"].count == 0
+    finally:
+        metrics.close()
+        receiver.close()
+
+
+def test_cumulative_metrics_keep_histograms():
+    metrics = PipelineMetrics(("detect",), interval=0, print_summary=False, cumulative=True)
+    metrics.lap("detect", metrics.now())
+    metrics.report()
+    assert metrics.histograms["detect"].count == 1
+
+
+def test_summary_line(capsys):
+    metrics = PipelineMetrics(("detect",), interval=0)
+    metrics.lap("detect", metrics.now() - 2_000_000)
+    metrics.report()
+    line = capsys.readouterr().out
+    assert line.startswith("[metrics] fps=") and "detect=2.0/2.0/2.0" in line
@@ -0,0 +1,99 @@
+# Third-Party Imports
+import cv2
+from cv2 import aruco
+import numpy as np
+import pytest
+
+# Project-Specific Imports
+from marker_extraction import DetectionCache, extract_markers, file_hash
+
+
+DICTIONARY_ID = aruco.DICT_6X6_50
+BOARD = {"size": (4, 5), "markerLength": 3.5, "markerSeparation": 0.5}
+
+
+@pytest.fixture
+def board():
+    return aruco.GridBoard_create(4, 5, 3.5, 0.5, aruco.getPredefinedDictionary(DICTIONARY_ID))
+
+
+@pytest.fixture
+def image_paths(board, tmp_path):
+    """Synthetic calibration images - the board drawn at a few scales and positions on a white background."""
+    paths = []
+    for index, (scale, x, y) in enumerate(((1.0, 20, 20), (0.8, 120, 60), (0.6, 40, 200))):
+        canvas = np.full((600, 800), 255, dtype=np.uint8)
+        drawing = board.draw((int(400 * scale), int(500 * scale)), marginSize=10)
+        canvas[y:y + drawing.shape[0], x:x + drawing.shape[1]] = drawing
+        path = tmp_path / f"{index}.png"
+        cv2.imwrite(str(path), canvas)
+        paths.append(path)
+    return paths
+
+
+def test_serial_extraction_keeps_opencv_threads(board, image_paths):
+    # The calibration that follows the extraction must keep all the threads of OpenCV
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(4)
+    try:
+        corners, ids, counter, image_size, used = extract_markers(image_paths, DICTIONARY_ID,
+                                                                  aruco.DetectorParameters_create(), board.ids, workers=1)
+        assert cv2.getNumThreads() == 4
+    finally:
+        cv2.setNumThreads(threads)
+    assert list(counter) == [20, 20, 20] and image_size == (800, 600) and len(used) == 3
+
+
+def test_pool_extraction_matches_serial(board, image_paths):
+    params = aruco.DetectorParameters_create()
+    serial = extract_markers(image_paths, DICTIONARY_ID, params, board.ids, workers=1)
+    pooled = extract_markers(image_paths, DICTIONARY_ID, params, board.ids, workers=2, max_in_flight=2)
+    for a, b in zip(serial[:3], pooled[:3]):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_rerun_is_served_from_the_cache(board, image_paths, tmp_path):
+    params = aruco.DetectorParameters_create()
+    cache = DetectionCache(tmp_path / "cache", DICTIONARY_ID, params, BOARD)
+    first = extract_markers(image_paths, DICTIONARY_ID, params, board.ids, workers=1, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 3)
+
+    cache = DetectionCache(tmp_path / "cache", DICTIONARY_ID, params, BOARD)
+    second = extract_markers(image_paths, DICTIONARY_ID, params, board.ids, workers=1, cache=cache)
+    assert (cache.hits, cache.misses) == (3, 0)
+    for a, b in zip(first[:3], second[:3]):
+        np.testing.assert_array_equal(a, b)
+    assert second[3:] == first[3:]
+
+
+def test_changed_and_unreadable_images_are_detected_again(board, image_paths, tmp_path):
+    params = aruco.DetectorParameters_create()
+    cache = DetectionCache(tmp_path / "cache", DICTIONARY_ID, params, BOARD)
+    extract_markers(image_paths, DICTIONARY_ID, params, board.ids, workers=1, cache=cache)
+
+    # The image without markers is cached too, the unreadable one is not
+    cv2.imwrite(str(image_paths[0]), np.full((600, 800), 255, dtype=np.uint8))
+    image_paths[1].write_bytes(b"not an image")
+    for _ in range(2):
+        cache.hits = cache.misses = 0
+        corners, ids, counter, image_size, used = extract_markers(image_paths, DICTIONARY_ID, params, board.ids,
+                                                                  workers=1, cache=cache)
+        assert list(counter) == [20] and used == [str(image_paths[2])]
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.load(file_hash(image_paths[1])) is None
+
+
+def test_new_configuration_invalidates_the_cache(board, image_paths, tmp_path):
+    params = aruco.DetectorParameters_create()
+    cache = DetectionCache(tmp_path / "cache", DICTIONARY_ID, params, BOARD)
+    extract_markers(image_paths, DICTIONARY_ID, params, board.ids, workers=1, cache=cache)
+    assert len(list(cache.directory.glob("*.npz"))) == 3
+
+    params.adaptiveThreshWinSizeMax = 31
+    changed = DetectionCache(tmp_path / "cache", DICTIONARY_ID, params, BOARD)
+    assert changed.fingerprint != cache.fingerprint
+    assert not cache.directory.exists() and list(changed.root.iterdir()) == [changed.directory]
+    assert changed.load(file_hash(image_paths[0])) is None
+
+    # The same configuration finds its entries again
+    assert DetectionCache(tmp_path / "cache", DICTIONARY_ID, params, BOARD).fingerprint == changed.fingerprint
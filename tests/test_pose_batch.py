@@ -0,0 +1,87 @@
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from pose_batch import BOARD_ID, POSE_DTYPE, compute_poses, euler_angles, format_poses, rotation_matrices
+
+
+CAM_MATRIX = np.array([[600.0, 0.0, 320.0], [0.0, 610.0, 240.0], [0.0, 0.0, 1.0]])
+
+
+def _axis_rotation(axis, angle):
+    c, s = np.cos(angle), np.sin(angle)
+    if axis == "x":
+        return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+    if axis == "y":
+        return np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+    return np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+
+
+def test_rotation_matrices_match_rodrigues():
+    rvecs = np.vstack([np.random.default_rng(0).uniform(-np.pi, np.pi, (20, 3)), np.zeros((1, 3))])
+    expected = np.stack([cv2.Rodrigues(rvec)[0] for rvec in rvecs])
+    np.testing.assert_allclose(rotation_matrices(rvecs), expected, atol=1e-12)
+
+
+def test_euler_angles_zyx():
+    angles = np.array([[0.3, -0.5, 1.2], [-1.0, 0.2, -2.5], [0.0, 0.0, 0.0]])
+    rotations = np.stack([_axis_rotation("z", yaw) @ _axis_rotation("y", pitch) @ _axis_rotation("x", roll)
+                          for roll, pitch, yaw in angles])
+    np.testing.assert_allclose(euler_angles(rotations), angles, atol=1e-12)
+
+
+def test_compute_poses_matches_per_marker_math():
+    rng = np.random.default_rng(1)
+    count = 5
+    ids = np.arange(count).reshape((count, 1)) + 20
+    tVec = rng.uniform([-200, -200, 100], [200, 200, 900], (count, 1, 3))
+    rVec = rng.uniform(-1, 1, (count, 1, 3))
+    corners = tuple(rng.uniform(0, 480, (1, 4, 2)).astype(np.float32) for _ in range(count))
+
+    poses = compute_poses(ids, corners, rVec, tVec, CAM_MATRIX)
+    assert poses.dtype == POSE_DTYPE and len(poses) == count
+    for pose, markerID, rvec, tvec, markerCorners in zip(poses, ids.flatten(), rVec, tVec, corners):
+        x, y, z = tvec[0]
+        R = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+        center = markerCorners.reshape((4, 2)).mean(axis=0)
+        assert pose["id"] == markerID and not pose["predicted"]
+        np.testing.assert_allclose(pose["tvec"], tvec[0])
+        np.testing.assert_allclose(pose["rvec"], rvec[0])
+        np.testing.assert_allclose([pose["R"], pose["theta"], pose["phi"]], [R, np.arctan2(y, x), np.arccos(z / R)])
+        np.testing.assert_allclose(pose["euler"], euler_angles(cv2.Rodrigues(rvec[0])[0][None])[0], atol=1e-12)
+        np.testing.assert_allclose(pose["center_offset"], [center[0] - 320.0, 240.0 - center[1]], atol=1e-4)
+
+
+def test_center_offset_without_corners_is_the_projection_of_tvec():
+    tVec = np.array([[[100.0, -50.0, 500.0]]])
+    poses = compute_poses(np.array([[7]]), None, np.zeros((1, 1, 3)), tVec, CAM_MATRIX)
+    projected, _ = cv2.projectPoints(tVec.reshape((1, 3)), np.zeros(3), np.zeros(3), CAM_MATRIX, None)
+    u, v = projected.reshape(2)
+    np.testing.assert_allclose(poses["center_offset"][0], [u - 320.0, 240.0 - v])
+
+
+def test_out_buffer_is_reused():
+    out = np.empty(8, dtype=POSE_DTYPE)
+    poses = compute_poses(np.array([[1], [2]]), None, np.zeros((2, 1, 3)), np.ones((2, 1, 3)), CAM_MATRIX, out=out)
+    assert len(poses) == 2 and np.shares_memory(poses, out)
+
+    # Too many markers for the buffer - a new array is returned
+    poses = compute_poses(np.arange(9).reshape((9, 1)), None, np.zeros((9, 1, 3)), np.ones((9, 1, 3)), CAM_MATRIX, out=out)
+    assert len(poses) == 9 and not np.shares_memory(poses, out)
+
+
+def test_no_markers_and_zero_distance():
+    assert len(compute_poses(None, None, None, None, CAM_MATRIX)) == 0
+    poses = compute_poses(np.array([[3]]), None, np.zeros((1, 1, 3)), np.zeros((1, 1, 3)), CAM_MATRIX)
+    assert poses["R"][0] == 0 and poses["phi"][0] == 0
+
+
+def test_format_poses():
+    poses = np.zeros(2, dtype=POSE_DTYPE)
+    poses["id"] = [25, BOARD_ID]
+    poses["predicted"] = [False, True]
+    text = format_poses(poses)
+    assert "Marker ID: 25\n" in text
+    assert "Board (predicted)" in text
+    assert text.count("-----------------------------") == 2
@@ -0,0 +1,151 @@
+# Standard Imports
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker
+from pathlib import Path
+
+# Third-Party Imports
+import numpy as np
+import pytest
+
+# Project-Specific Imports
+from pose_batch import POSE_DTYPE
+from pose_slot import SEQUENCE_FIELD, PoseQueryClient, PoseQueryServer, PoseSlot
+
+
+ROOT = Path(__file__).parent.absolute().parent
+
+@pytest.fixture
+def slot():
+    slot = PoseSlot.create(f"test_pose_slot_{os.getpid()}_{time.monotonic_ns()}", capacity=4)
+    yield slot
+    slot.close()
+
+
+def _poses(ids, value):
+    """POSE_DTYPE array of the markers, every field filled with value."""
+    poses = np.zeros(len(ids), dtype=POSE_DTYPE)
+    poses["id"] = ids
+    for name in ("tvec", "rvec", "R", "theta", "phi", "euler", "center_offset"):
+        poses[name] = value
+    return poses
+
+
+def test_markers_keep_their_last_pose(slot):
+    reader = slot.reader()
+    assert len(reader.read().poses) == 0
+
+    slot.publish(0, 10.0, _poses([25, 7], 1.0))
+    slot.publish(1, 11.0, _poses([7], 2.0))
+    snapshot = reader.read()
+    assert (snapshot.frame_seq, snapshot.frame_time) == (1, 11.0)
+    rows = {int(pose["id"]): pose for pose in snapshot.poses}
+    assert rows[25]["seq"] == 0 and rows[25]["timestamp"] == 10.0 and np.all(rows[25]["tvec"] == 1.0)
+    assert rows[7]["seq"] == 1 and rows[7]["timestamp"] == 11.0 and np.all(rows[7]["tvec"] == 2.0)
+
+    poses, age = reader.latest(25)
+    assert list(poses["id"]) == [25] and age[0] > 0
+
+
+def test_markers_beyond_capacity_are_counted(slot):
+    slot.publish(0, 0.0, _poses([1, 2, 3, 4, 5, 6], 1.0))
+    assert slot.overflow == 2
+    assert sorted(slot.reader().read().poses["id"]) == [1, 2, 3, 4]
+
+
+def test_wrong_dtype_is_rejected_before_the_update(slot):
+    with pytest.raises(TypeError):
+        slot.publish(0, 0.0, np.zeros(2, dtype=[("id", np.int32)]))
+    assert slot.header[SEQUENCE_FIELD] == 0
+    assert slot.reader().read().frame_seq == -1
+
+
+class _FailingTable(np.ndarray):
+    """Table whose timestamp column cannot be written - a publish failing half-way through the rows."""
+
+    def __getitem__(self, key):
+        if key == "timestamp":
+            raise RuntimeError("update failed")
+        return super().__getitem__(key)
+
+
+def test_failed_update_leaves_invalid_rows(slot):
+    reader = slot.reader()
+    slot.publish(0, 10.0, _poses([25, 7], 1.0))
+
+    table = slot.table
+    slot.table = table.view(_FailingTable)
+    with pytest.raises(RuntimeError):
+        slot.publish(1, 11.0, _poses([7, 3], 2.0))
+    slot.table = table
+
+    # Consistent again: the header still describes frame 0, and the half-written rows of markers 7 and 3 are left out
+    assert slot.header[SEQUENCE_FIELD] % 2 == 0
+    snapshot = reader.read()
+    assert snapshot.frame_seq == 0
+    assert list(snapshot.poses["id"]) == [25]
+    assert np.all(snapshot.poses["tvec"] == 1.0)
+
+    slot.publish(2, 12.0, _poses([3], 3.0))
+    assert sorted(reader.read().poses["id"]) == [3, 25]
+
+
+# Writer process - publishes frames whose every pose field is the frame sequence number. It runs in an interpreter of its
+# own, like the pose pipeline
+HAMMER_WRITER = """
+import sys
+import numpy as np
+from pose_batch import POSE_DTYPE
+from pose_slot import PoseSlot
+slot = PoseSlot.attach(sys.argv[1])
+for seq in range(int(sys.argv[2])):
+    poses = np.zeros(3, dtype=POSE_DTYPE)
+    poses["id"] = [1, 2, 3]
+    poses["tvec"] = poses["R"] = seq
+    slot.publish(seq, float(seq), poses)
+"""
+
+
+def test_reads_are_consistent_while_publishing(slot):
+    frames = 20000
+    reader = slot.reader()
+    writer = subprocess.Popen([sys.executable, "-c", HAMMER_WRITER, slot.shm.name, str(frames)], cwd=ROOT)
+    try:
+        reads = 0
+        while writer.poll() is None or reads == 0:
+            snapshot = reader.read()
+            assert snapshot is not None
+            for pose in snapshot.poses:
+                # Every field of a row comes from the same frame
+                assert np.all(pose["tvec"] == pose["seq"]) and pose["timestamp"] == pose["seq"] == pose["R"]
+                assert pose["seq"] <= snapshot.frame_seq
+            reads += 1
+        assert writer.wait(timeout=30.0) == 0
+    finally:
+        writer.kill()
+    assert reader.read().frame_seq == frames - 1
+
+
+def test_query_client(slot, tmp_path):
+    slot.publish(0, time.monotonic(), _poses([25, 7], 1.0))
+    path = str(tmp_path / "pose.sock")
+    with PoseQueryServer(path, slot.shm.name) as server:
+        # The server attached in the process that created the slot - give the block back to the resource tracker
+        resource_tracker.register(slot.shm._name, "shared_memory")
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            with PoseQueryClient(path) as client:
+                assert sorted(marker["id"] for marker in client.latest()) == [7, 25]
+                marker, = client.latest(25)
+                assert marker["tvec"] == [1.0, 1.0, 1.0] and marker["age_s"] >= 0
+                assert client.latest(99) == []
+                status = client.status()
+                assert status["frame_seq"] == 0 and status["markers"] == 2 and status["writer_running"]
+                assert "error" in client.request("orientation")
+                assert "error" in client.request("pose x")
+        finally:
+            server.shutdown()
@@ -0,0 +1,113 @@
+"""
+This script provides the undistortion of camera frames with cached remap tables.
+
+Instead of calling cv2.getOptimalNewCameraMatrix and cv2.undistort on every frame, the cv2.initUndistortRectifyMap tables are
+built once per (calibration, resolution, alpha) and applied with a single cv2.remap per frame. The tables are persisted as
+.npy files keyed by a hash of the calibration file, and memory-mapped on later runs so that startup is instant. The calibration
+itself is loaded through the compiled cache of 'calibration.py'.
+
+When only the marker corners are needed (e.g. for pose estimation), undistort_points() undistorts the detected corners instead
+of the whole image, which is far cheaper than remapping every pixel.
+
+Usage:
+    undistorter = Undistorter("camera_calibration_final/calibration.yaml", alpha=1)
+    undistorted_frame = undistorter.undistort(frame)
+    newCamMatrix = undistorter.new_camera_matrix(resolution)    # Use together with undistorter.zero_distortion
+
+Created by: Jalen
+"""
+
+# Standard Imports
+import os
+from pathlib import Path
+
+# Third-Party Imports
+import cv2
+import numpy as np
+
+# Project-Specific Imports
+from calibration import load_calibration
+
+
+def _save_npy(path, array):
+    """Write an .npy file atomically, so that a concurrent or interrupted run never sees a partial table."""
+    tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class Undistorter:
+    """
+    Undistort frames and points with remap tables cached in memory and on disk.
+
+    Arguments:
+        calibration_path    : Path to the calibration YAML file (camera_matrix, dist_coeff)
+        alpha               : Free scaling parameter of cv2.getOptimalNewCameraMatrix (0 = only valid pixels, 1 = all pixels)
+        cache_dir           : Directory of the persisted tables. Defaults to 'undistort_cache' next to the calibration file.
+    """
+
+    def __init__(self, calibration_path, alpha=1.0, cache_dir=None):
+        self.calibration_path = Path(calibration_path)
+        self.alpha = alpha
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else self.calibration_path.parent / "undistort_cache"
+        self.camMatrix, self.distCof, self.calibration_hash = load_calibration(self.calibration_path)
+        self.zero_distortion = np.zeros((1, 5), dtype=np.float64)
+        self._tables = {}   # (width, height) -> (map1, map2, newCamMatrix, roi)
+
+    def _key(self, resolution):
+        width, height = resolution
+        return f"{self.calibration_hash[:16]}_{width}x{height}_a{self.alpha:g}"
+
+    def _build(self, resolution):
+        newCamMatrix, roi = cv2.getOptimalNewCameraMatrix(self.camMatrix, self.distCof, resolution, self.alpha, resolution)
+        # CV_16SC2 gives the compact fixed-point representation that cv2.remap processes fastest
+        map1, map2 = cv2.initUndistortRectifyMap(self.camMatrix, self.distCof, None, newCamMatrix, resolution, cv2.CV_16SC2)
+        return map1, map2, newCamMatrix, np.array(roi, dtype=np.int32)
+
+    def tables(self, resolution):
+        """Return (map1, map2, newCamMatrix, roi) for the resolution (width, height), building them on first use."""
+        resolution = (int(resolution[0]), int(resolution[1]))
+        if resolution in self._tables:
+            return self._tables[resolution]
+
+        key = self._key(resolution)
+        paths = [self.cache_dir / f"{key}_{name}.npy" for name in ("map1", "map2", "camera_matrix", "roi")]
+        if all(path.exists() for path in paths):
+            # Copy-on-write memory maps: the pages are only read from disk when remap touches them
+            tables = tuple(np.load(path, mmap_mode="c") for path in paths)
+        else:
+            tables = self._build(resolution)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            for path, array in zip(paths, tables):
+                _save_npy(path, array)
+
+        map1, map2, newCamMatrix, roi = tables
+        self._tables[resolution] = (map1, map2, np.asarray(newCamMatrix), tuple(int(v) for v in roi))
+        return self._tables[resolution]
+
+    def new_camera_matrix(self, resolution):
+        """Camera matrix of the undistorted frames, to be used with zero distortion coefficients."""
+        return self.tables(resolution)[2]
+
+    def valid_roi(self, resolution):
+        """Region (x, y, w, h) of the undistorted frame that only contains valid pixels."""
+        return self.tables(resolution)[3]
+
+    def undistort(self, image):
+        """Undistort a full frame (grayscale or colour) with one remap."""
+        height, width = image.shape[:2]
+        map1, map2, _, _ = self.tables((width, height))
+        return cv2.remap(image, map1, map2, interpolation=cv2.INTER_LINEAR)
+
+    def undistort_points(self, corners, resolution):
+        """
+        Undistort detected marker corners (as returned by cv2.aruco.detectMarkers) into the pixel coordinates of the
+        undistorted frame, without touching the image itself.
+        """
+        if len(corners) == 0:
+            return corners
+        newCamMatrix = self.new_camera_matrix(resolution)
+        points = np.concatenate(corners).reshape((-1, 1, 2)).astype(np.float64)
+        points = cv2.undistortPoints(points, self.camMatrix, self.distCof, P=newCamMatrix)
+        return tuple(points.reshape((-1, 1, 4, 2)).astype(np.float32))